@@ -1,28 +1,38 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Response, Request
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.core import deps
-from app.core.security import get_password_hash, verify_password
+from app.core.security import PasswordHasherBusy, password_hasher
 from app.schemas.user import UserCreate, User
 from app.models.user import User as UserModel
 
 router = APIRouter()
 
 
+def hasher_busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Authentication is temporarily overloaded, please retry",
+        headers={"Retry-After": "1"},
+    )
+
+
 @router.post("/login")
 async def login(
     request: Request,
     username: str,
     password: str,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_db),
 ):
     """
     Performs login using username and password.
 
     Raises:
         HTTPException: 400 - Username or password is incorrect
+        HTTPException: 503 - Password hashing is overloaded
     """
 
-    user = db.query(UserModel).filter(UserModel.username == username).first()
+    user = await db.scalar(select(UserModel).where(UserModel.username == username))
     if not user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -30,7 +40,10 @@ async def login(
         )
     hashed_password = str(user.hashed_password)
 
-    is_valid_password = verify_password(password, hashed_password)
+    try:
+        is_valid_password = await password_hasher.verify(password, hashed_password)
+    except PasswordHasherBusy:
+        raise hasher_busy()
     if not is_valid_password:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -43,39 +56,42 @@ async def login(
 
 
 @router.post("/register", response_model=User)
-async def register(user_in: UserCreate, db: Session = Depends(deps.get_db)):
+async def register(user_in: UserCreate, db: AsyncSession = Depends(deps.get_db)):
     """
     Registers a new user with username, email, and password.
 
     Raises:
         HTTPException: 400 - Username or email already exists
+        HTTPException: 503 - Password hashing is overloaded
     """
 
     try:
-        existing_user = (
-            db.query(UserModel)
-            .filter(
+        existing_user = await db.scalar(
+            select(UserModel).where(
                 (UserModel.username == user_in.username)
                 | (UserModel.email == user_in.email)
             )
-            .first()
         )
         if existing_user:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Username or email already exists",
             )
-        hashed_password: str = get_password_hash(user_in.password)
+        hashed_password: str = await password_hasher.hash(user_in.password)
         user = UserModel(
             username=user_in.username,
             email=user_in.email,
             hashed_password=hashed_password,
         )
         db.add(user)
-        db.commit()
-        db.refresh(user)
+        await db.commit()
+        await db.refresh(user)
 
         return user
+    except PasswordHasherBusy:
+        raise hasher_busy()
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error during user registration: {e}")
         raise HTTPException(
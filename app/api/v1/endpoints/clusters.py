@@ -1,23 +1,43 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from datetime import datetime
+import numpy as np
+from fastapi import APIRouter, Body, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 from app.core import deps
-from app.schemas.cluster import Cluster
-from app.models.user import User
+from app.core.config import settings
+from app.core.placement import CapacityIndex, capacity_view
+from app.core.simulation import simulate
+from app.core.utilization import FIELDS, utilization_history
+from app.schemas.cluster import (
+    Cluster,
+    ClusterSummary,
+    ClusterUtilization,
+    OrganizationSummary,
+    SimulatedDeployments,
+    SimulationResult,
+    UtilizationSummary,
+    UtilizationTimeline,
+)
+from app.schemas.deployment import DeploymentCreate
+from app.core.principals import UserPrincipal
 from app.crud import (
     create_cluster as crud_create_cluster,
+    get_cluster_capacities,
+    get_cluster_organization_id,
+    get_cluster_summaries,
     get_clusters_by_organization,
+    get_organization_workload,
 )
 
 router = APIRouter()
 
 
 @router.post("/", response_model=Cluster)
-def create_cluster(
+async def create_cluster(
     *,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_db),
     cluster_in: Cluster,
-    current_user: User = Depends(deps.get_current_user)
+    current_user: UserPrincipal = Depends(deps.get_current_user),
 ):
     """
     Create a new cluster for the current user's organization.
@@ -36,22 +56,234 @@ def create_cluster(
         }
     )
 
-    return crud_create_cluster(db=db, cluster=updated_cluster_in)
+    cluster = await crud_create_cluster(db=db, cluster=updated_cluster_in)
+    capacity_view.invalidate(current_user.organization_id)
+
+    return cluster
 
 
 @router.get("/", response_model=List[Cluster])
-def list_clusters(
-    db: Session = Depends(deps.get_db),
-    current_user: User = Depends(deps.get_current_user),
+async def list_clusters(
+    db: AsyncSession = Depends(deps.get_db),
+    current_user: UserPrincipal = Depends(deps.get_current_user),
+    limit: int = Query(settings.PAGE_SIZE_DEFAULT, ge=1, le=settings.PAGE_SIZE_MAX),
+    after: Optional[int] = None,
 ):
     """
-    List all clusters belonging to the current user's organization.
+    List a page of clusters belonging to the current user's organization,
+    ordered by id. Pass the id of the last cluster received as `after` to
+    fetch the next page.
     """
     if not hasattr(current_user, "organization_id"):
         raise HTTPException(
             status_code=400, detail="User does not belong to any organization"
         )
 
-    return get_clusters_by_organization(
-        db=db, organization_id=current_user.organization_id
+    return await get_clusters_by_organization(
+        db=db, organization_id=current_user.organization_id, limit=limit, after=after
+    )
+
+
+@router.get("/summary", response_model=OrganizationSummary)
+async def summarize_clusters(
+    db: AsyncSession = Depends(deps.get_db),
+    current_user: UserPrincipal = Depends(deps.get_current_user),
+):
+    """
+    Summarize resource usage and deployment counts by status for each cluster
+    of the current user's organization, with organization-wide totals.
+
+    The counts are maintained incrementally on the cluster rows as
+    deployments are submitted, started and completed, so this reads one row
+    per cluster instead of aggregating over deployments.
+    """
+    if current_user.organization_id is None:
+        raise HTTPException(
+            status_code=400, detail="User does not belong to any organization"
+        )
+
+    summary = OrganizationSummary()
+    for cluster in await get_cluster_summaries(db, current_user.organization_id):
+        cluster_summary = ClusterSummary(
+            id=cluster.id,
+            name=cluster.name,
+            cpu_limit=cluster.cpu_limit,
+            ram_limit=cluster.ram_limit,
+            gpu_limit=cluster.gpu_limit,
+            cpu_used=cluster.cpu_limit - cluster.cpu_available,
+            ram_used=cluster.ram_limit - cluster.ram_available,
+            gpu_used=cluster.gpu_limit - cluster.gpu_available,
+            pending_count=cluster.pending_count,
+            running_count=cluster.running_count,
+            completed_count=cluster.completed_count,
+        )
+        for field in UtilizationSummary.model_fields:
+            setattr(
+                summary,
+                field,
+                getattr(summary, field) + getattr(cluster_summary, field),
+            )
+        summary.clusters.append(cluster_summary)
+
+    return summary
+
+
+def _timestamps(now: datetime, seconds: np.ndarray) -> List[Optional[datetime]]:
+    """
+    `now` plus each offset in seconds, or None for NaN offsets.
+    """
+    offsets = np.round(np.nan_to_num(seconds) * 1e6).astype("timedelta64[us]")
+    stamps = (np.datetime64(now, "us") + offsets).tolist()
+    never = np.isnan(seconds).tolist()
+    return [None if n else stamp for stamp, n in zip(stamps, never)]
+
+
+@router.post("/simulate", response_model=SimulationResult)
+async def simulate_deployments(
+    *,
+    db: AsyncSession = Depends(deps.get_db),
+    deployments_in: List[DeploymentCreate] = Body(
+        ..., max_length=settings.SIMULATION_MAX_DEPLOYMENTS
+    ),
+    points: int = Query(100, ge=2, le=settings.SIMULATION_MAX_POINTS),
+    current_user: UserPrincipal = Depends(deps.get_current_user),
+):
+    """
+    Project when a set of deployments would start and end if submitted now,
+    without creating them, and how the organization's resources would be in
+    use over time.
+
+    The projection starts from the clusters' free resources, lets RUNNING
+    deployments end after their `required_time` and queues PENDING ones
+    ahead of the proposed ones of the same priority. Items without a
+    `cluster_id` are placed as `POST /deployments/batch` would place them,
+    and within the same `settings.PLACEMENT_MAX_WORK` bound. Nothing is
+    written.
+
+    Returns:
+        The cluster, start, end, queue wait or error of each item, as columns
+        in submission order, and `points` evenly spaced samples of the
+        resources in use until the last projected end.
+
+    Raises:
+        HTTPException: 400 - User does not belong to any organization
+        HTTPException: 400 - Too many deployments to place
+    """
+    organization_id = current_user.organization_id
+    if organization_id is None:
+        raise HTTPException(
+            status_code=400, detail="User does not belong to any organization"
+        )
+
+    now = datetime.now()
+    index = CapacityIndex.from_rows(await get_cluster_capacities(db, organization_id))
+    unplaced = [
+        (d.cpu_required, d.ram_required, d.gpu_required)
+        for d in deployments_in
+        if d.cluster_id is None
+    ]
+    if index.placement_work(unplaced) > settings.PLACEMENT_MAX_WORK:
+        raise HTTPException(
+            status_code=400,
+            detail="Too many deployments to place; set `cluster_id` on some",
+        )
+    workload = await get_organization_workload(db, organization_id)
+    projection = simulate(index, workload, deployments_in, now, points)
+
+    starts = _timestamps(now, projection.starts)
+    errors: List[Optional[str]] = [None] * len(deployments_in)
+    for k, cluster_id in enumerate(projection.cluster_ids.tolist()):
+        if cluster_id < 0:
+            errors[k] = (
+                "Cluster not found"
+                if deployments_in[k].cluster_id is not None
+                else "No cluster in the organization can fit this deployment"
+            )
+        elif starts[k] is None:
+            errors[k] = "Deployment exceeds cluster resource limits"
+
+    never = np.isnan(projection.starts)
+    finished = projection.ends[~never]
+    cpu_limit, ram_limit, gpu_limit = projection.limits.tolist()
+    cpu_used, ram_used, gpu_used = projection.used.T.tolist()
+    return SimulationResult(
+        simulated_at=now,
+        finished_at=(
+            _timestamps(now, finished.max(keepdims=True))[0] if len(finished) else None
+        ),
+        cpu_limit=cpu_limit,
+        ram_limit=ram_limit,
+        gpu_limit=gpu_limit,
+        deployments=SimulatedDeployments(
+            cluster_id=[
+                None if cluster_id < 0 else cluster_id
+                for cluster_id in projection.cluster_ids.tolist()
+            ],
+            start_at=starts,
+            end_at=_timestamps(now, projection.ends),
+            queue_wait=np.where(never, None, projection.starts).tolist(),
+            error=errors,
+        ),
+        timeline=UtilizationTimeline(
+            at=_timestamps(now, projection.times),
+            cpu_used=cpu_used,
+            ram_used=ram_used,
+            gpu_used=gpu_used,
+        ),
+    )
+
+
+@router.get("/{cluster_id}/utilization", response_model=ClusterUtilization)
+async def get_cluster_utilization(
+    cluster_id: int,
+    db: AsyncSession = Depends(deps.get_db),
+    current_user: UserPrincipal = Depends(deps.get_current_user),
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    step: int = Query(60, ge=1),
+):
+    """
+    Read a cluster's used and available resources over time from the
+    utilization history, as means over `step`-second windows between `from`
+    (default: an hour before `to`) and `to` (default: now).
+
+    Recent history is read from the raw samples, older history from 1-minute
+    or 1-hour means; `step` is raised to the resolution that could be read.
+    A worker that does not sample reads the history the sampling process
+    shares under `UTILIZATION_HISTORY_PATH`.
+
+    Raises:
+        HTTPException: 503 - Utilization history is not enabled
+    """
+    organization_id = await get_cluster_organization_id(db, cluster_id)
+    if organization_id is None:
+        raise HTTPException(status_code=404, detail="Cluster not found")
+    if organization_id != current_user.organization_id:
+        raise HTTPException(
+            status_code=403,
+            detail="User does not have access to this organization's cluster",
+        )
+
+    # As epoch seconds, so naive (local) and aware bounds can be mixed
+    end_at = end.timestamp() if end else datetime.now().timestamp()
+    start_at = start.timestamp() if start else end_at - 3600
+    if start_at >= end_at:
+        raise HTTPException(status_code=400, detail="`from` must be before `to`")
+    if (end_at - start_at) / step > settings.UTILIZATION_MAX_POINTS:
+        raise HTTPException(
+            status_code=400, detail="Too many points requested; raise `step`"
+        )
+
+    history = utilization_history()
+    if history is None:
+        raise HTTPException(
+            status_code=503, detail="Utilization history is not enabled"
+        )
+    step, times, means = history.series(cluster_id, start_at, end_at, step)
+    columns = dict(zip(FIELDS, means.T.tolist()))
+    return ClusterUtilization(
+        cluster_id=cluster_id,
+        step=step,
+        at=[datetime.fromtimestamp(at) for at in times.tolist()],
+        **columns,
     )
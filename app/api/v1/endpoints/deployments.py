@@ -1,122 +1,552 @@
-from fastapi import APIRouter, Depends, HTTPException
-import redis
-from sqlalchemy.orm import Session
+import json
+import re
+import uuid
+from datetime import datetime
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
-from typing import List
+from typing import Dict, List, Optional
+from app import crud
 from app.core import deps
-from app.schemas.deployment import Deployment, DeploymentCreate
+from app.core.config import settings
+from app.core.placement import capacity_view
+from app.core.redis import (
+    cache_deployment,
+    index_deadlines,
+    latest_status_event_id,
+    queue_status_event,
+    read_status_events,
+    redis_client,
+    serialize_deployment,
+)
+from app.core.scheduler import scheduler
+from app.schemas.deployment import (
+    Deployment,
+    DeploymentBatchResult,
+    DeploymentCreate,
+)
 from app.models.deployment import Deployment as DeploymentModel, DeploymentStatus
-from app.models.user import User
+from app.core.principals import UserPrincipal
 from app.models.cluster import Cluster
 
-
 router = APIRouter()
-redis_client = redis.StrictRedis(
-    host="localhost", port=6379, db=0, decode_responses=True
-)
 
+# Redis stream entry id, as sent back by SSE clients in `Last-Event-ID`
+STREAM_ID = re.compile(r"\d+(-\d+)?")
 
-@router.post("/", response_model=Deployment)
-def create_deployment(
-    *,
-    db: Session = Depends(deps.get_db),
+# Adds deployment ids, as score and member pairs, to each of the given sorted
+# sets that already exists: the org's id index and, while one is being built,
+# its staging copy. A partially hydrated index is never mistaken for a
+# complete one, and a staging set that expired is not brought back.
+index_deployment = redis_client.register_script("""
+    local added = 0
+    for _, key in ipairs(KEYS) do
+        if redis.call("EXISTS", key) == 1 then
+            for i = 1, #ARGV, 2 do
+                added = added + redis.call("ZADD", key, ARGV[i], ARGV[i + 1])
+            end
+        end
+    end
+    return added
+    """)
+
+# Starts an index rebuild by creating the staging set around a token member,
+# unless another rebuild already holds it.
+begin_index_rebuild = redis_client.register_script("""
+    if redis.call("EXISTS", KEYS[1]) == 1 then
+        return 0
+    end
+    redis.call("ZADD", KEYS[1], "-inf", ARGV[1])
+    redis.call("EXPIRE", KEYS[1], ARGV[2])
+    return 1
+    """)
+
+# Publishes a finished rebuild as the org's id index, provided the staging set
+# is still the one this rebuild created.
+finish_index_rebuild = redis_client.register_script("""
+    if not redis.call("ZSCORE", KEYS[1], ARGV[1]) then
+        return 0
+    end
+    redis.call("ZREM", KEYS[1], ARGV[1])
+    if redis.call("EXISTS", KEYS[1]) == 0 then
+        return 0
+    end
+    redis.call("RENAME", KEYS[1], KEYS[2])
+    redis.call("EXPIRE", KEYS[2], ARGV[2])
+    return 1
+    """)
+
+# Caches a deployment read from the database unless a writer has cached a
+# newer state meanwhile.
+cache_if_missing = redis_client.register_script("""
+    if redis.call("EXISTS", KEYS[1]) == 1 then
+        return 0
+    end
+    redis.call("HSET", KEYS[1], unpack(ARGV, 2))
+    redis.call("EXPIRE", KEYS[1], ARGV[1])
+    return 1
+    """)
+
+
+def deployment_index_key(organization_id: int) -> str:
+    """
+    Sorted set of an organization's deployment ids, each scored by its id.
+    """
+    return f"org:{organization_id}:deployment_ids"
+
+
+def deployment_index_keys(organization_id: int) -> List[str]:
+    """
+    The org's id index and the staging set a rebuild fills before publishing.
+    """
+    index_key = deployment_index_key(organization_id)
+    return [index_key, f"{index_key}:staging"]
+
+
+async def rebuild_deployment_index(db: AsyncSession, organization_id: int) -> bool:
+    """
+    Rebuilds the org's id index from the database, `DEPLOYMENT_INDEX_CHUNK`
+    ids at a time, and publishes it with `DEPLOYMENT_CACHE_TTL`.
+
+    The ids are gathered in a staging set that is created before the first
+    read, so deployments committed while the rebuild runs are added to it by
+    `index_deployment` rather than lost. Only one rebuild per org runs at a
+    time; an abandoned one expires after `DEPLOYMENT_INDEX_REBUILD_TIMEOUT`.
+
+    Returns:
+        Whether this call published the index.
+    """
+    index_key, staging_key = deployment_index_keys(organization_id)
+    token = f"rebuild:{uuid.uuid4().hex}"
+    started = await begin_index_rebuild(
+        keys=[staging_key], args=[token, settings.DEPLOYMENT_INDEX_REBUILD_TIMEOUT]
+    )
+    if not started:
+        return False
+
+    after = None
+    while True:
+        ids = await crud.get_deployment_ids_by_organization(
+            db, organization_id, limit=settings.DEPLOYMENT_INDEX_CHUNK, after=after
+        )
+        if ids:
+            await index_deployment(
+                keys=[staging_key], args=[item for i in ids for item in (i, i)]
+            )
+        if len(ids) < settings.DEPLOYMENT_INDEX_CHUNK:
+            break
+        after = ids[-1]
+
+    return bool(
+        await finish_index_rebuild(
+            keys=[staging_key, index_key],
+            args=[token, settings.DEPLOYMENT_CACHE_TTL],
+        )
+    )
+
+
+async def load_deployments(
+    db: AsyncSession, deployment_ids: List[str]
+) -> List[Deployment]:
+    """
+    Loads deployments by id, in order, from the Redis cache with one pipelined
+    round trip, fetching cache misses from the database in a single query and
+    caching them through one more pipeline.
+
+    Rows read from the database are only cached where no entry exists by the
+    time they are written, so a status cached by a concurrent writer is never
+    replaced by the older state read here.
+    """
+    pipe = redis_client.pipeline(transaction=False)
+    for deployment_id in deployment_ids:
+        pipe.hgetall(f"deployment:{deployment_id}")
+    cached = dict(zip(deployment_ids, await pipe.execute()))
+
+    missing = [int(i) for i, deployment_data in cached.items() if not deployment_data]
+    if missing:
+        rows = await db.scalars(
+            select(DeploymentModel).where(DeploymentModel.id.in_(missing))
+        )
+        pipe = redis_client.pipeline(transaction=False)
+        for row in rows:
+            deployment_data = serialize_deployment(row)
+            fields = [item for pair in deployment_data.items() for item in pair]
+            await cache_if_missing(
+                keys=[f"deployment:{row.id}"],
+                args=[settings.DEPLOYMENT_CACHE_TTL, *fields],
+                client=pipe,
+            )
+            cached[str(row.id)] = deployment_data
+        await pipe.execute()
+
+    return [
+        Deployment(**cached[deployment_id])
+        for deployment_id in deployment_ids
+        if cached[deployment_id]
+    ]
+
+
+def admission_error(
     deployment_in: DeploymentCreate,
-    current_user: User = Depends(deps.get_current_user),
-):
+    cluster_id: Optional[int],
+    cluster: Optional[Cluster],
+    organization_id: int,
+) -> Optional[HTTPException]:
     """
-    Create a new deployment and schedule it.
+    Checks that a deployment may be submitted to the chosen cluster.
+
+    Returns:
+        The HTTPException to report, or None if the deployment is accepted.
     """
-    cluster = db.query(Cluster).filter(Cluster.id == deployment_in.cluster_id).first()
+    if cluster_id is None:
+        return HTTPException(
+            status_code=400,
+            detail="No cluster in the organization can fit this deployment",
+        )
+
     if not cluster:
-        raise HTTPException(status_code=404, detail="Cluster not found")
+        return HTTPException(status_code=404, detail="Cluster not found")
 
-    if cluster.organization_id != current_user.organization_id:
-        raise HTTPException(
+    if cluster.organization_id != organization_id:
+        return HTTPException(
             status_code=403,
             detail="User does not have access to this organization's cluster",
         )
 
     if (
-        cluster.cpu_available < deployment_in.cpu_required
-        or cluster.ram_available < deployment_in.ram_required
-        or cluster.gpu_available < deployment_in.gpu_required
+        deployment_in.cpu_required > cluster.cpu_limit
+        or deployment_in.ram_required > cluster.ram_limit
+        or deployment_in.gpu_required > cluster.gpu_limit
     ):
+        return HTTPException(
+            status_code=400, detail="Deployment exceeds cluster resource limits"
+        )
+
+    return None
+
+
+@router.post("/", response_model=Deployment)
+async def create_deployment(
+    *,
+    db: AsyncSession = Depends(deps.get_db),
+    deployment_in: DeploymentCreate,
+    current_user: UserPrincipal = Depends(deps.get_current_user),
+):
+    """
+    Create a new deployment and queue it on the cluster's scheduler.
+
+    When no `cluster_id` is given, the deployment is placed on the best-fit
+    cluster of the user's organization.
+
+    Raises:
+        HTTPException: 400 - Deployment can never fit within the cluster limits
+        HTTPException: 400 - User does not belong to any organization
+    """
+    if current_user.organization_id is None:
         raise HTTPException(
-            status_code=400, detail="Insufficient resources to create deployment"
+            status_code=400, detail="User does not belong to any organization"
+        )
+    cluster_id = deployment_in.cluster_id
+    if cluster_id is None:
+        cluster_id = await capacity_view.place(
+            db,
+            current_user.organization_id,
+            deployment_in.cpu_required,
+            deployment_in.ram_required,
+            deployment_in.gpu_required,
         )
 
+    cluster = await db.get(Cluster, cluster_id) if cluster_id is not None else None
+    error = admission_error(
+        deployment_in, cluster_id, cluster, current_user.organization_id
+    )
+    if error:
+        raise error
+
     deployment = DeploymentModel(
-        **deployment_in.dict(), status=DeploymentStatus.PENDING
+        **deployment_in.dict(exclude={"cluster_id"}),
+        cluster_id=cluster.id,
+        organization_id=cluster.organization_id,
+        user_id=current_user.id,
+        status=DeploymentStatus.PENDING,
     )
     db.add(deployment)
     try:
-        db.commit()
-        db.refresh(deployment)
+        await crud.count_submitted_deployments(db, cluster.id, 1)
+        await db.commit()
+        await db.refresh(deployment)
     except IntegrityError:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=400, detail="Deployment creation failed")
 
-    redis_key = f"org:{current_user.organization_id}:deployments"
-    redis_data = {
-        "id": deployment.id,
-        "cluster_id": deployment_in.cluster_id,
-        "cpu_required": deployment_in.cpu_required,
-        "ram_required": deployment_in.ram_required,
-        "gpu_required": deployment_in.gpu_required,
-        "status": deployment.status,
-        "created_at": str(deployment.created_at),
+    # Queue the deployment; it starts right away if the cluster has room,
+    # otherwise it stays PENDING until resources are released.
+    scheduler.enqueue(deployment)
+    started = await scheduler.schedule(db, cluster.id)
+    await db.refresh(deployment)
+
+    pipe = redis_client.pipeline(transaction=False)
+    await index_deployment(
+        keys=deployment_index_keys(current_user.organization_id),
+        args=[deployment.id, deployment.id],
+        client=pipe,
+    )
+    cache_deployment(pipe, deployment)
+    queue_status_event(
+        pipe,
+        deployment.organization_id,
+        deployment.id,
+        deployment.cluster_id,
+        DeploymentStatus.PENDING,
+    )
+    for other in started:
+        if other.id != deployment.id:
+            cache_deployment(pipe, other)
+        queue_status_event(
+            pipe, other.organization_id, other.id, other.cluster_id, other.status
+        )
+    await index_deadlines(started, pipe)
+    await pipe.execute()
+
+    return deployment
+
+
+@router.post("/batch", response_model=List[DeploymentBatchResult])
+async def create_deployments_batch(
+    *,
+    db: AsyncSession = Depends(deps.get_db),
+    deployments_in: List[DeploymentCreate] = Body(
+        ..., max_length=settings.DEPLOYMENT_BATCH_MAX
+    ),
+    current_user: UserPrincipal = Depends(deps.get_current_user),
+):
+    """
+    Create many deployments at once and queue them on their clusters.
+
+    Items are validated like `POST /deployments/`, but together: the clusters
+    are loaded with one query, accepted items are inserted in one transaction
+    and each affected cluster is scheduled once, with one set-based admission.
+    Redis is updated through a single pipeline. Items without a `cluster_id`
+    are spread over the organization's clusters by best fit, which costs
+    about one pass over the clusters per item. Requests above
+    `settings.PLACEMENT_MAX_WORK` in `CapacityIndex.placement_work` units
+    are rejected; the default places a full batch over up to 3,000 clusters
+    in about 0.5s.
+
+    Returns:
+        One result per item, in submission order, holding either the created
+        deployment or the status code and detail it was rejected with.
+
+    Raises:
+        HTTPException: 400 - User does not belong to any organization
+        HTTPException: 400 - Too many deployments to place
+    """
+    organization_id = current_user.organization_id
+    if organization_id is None:
+        raise HTTPException(
+            status_code=400, detail="User does not belong to any organization"
+        )
+    cluster_ids: Dict[int, Optional[int]] = {
+        index: deployment_in.cluster_id
+        for index, deployment_in in enumerate(deployments_in)
     }
+    unplaced = [
+        index for index, cluster_id in cluster_ids.items() if cluster_id is None
+    ]
+    if unplaced:
+        shapes = [
+            (
+                deployments_in[index].cpu_required,
+                deployments_in[index].ram_required,
+                deployments_in[index].gpu_required,
+            )
+            for index in unplaced
+        ]
+        work = await capacity_view.placement_work(db, organization_id, shapes)
+        if work > settings.PLACEMENT_MAX_WORK:
+            raise HTTPException(
+                status_code=400,
+                detail="Too many deployments to place; set `cluster_id` on some",
+            )
+        placements = await capacity_view.place_many(db, organization_id, shapes)
+        cluster_ids.update(zip(unplaced, placements))
 
-    redis_client.rpush(redis_key, str(deployment.id))
+    wanted = {
+        cluster_id for cluster_id in cluster_ids.values() if cluster_id is not None
+    }
+    clusters = {
+        cluster.id: cluster
+        for cluster in await db.scalars(select(Cluster).where(Cluster.id.in_(wanted)))
+    }
 
-    redis_client.hmset(f"deployment:{deployment.id}", redis_data)
+    results = [
+        DeploymentBatchResult(index=index) for index in range(len(deployments_in))
+    ]
+    accepted: Dict[int, DeploymentModel] = {}
+    for index, deployment_in in enumerate(deployments_in):
+        cluster = clusters.get(cluster_ids[index])
+        error = admission_error(
+            deployment_in, cluster_ids[index], cluster, organization_id
+        )
+        if error:
+            results[index].status_code = error.status_code
+            results[index].error = error.detail
+            continue
+        accepted[index] = DeploymentModel(
+            **deployment_in.dict(exclude={"cluster_id"}),
+            cluster_id=cluster.id,
+            organization_id=cluster.organization_id,
+            user_id=current_user.id,
+            status=DeploymentStatus.PENDING,
+        )
+    if not accepted:
+        return results
 
-    db.add(deployment)
-    db.commit()
-    db.refresh(deployment)
+    db.add_all(accepted.values())
+    submitted: Dict[int, int] = {}
+    for deployment in accepted.values():
+        submitted[deployment.cluster_id] = submitted.get(deployment.cluster_id, 0) + 1
+    try:
+        for cluster_id, count in submitted.items():
+            await crud.count_submitted_deployments(db, cluster_id, count)
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Deployment creation failed")
 
-    return deployment
+    for deployment in accepted.values():
+        scheduler.enqueue(deployment)
+    started: List[DeploymentModel] = []
+    for cluster_id in submitted:
+        started.extend(await scheduler.schedule(db, cluster_id))
+
+    pipe = redis_client.pipeline(transaction=False)
+    index_keys = deployment_index_keys(organization_id)
+    for deployment in accepted.values():
+        await index_deployment(
+            keys=index_keys, args=[deployment.id, deployment.id], client=pipe
+        )
+        cache_deployment(pipe, deployment)
+        queue_status_event(
+            pipe,
+            deployment.organization_id,
+            deployment.id,
+            deployment.cluster_id,
+            DeploymentStatus.PENDING,
+        )
+    batch_ids = {deployment.id for deployment in accepted.values()}
+    for other in started:
+        if other.id not in batch_ids:
+            cache_deployment(pipe, other)
+        queue_status_event(
+            pipe, other.organization_id, other.id, other.cluster_id, other.status
+        )
+    await index_deadlines(started, pipe)
+    await pipe.execute()
+
+    for index, deployment in accepted.items():
+        results[index].deployment = Deployment.model_validate(deployment)
+    return results
 
 
 @router.get("/", response_model=List[Deployment])
-def list_deployments(
-    db: Session = Depends(deps.get_db),
-    current_user: User = Depends(deps.get_current_user),
+async def list_deployments(
+    db: AsyncSession = Depends(deps.get_db),
+    current_user: UserPrincipal = Depends(deps.get_current_user),
+    limit: int = Query(settings.PAGE_SIZE_DEFAULT, ge=1, le=settings.PAGE_SIZE_MAX),
+    after: Optional[int] = None,
+    status: Optional[DeploymentStatus] = None,
+    cluster_id: Optional[int] = None,
+    min_priority: Optional[int] = None,
+    max_priority: Optional[int] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
 ):
     """
-    List all deployments for the user's organization.
+    List a page of deployments for the user's organization, ordered by id.
+
+    Pass the id of the last deployment received as `after` to fetch the next
+    page. Filtered pages are answered by the database through the composite
+    indexes on Deployment; unfiltered pages are read from the Redis id index
+    and deployment cache. When the index has expired, the page is read from
+    the database and the index is rebuilt, in bounded steps, for later pages.
     """
-    redis_key = f"org:{current_user.organization_id}:deployments"
+    organization_id = current_user.organization_id
+    filters = {
+        "status": status,
+        "cluster_id": cluster_id,
+        "min_priority": min_priority,
+        "max_priority": max_priority,
+        "created_after": created_after,
+        "created_before": created_before,
+    }
+    if any(value is not None for value in filters.values()):
+        return await crud.get_deployments_by_organization(
+            db, organization_id, limit=limit, after=after, **filters
+        )
 
-    deployment_ids = redis_client.lrange(redis_key, 0, -1)
+    index_key = deployment_index_key(organization_id)
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.exists(index_key)
+    pipe.zrangebyscore(
+        index_key, "-inf" if after is None else f"({after}", "+inf", start=0, num=limit
+    )
+    index_exists, deployment_ids = await pipe.execute()
 
-    if deployment_ids:
-        deployments = []
-        for deployment_id in deployment_ids:
-            deployment_data = redis_client.hgetall(f"deployment:{deployment_id}")
-            if deployment_data:
-                deployments.append(Deployment(**deployment_data))
+    if not index_exists:
+        deployments = await crud.get_deployments_by_organization(
+            db, organization_id, limit=limit, after=after
+        )
+        await rebuild_deployment_index(db, organization_id)
         return deployments
 
-    deployments = (
-        db.query(DeploymentModel)
-        .filter(DeploymentModel.organization_id == current_user.organization_id)
-        .all()
-    )
+    return await load_deployments(db, deployment_ids)
+
+
+@router.get("/events")
+async def stream_deployment_events(
+    request: Request,
+    current_user: UserPrincipal = Depends(deps.get_current_user),
+    last_event_id: Optional[str] = Header(None),
+):
+    """
+    Stream the organization's deployment status changes as Server-Sent Events.
+
+    Each event carries the deployment id, cluster id and new status. A client
+    that reconnects with the standard `Last-Event-ID` header resumes right
+    after the last event it received, as long as that event is still within
+    the `DEPLOYMENT_EVENTS_MAXLEN` most recent ones. A comment line is sent
+    every `DEPLOYMENT_EVENTS_HEARTBEAT` seconds while nothing happens.
 
-    for deployment in deployments:
-        redis_client.rpush(redis_key, str(deployment.id))
-        redis_client.hmset(
-            f"deployment:{deployment.id}",
-            {
-                "id": deployment.id,
-                "cluster_id": deployment.cluster_id,
-                "cpu_required": deployment.cpu_required,
-                "ram_required": deployment.ram_required,
-                "gpu_required": deployment.gpu_required,
-                "status": deployment.status,
-                "created_at": str(deployment.created_at),
-            },
-        )
-
-    return deployments
+    Raises:
+        HTTPException: 400 - User does not belong to any organization
+        HTTPException: 400 - Malformed Last-Event-ID
+    """
+    organization_id = current_user.organization_id
+    if organization_id is None:
+        raise HTTPException(
+            status_code=400, detail="User does not belong to any organization"
+        )
+    if last_event_id and not STREAM_ID.fullmatch(last_event_id):
+        raise HTTPException(status_code=400, detail="Malformed Last-Event-ID")
+
+    async def events():
+        last_id = last_event_id or await latest_status_event_id(organization_id)
+        while not await request.is_disconnected():
+            entries = await read_status_events(
+                organization_id, last_id, settings.DEPLOYMENT_EVENTS_HEARTBEAT
+            )
+            if not entries:
+                yield ": keep-alive\n\n"
+                continue
+            for event_id, fields in entries:
+                last_id = event_id
+                yield f"id: {event_id}\nevent: status\ndata: {json.dumps(fields)}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
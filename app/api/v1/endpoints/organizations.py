@@ -1,7 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.user import User
 from app.core import deps
+from app.core.principals import UserPrincipal, principal_cache
 from app.schemas.organization import Organization, OrganizationCreate
 from app.utils import generate_random_string
 from app import crud
@@ -10,11 +11,11 @@ router = APIRouter()
 
 
 @router.post("/", response_model=Organization)
-def create_organization(
+async def create_organization(
     *,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_db),
     organization_in: OrganizationCreate,
-    current_user: User = Depends(deps.get_current_user),
+    current_user: UserPrincipal = Depends(deps.get_current_user),
 ):
     """
     Creates a new organization with a random invite code.
@@ -23,7 +24,7 @@ def create_organization(
         HTTPException: 400 - User already has an organization
     """
 
-    if current_user.organization:
+    if current_user.organization_id:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="User already belongs to an organization",
@@ -31,27 +32,27 @@ def create_organization(
 
     # Generate a random, unique invite code
     invite_code = generate_random_string(length=10)
-    while crud.get_organization_by_invite_code(db, invite_code):
+    while await crud.get_organization_by_invite_code(db, invite_code):
         invite_code = generate_random_string(length=10)
 
-    organization = crud.create_organization(
+    organization = await crud.create_organization(
         db, organization_in, invite_code=invite_code
     )
 
-    current_user.organization = organization
-    db.add(current_user)
-    db.commit()
-    db.refresh(current_user)
+    user = await db.get(User, current_user.id)
+    user.organization_id = organization.id
+    await db.commit()
+    await principal_cache.invalidate(current_user.id)
 
     return organization
 
 
 @router.post("/{invite_code}/join")
-def join_organization(
+async def join_organization(
     *,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_db),
     invite_code: str,
-    current_user: User = Depends(deps.get_current_user),
+    current_user: UserPrincipal = Depends(deps.get_current_user),
 ):
     """
     Allows a user to join an organization using an invite code.
@@ -60,21 +61,21 @@ def join_organization(
         HTTPException: 400 - User already has an organization, Invalid invite code
     """
 
-    if current_user.organization:
+    if current_user.organization_id:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="User already belongs to an organization",
         )
 
-    organization = crud.get_organization_by_invite_code(db, invite_code)
+    organization = await crud.get_organization_by_invite_code(db, invite_code)
     if not organization:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid invite code"
         )
 
-    current_user.organization = organization
-    db.add(current_user)
-    db.commit()
-    db.refresh(current_user)
+    user = await db.get(User, current_user.id)
+    user.organization_id = organization.id
+    await db.commit()
+    await principal_cache.invalidate(current_user.id)
 
     return {"message": "Successfully joined organization"}
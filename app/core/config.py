@@ -1,4 +1,5 @@
 from pydantic_settings import BaseSettings
+from typing import Dict, Optional
 import os
 
 
@@ -17,6 +18,76 @@ class Settings(BaseSettings):
     SECRET_KEY: str = "TODO_CHANGE_THIS_SECRET_KEY"  # TODO: Change in production
     SESSION_COOKIE_NAME: str = "session"
     SESSION_MAX_AGE: int = 1800  # 30 minutes in seconds
+    SESSION_BACKEND: str = "redis"  # "redis" or "memory" (single worker only)
+    SESSION_CACHE_SIZE: int = 10000
+    SESSION_CACHE_TTL: float = 2.0  # Seconds a session read is reused in-process
+
+    # Password hashing configuration
+    PASSWORD_HASH_WORKERS: int = 2  # bcrypt worker processes
+    PASSWORD_HASH_MAX_PENDING: int = 32  # Running + queued before rejecting with 503
+
+    # Authenticated user cache configuration
+    PRINCIPAL_CACHE_SIZE: int = 10000
+    PRINCIPAL_CACHE_TTL: float = 300.0  # Seconds a cached principal is trusted
+    PRINCIPAL_CACHE_REDIS: bool = False  # Share cached principals across workers
+
+    # Listing configuration
+    PAGE_SIZE_DEFAULT: int = 100
+    PAGE_SIZE_MAX: int = 1000
+    DEPLOYMENT_CACHE_TTL: int = 3600  # Seconds a cached deployment or id index lives
+    DEPLOYMENT_INDEX_CHUNK: int = 10000  # Ids read and sent per index rebuild step
+    DEPLOYMENT_INDEX_REBUILD_TIMEOUT: int = 60  # Seconds before a rebuild is dropped
+
+    # Scheduling configuration
+    PLACEMENT_VIEW_TTL: float = 30.0  # Seconds before a cached org view is reloaded
+    DEADLINE_SWEEP_MAX_INTERVAL: float = 60.0  # Longest sleep between sweeps
+    DEPLOYMENT_BATCH_MAX: int = 5000  # Items accepted by one batch submission
+    PLACEMENT_MAX_WORK: int = 20000000  # Placement cost one request may incur
+    PREEMPTION_ENABLED: bool = False  # Evict lower-priority RUNNING deployments
+    PREEMPTION_MAX_VICTIMS: int = 64  # Candidates considered per preemption
+    BACKFILL_ENABLED: bool = False  # Start short jobs while a large head waits
+    BACKFILL_MAX_CANDIDATES: int = 1000  # Queue entries considered per backfill
+    SIMULATION_MAX_DEPLOYMENTS: int = 100000  # Items accepted by one simulation
+    SIMULATION_MAX_POINTS: int = 1000  # Timeline samples one simulation returns
+
+    # Fair-share configuration
+    FAIR_SHARE_ENABLED: bool = False  # Order queues by submitters' recent usage
+    FAIR_SHARE_HALF_LIFE: float = 3600.0  # Seconds for recorded usage to halve
+    FAIR_SHARE_PRIORITY_WEIGHT: float = 10.0  # Priority levels an idle user gains
+    FAIR_SHARE_USAGE_SCALE: float = 3600.0  # CPU-seconds that halve the bonus
+    FAIR_SHARE_GPU_COST: float = 8.0  # CPU-seconds charged per GPU-second
+    FAIR_SHARE_WEIGHTS: Dict[int, float] = {}  # User id to weight, default 1.0
+
+    # Utilization history configuration
+    UTILIZATION_SAMPLING_ENABLED: bool = False  # Record cluster usage over time
+    UTILIZATION_SAMPLE_INTERVAL: int = 1  # Seconds between samples
+    UTILIZATION_SAMPLE_SLOTS: int = 3600  # Raw samples kept per cluster
+    UTILIZATION_MINUTE_SLOTS: int = 10080  # 1-minute means kept (7 days)
+    UTILIZATION_HOUR_SLOTS: int = 8760  # 1-hour means kept (1 year)
+    UTILIZATION_HISTORY_PATH: Optional[str] = None  # Directory shared by workers
+    UTILIZATION_FLUSH_INTERVAL: float = 300.0  # Seconds between writes to disk
+    UTILIZATION_MAX_POINTS: int = 10000  # Points one utilization query returns
+
+    # Deployment event stream configuration
+    DEPLOYMENT_EVENTS_MAXLEN: int = 10000  # Events kept per organization for resume
+    DEPLOYMENT_EVENTS_HEARTBEAT: float = 15.0  # Seconds between keep-alives
+
+    # Connection pool configuration
+    REDIS_HOST: str = "localhost"
+    REDIS_PORT: int = 6379
+    REDIS_DB: int = 0
+    REDIS_MAX_CONNECTIONS: int = 64  # Per worker, shared by all request paths
+    REDIS_STREAM_MAX_CONNECTIONS: int = 256  # Per worker, one per event stream
+    REDIS_POOL_TIMEOUT: float = 5.0  # Seconds to wait for a free connection
+    DB_POOL_SIZE: int = 10  # Per worker
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30.0  # Seconds to wait for a free connection
+    DB_POOL_RECYCLE: int = 1800  # Seconds before a connection is replaced
+    DB_STATEMENT_TIMEOUT_MS: int = 30000  # Postgres only
+
+    # Startup and shutdown configuration
+    DB_MIGRATE_ON_STARTUP: bool = False  # Else refuse to start on an old schema
+    SHUTDOWN_GRACE_PERIOD: float = 10.0  # Seconds an in-flight sweep may finish
 
     # Database URL
     DATABASE_URL: str = os.getenv(
@@ -1,24 +1,26 @@
-from typing import Generator, Optional
+from typing import AsyncGenerator
 from fastapi import Depends, HTTPException, status, Request
-from sqlalchemy.orm import Session
-from app.db.session import SessionLocal
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.principals import UserPrincipal, principal_cache
+from app.db.session import AsyncSessionLocal
 from app.models.user import User
 
 
-def get_db() -> Generator[Session, None, None]:
-    db = SessionLocal()
-    try:
+async def get_db() -> AsyncGenerator[AsyncSession, None]:
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
 async def get_current_user(
-    request: Request, db: Session = Depends(get_db)
-) -> Optional[User]:
+    request: Request, db: AsyncSession = Depends(get_db)
+) -> UserPrincipal:
     """
     Retrieves the currently authenticated user from the session.
 
+    Returns a lightweight principal served from the principal cache when
+    possible, so most authenticated requests do not query the users table.
+    Endpoints that modify the user must load the row themselves.
+
     Raises:
         HTTPException: 401 - User is not authenticated
     """
@@ -29,10 +31,20 @@ async def get_current_user(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated"
         )
 
-    user = db.query(User).filter(User.id == user_id).first()
+    principal = await principal_cache.get(user_id)
+    if principal is not None:
+        return principal
+
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found"
         )
 
-    return user
+    principal = UserPrincipal(
+        id=user.id,
+        organization_id=user.organization_id,
+        is_active=bool(user.is_active),
+    )
+    await principal_cache.set(principal)
+    return principal
@@ -0,0 +1,106 @@
+import math
+import time
+from typing import Dict, Mapping, Optional, Tuple
+
+from app.core.config import settings
+
+
+class DecayedUsage:
+    """
+    Resource usage per submitter that halves every `half_life` seconds.
+
+    Only a value and the time it was last brought up to date are kept per
+    submitter; reads and charges decay that value to the present, so both are
+    O(1) and no usage history is stored or scanned.
+    """
+
+    def __init__(self, half_life: float) -> None:
+        self._decay_rate = math.log(2) / half_life
+        self._usage: Dict[Optional[int], Tuple[float, float]] = {}
+
+    def get(self, user_id: Optional[int], now: Optional[float] = None) -> float:
+        entry = self._usage.get(user_id)
+        if entry is None:
+            return 0.0
+        value, updated_at = entry
+        now = time.monotonic() if now is None else now
+        return value * math.exp(-self._decay_rate * (now - updated_at))
+
+    def charge(
+        self, user_id: Optional[int], amount: float, now: Optional[float] = None
+    ) -> None:
+        """
+        Adds `amount` to the submitter's usage; a negative amount refunds.
+        """
+        now = time.monotonic() if now is None else now
+        self._usage[user_id] = (max(self.get(user_id, now) + amount, 0.0), now)
+
+
+class FairShare:
+    """
+    Ranks queued deployments by their priority plus a fair-share bonus that
+    shrinks as their submitter's recent usage grows relative to the
+    submitter's weight:
+
+        bonus = priority_weight * 2 ** (-usage / (weight * usage_scale))
+
+    A submitter with no recent usage gets the full bonus, and one who used
+    `weight * usage_scale` recently gets half of it. Usage is charged in
+    CPU-seconds, plus `gpu_cost` per GPU-second, for the whole `required_time`
+    when a deployment starts, so a heavy submitter's next deployments drop
+    back at once.
+    """
+
+    def __init__(
+        self,
+        half_life: float,
+        priority_weight: float,
+        usage_scale: float,
+        gpu_cost: float,
+        weights: Mapping[int, float],
+    ) -> None:
+        self.usage = DecayedUsage(half_life)
+        self._priority_weight = priority_weight
+        self._usage_scale = usage_scale
+        self._gpu_cost = gpu_cost
+        self._weights = weights
+
+    def cost(self, entry) -> float:
+        return (
+            entry.cpu_required + self._gpu_cost * entry.gpu_required
+        ) * entry.required_time
+
+    def charge(self, entry, fraction: float = 1.0) -> None:
+        """
+        Charges `fraction` of the deployment's cost to its submitter; pass a
+        negative fraction to refund.
+        """
+        self.usage.charge(entry.user_id, fraction * self.cost(entry))
+
+    def bonus(self, user_id: Optional[int], refund: float = 0.0) -> float:
+        weight = self._weights.get(user_id, 1.0) if user_id is not None else 1.0
+        usage = max(self.usage.get(user_id) - refund, 0.0)
+        exponent = -usage / (weight * self._usage_scale)
+        return self._priority_weight * 2**exponent
+
+    def rank(self, entry, refund: float = 0.0) -> tuple:
+        """
+        Sort key of a queued deployment: best effective priority first, then
+        oldest. `refund` is usage its submitter is about to be refunded, to
+        rank a deployment as it will be once back in the queue.
+        """
+        return (
+            entry.neg_priority - self.bonus(entry.user_id, refund),
+            entry.created_at,
+            entry.deployment_id,
+        )
+
+
+def fair_share_from_settings() -> FairShare:
+    return FairShare(
+        half_life=settings.FAIR_SHARE_HALF_LIFE,
+        priority_weight=settings.FAIR_SHARE_PRIORITY_WEIGHT,
+        usage_scale=settings.FAIR_SHARE_USAGE_SCALE,
+        gpu_cost=settings.FAIR_SHARE_GPU_COST,
+        weights=settings.FAIR_SHARE_WEIGHTS,
+    )
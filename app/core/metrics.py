@@ -0,0 +1,296 @@
+import time
+from contextvars import ContextVar
+from datetime import datetime
+from itertools import accumulate
+from typing import Optional
+
+import redis.asyncio as redis
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram
+from prometheus_client.core import (
+    CounterMetricFamily,
+    GaugeMetricFamily,
+    HistogramMetricFamily,
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Metrics are per worker process; scrape every worker, or run a single one.
+registry = CollectorRegistry()
+
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Request latency by route template",
+    ["method", "route", "status"],
+    registry=registry,
+)
+REQUEST_DB_STATEMENTS = Histogram(
+    "http_request_db_statements",
+    "SQL statements executed per request",
+    ["route"],
+    buckets=COUNT_BUCKETS,
+    registry=registry,
+)
+REQUEST_DB_SECONDS = Histogram(
+    "http_request_db_seconds",
+    "Time per request spent executing SQL",
+    ["route"],
+    registry=registry,
+)
+REQUEST_REDIS_COMMANDS = Histogram(
+    "http_request_redis_commands",
+    "Redis commands sent per request",
+    ["route"],
+    buckets=COUNT_BUCKETS,
+    registry=registry,
+)
+REQUEST_REDIS_SECONDS = Histogram(
+    "http_request_redis_seconds",
+    "Time per request spent waiting on Redis",
+    ["route"],
+    registry=registry,
+)
+DB_STATEMENTS = Counter("db_statements", "SQL statements executed", registry=registry)
+REDIS_COMMANDS = Counter("redis_commands", "Redis commands sent", registry=registry)
+REDIS_ROUND_TRIPS = Counter(
+    "redis_round_trips",
+    "Redis round trips; a pipeline is one round trip",
+    registry=registry,
+)
+DEADLINE_SWEEP_SECONDS = Histogram(
+    "deadline_sweep_duration_seconds",
+    "Duration of each deadline sweep",
+    registry=registry,
+)
+RESOURCES_RESERVED = Gauge(
+    "cluster_resources_reserved",
+    "Resources reserved by RUNNING deployments across all clusters",
+    ["resource"],
+    registry=registry,
+)
+
+
+class RequestStats:
+    """
+    I/O done on behalf of the current request.
+    """
+
+    __slots__ = (
+        "db_statements",
+        "db_commits",
+        "db_seconds",
+        "redis_commands",
+        "redis_round_trips",
+        "redis_seconds",
+    )
+
+    def __init__(self) -> None:
+        self.db_statements = 0
+        self.db_commits = 0
+        self.db_seconds = 0.0
+        self.redis_commands = 0
+        self.redis_round_trips = 0
+        self.redis_seconds = 0.0
+
+
+request_stats: ContextVar[Optional[RequestStats]] = ContextVar(
+    "request_stats", default=None
+)
+
+
+def instrument_engine(engine: Engine) -> None:
+    """
+    Counts and times every statement the engine executes. For an async engine,
+    pass its `sync_engine`; SQLAlchemy carries the caller's context into the
+    greenlet, so statements are attributed to the request that ran them.
+    """
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, many):
+        conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, many):
+        elapsed = time.perf_counter() - conn.info["query_start_time"].pop()
+        DB_STATEMENTS.inc()
+        stats = request_stats.get()
+        if stats is not None:
+            stats.db_statements += 1
+            stats.db_seconds += elapsed
+
+    @event.listens_for(engine, "commit")
+    def commit(conn):
+        stats = request_stats.get()
+        if stats is not None:
+            stats.db_commits += 1
+
+
+def record_redis(commands: int, elapsed: float) -> None:
+    REDIS_COMMANDS.inc(commands)
+    REDIS_ROUND_TRIPS.inc()
+    stats = request_stats.get()
+    if stats is not None:
+        stats.redis_commands += commands
+        stats.redis_round_trips += 1
+        stats.redis_seconds += elapsed
+
+
+class InstrumentedPipeline(redis.client.Pipeline):
+    async def execute(self, raise_on_error: bool = True):
+        commands = len(self.command_stack)
+        if not commands:
+            return await super().execute(raise_on_error)
+        start = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            record_redis(commands, time.perf_counter() - start)
+
+
+class InstrumentedRedis(redis.StrictRedis):
+    """
+    Redis client that counts commands and round trips and times them.
+    """
+
+    async def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            record_redis(1, time.perf_counter() - start)
+
+    def pipeline(self, transaction: bool = True, shard_hint: Optional[str] = None):
+        return InstrumentedPipeline(
+            self.connection_pool, self.response_callbacks, transaction, shard_hint
+        )
+
+
+class MetricsMiddleware:
+    """
+    Records latency, SQL and Redis usage of every HTTP request, labelled by
+    the matched route template so path parameters do not explode the label
+    space.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = request_stats.set(stats)
+        status = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            request_stats.reset(token)
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_SECONDS.labels(scope["method"], route, str(status)).observe(elapsed)
+            REQUEST_DB_STATEMENTS.labels(route).observe(stats.db_statements)
+            REQUEST_DB_SECONDS.labels(route).observe(stats.db_seconds)
+            REQUEST_REDIS_COMMANDS.labels(route).observe(stats.redis_commands)
+            REQUEST_REDIS_SECONDS.labels(route).observe(stats.redis_seconds)
+
+
+class SchedulerCollector:
+    """
+    Exports the scheduler's queues when scraped.
+    """
+
+    def __init__(self, scheduler) -> None:
+        self._scheduler = scheduler
+
+    def collect(self):
+        queued, oldest = self._scheduler.pending_summary()
+        yield GaugeMetricFamily(
+            "scheduler_queued_deployments",
+            "PENDING deployments queued in this worker",
+            value=queued,
+        )
+        age = (datetime.now() - oldest).total_seconds() if oldest else 0.0
+        yield GaugeMetricFamily(
+            "scheduler_oldest_pending_age_seconds",
+            "Age of the oldest queued deployment",
+            value=age,
+        )
+
+
+class PasswordHasherCollector:
+    """
+    Exports `PasswordHasher.stats()` when scraped.
+    """
+
+    def __init__(self, hasher) -> None:
+        self._hasher = hasher
+
+    def collect(self):
+        stats = self._hasher.stats()
+        yield GaugeMetricFamily(
+            "password_hash_in_flight",
+            "Hash operations running or queued",
+            value=stats["in_flight"],
+        )
+        yield GaugeMetricFamily(
+            "password_hash_queue_depth",
+            "Hash operations waiting for a worker",
+            value=stats["queue_depth"],
+        )
+        yield CounterMetricFamily(
+            "password_hash_rejected",
+            "Hash operations rejected as overloaded",
+            value=stats["rejected"],
+        )
+        buckets = stats["latency_seconds_buckets"]
+        cumulative = accumulate(buckets.values())
+        yield HistogramMetricFamily(
+            "password_hash_duration_seconds",
+            "Latency of hash operations, including queueing",
+            buckets=[
+                ("+Inf" if bound == float("inf") else str(bound), count)
+                for bound, count in zip(buckets, cumulative)
+            ],
+            sum_value=stats["latency_seconds_sum"],
+        )
+
+
+class PoolCollector:
+    """
+    Exports connection pool snapshots, keyed by pool name, when scraped.
+    """
+
+    def __init__(self, snapshots) -> None:
+        self._snapshots = snapshots
+
+    def collect(self):
+        checked_out = GaugeMetricFamily(
+            "pool_checked_out_connections", "Connections in use", labels=["pool"]
+        )
+        acquired = CounterMetricFamily(
+            "pool_checkouts", "Connections handed out", labels=["pool"]
+        )
+        waited = CounterMetricFamily(
+            "pool_wait_seconds", "Time spent waiting for a connection", labels=["pool"]
+        )
+        timeouts = CounterMetricFamily(
+            "pool_timeouts", "Checkouts that timed out", labels=["pool"]
+        )
+        for name, snapshot in self._snapshots().items():
+            checked_out.add_metric([name], snapshot.get("checked_out", 0))
+            acquired.add_metric([name], snapshot["acquired"])
+            waited.add_metric([name], snapshot["wait_seconds"])
+            timeouts.add_metric([name], snapshot["timeouts"])
+        yield from (checked_out, acquired, waited, timeouts)
@@ -0,0 +1,105 @@
+import asyncio
+import time
+
+import redis.asyncio as redis
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.core.config import settings
+
+
+class PoolStats:
+    """
+    Running totals of connection checkouts from a pool: how many there were,
+    how long callers waited for a free connection and how many gave up.
+    """
+
+    def __init__(self) -> None:
+        self.acquired = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.timeouts = 0
+
+    def record(self, waited: float) -> None:
+        self.acquired += 1
+        self.wait_seconds += waited
+        self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+    def snapshot(self) -> dict:
+        return {
+            "acquired": self.acquired,
+            "wait_seconds": self.wait_seconds,
+            "max_wait_seconds": self.max_wait_seconds,
+            "timeouts": self.timeouts,
+        }
+
+
+db_pool_stats = PoolStats()
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Queue pool that records checkout waits and timeouts in `db_pool_stats`.
+    The stats live outside the instance because SQLAlchemy rebuilds the pool
+    from its class on `dispose`.
+    """
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            db_pool_stats.timeouts += 1
+            raise
+        db_pool_stats.record(time.perf_counter() - start)
+        return connection
+
+
+class InstrumentedRedisPool(redis.BlockingConnectionPool):
+    """
+    Blocking Redis pool, so a burst waits up to `timeout` seconds for a free
+    connection instead of opening unbounded new ones, with checkout stats.
+    """
+
+    def __init__(self, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.stats = PoolStats()
+
+    async def get_connection(self, command_name, *keys, **options):
+        start = time.perf_counter()
+        try:
+            connection = await super().get_connection(command_name, *keys, **options)
+        except redis.ConnectionError as err:
+            # Only a wait for a free connection ends in a chained TimeoutError;
+            # failures to connect are not pool timeouts.
+            if isinstance(err.__cause__, asyncio.TimeoutError):
+                self.stats.timeouts += 1
+            raise
+        self.stats.record(time.perf_counter() - start)
+        return connection
+
+    def snapshot(self) -> dict:
+        return {
+            **self.stats.snapshot(),
+            # redis-py keeps no public counter of checked out connections
+            "checked_out": len(self._in_use_connections),
+            "max_connections": self.max_connections,
+        }
+
+
+def make_redis_pool(max_connections: int) -> InstrumentedRedisPool:
+    return InstrumentedRedisPool(
+        host=settings.REDIS_HOST,
+        port=settings.REDIS_PORT,
+        db=settings.REDIS_DB,
+        max_connections=max_connections,
+        timeout=settings.REDIS_POOL_TIMEOUT,
+        decode_responses=True,
+    )
+
+
+# Request-path commands and pipelines share one pool per worker. Event stream
+# clients park a connection in a blocking XREAD for as long as they are
+# connected, so they get their own pool and cannot starve requests.
+redis_pool = make_redis_pool(settings.REDIS_MAX_CONNECTIONS)
+stream_redis_pool = make_redis_pool(settings.REDIS_STREAM_MAX_CONNECTIONS)
@@ -0,0 +1,100 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Tuple
+from app.core.config import settings
+from app.core.redis import redis_client
+
+
+@dataclass(frozen=True)
+class UserPrincipal:
+    """
+    The lightweight identity of an authenticated user that endpoints need.
+    """
+
+    id: int
+    organization_id: Optional[int]
+    is_active: bool
+
+
+class PrincipalCache:
+    """
+    Bounded LRU cache of user principals with a TTL, optionally backed by a
+    Redis tier shared across workers.
+
+    Only principals that already belong to an organization are cached. The API
+    never removes a user from an organization, so such an entry cannot go
+    stale; users without one are always read from the database, which means a
+    worker that did not see a create or join still picks up the new membership
+    on the next request. Entries are also dropped explicitly via `invalidate`.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, use_redis: bool) -> None:
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._use_redis = use_redis
+        self._entries: "OrderedDict[int, Tuple[float, UserPrincipal]]" = OrderedDict()
+
+    @staticmethod
+    def _redis_key(user_id: int) -> str:
+        return f"user:{user_id}:principal"
+
+    def _remember(self, principal: UserPrincipal) -> None:
+        self._entries[principal.id] = (time.monotonic() + self._ttl, principal)
+        self._entries.move_to_end(principal.id)
+        while len(self._entries) > self._maxsize:
+            self._entries.popitem(last=False)
+
+    async def get(self, user_id: int) -> Optional[UserPrincipal]:
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            expires_at, principal = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(user_id)
+                return principal
+            del self._entries[user_id]
+
+        if not self._use_redis:
+            return None
+
+        data = await redis_client.hgetall(self._redis_key(user_id))
+        if not data:
+            return None
+        principal = UserPrincipal(
+            id=int(data["id"]),
+            organization_id=int(data["organization_id"]),
+            is_active=data["is_active"] == "1",
+        )
+        self._remember(principal)
+        return principal
+
+    async def set(self, principal: UserPrincipal) -> None:
+        if principal.organization_id is None:
+            return
+
+        self._remember(principal)
+        if self._use_redis:
+            key = self._redis_key(principal.id)
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.hset(
+                key,
+                mapping={
+                    "id": principal.id,
+                    "organization_id": principal.organization_id,
+                    "is_active": int(principal.is_active),
+                },
+            )
+            pipe.expire(key, int(self._ttl))
+            await pipe.execute()
+
+    async def invalidate(self, user_id: int) -> None:
+        self._entries.pop(user_id, None)
+        if self._use_redis:
+            await redis_client.delete(self._redis_key(user_id))
+
+
+principal_cache = PrincipalCache(
+    maxsize=settings.PRINCIPAL_CACHE_SIZE,
+    ttl=settings.PRINCIPAL_CACHE_TTL,
+    use_redis=settings.PRINCIPAL_CACHE_REDIS,
+)
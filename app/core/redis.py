@@ -1,51 +1,301 @@
-import redis
+import asyncio
+import time
+import redis.asyncio as redis
 from datetime import datetime, timedelta
-from fastapi import BackgroundTasks
+from typing import Dict, Iterable, List, Optional, Tuple
+from app import crud
+from app.core.config import settings
+from app.core.metrics import InstrumentedRedis
+from app.core.pools import redis_pool, stream_redis_pool
+from app.core.scheduler import scheduler
 from app.models.deployment import DeploymentStatus, Deployment as DeploymentModel
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-redis_client = redis.StrictRedis(host="localhost", port=8001, decode_responses=True)
+redis_client = InstrumentedRedis(connection_pool=redis_pool)
+stream_redis_client = redis.StrictRedis(connection_pool=stream_redis_pool)
 
+# Sorted set of RUNNING deployment ids scored by their completion deadline
+DEADLINES_KEY = "deployments:deadlines"
 
-def update_deployment_status(db: Session):
+
+class DeadlineWaker:
+    """
+    Lets request handlers wake the sweeper loop early when a deployment with
+    an earlier deadline than the one it is sleeping towards gets indexed.
+    """
+
+    def __init__(self) -> None:
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._event: Optional[asyncio.Event] = None
+        self._wake_at = float("inf")
+
+    def bind(self) -> None:
+        """
+        Attaches the waker to the running event loop; call from the sweeper task.
+        """
+        self._loop = asyncio.get_running_loop()
+        self._event = asyncio.Event()
+
+    def notify(self, deadline: float) -> None:
+        if self._loop is None or deadline >= self._wake_at:
+            return
+        self._wake_at = deadline
+        self._loop.call_soon_threadsafe(self._event.set)
+
+    def wake(self) -> None:
+        """
+        Ends the current wait now, e.g. so the sweeper notices shutdown.
+        """
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._event.set)
+
+    async def wait(self, timeout: float) -> None:
+        """
+        Sleeps for `timeout` seconds or until `notify` reports an earlier deadline.
+        """
+        self._wake_at = time.time() + timeout
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._event.clear()
+
+
+deadline_waker = DeadlineWaker()
+
+
+def serialize_deployment(deployment: DeploymentModel) -> dict:
+    """
+    Flattens a deployment into the field map cached under `deployment:{id}`.
+    """
+    return {
+        "id": deployment.id,
+        "name": deployment.name,
+        "docker_image": deployment.docker_image,
+        "cluster_id": deployment.cluster_id,
+        "cpu_required": deployment.cpu_required,
+        "ram_required": deployment.ram_required,
+        "gpu_required": deployment.gpu_required,
+        "priority": deployment.priority or 0,
+        "required_time": deployment.required_time,
+        "status": deployment.status.value,
+        "created_at": deployment.created_at.isoformat(),
+        "started_at": (
+            deployment.started_at.isoformat() if deployment.started_at else ""
+        ),
+    }
+
+
+def cache_deployment(pipe: redis.client.Pipeline, deployment: DeploymentModel) -> None:
+    """
+    Queues writing a deployment's current state under `deployment:{id}`, to
+    expire after `DEPLOYMENT_CACHE_TTL` seconds.
+    """
+    key = f"deployment:{deployment.id}"
+    pipe.hset(key, mapping=serialize_deployment(deployment))
+    pipe.expire(key, settings.DEPLOYMENT_CACHE_TTL)
+
+
+def deployment_events_key(organization_id: int) -> str:
+    """
+    Stream of an organization's deployment status changes.
+    """
+    return f"org:{organization_id}:deployment_events"
+
+
+def queue_status_event(
+    pipe: redis.client.Pipeline,
+    organization_id: Optional[int],
+    deployment_id: int,
+    cluster_id: int,
+    status: DeploymentStatus,
+) -> None:
+    """
+    Queues a status change on the organization's event stream.
+
+    Events go to a capped Redis stream rather than a pub/sub channel so they
+    outlive the moment they are published: a client that reconnects with the
+    last event id it saw receives everything it missed.
+    """
+    if organization_id is None:
+        return
+    pipe.xadd(
+        deployment_events_key(organization_id),
+        {
+            "deployment_id": deployment_id,
+            "cluster_id": cluster_id,
+            "status": status.value,
+        },
+        maxlen=settings.DEPLOYMENT_EVENTS_MAXLEN,
+        approximate=True,
+    )
+
+
+async def latest_status_event_id(organization_id: int) -> str:
+    """
+    Returns the id of the organization's newest event, or "0-0" if none.
+    """
+    newest = await redis_client.xrevrange(
+        deployment_events_key(organization_id), count=1
+    )
+    return newest[0][0] if newest else "0-0"
+
+
+async def read_status_events(
+    organization_id: int, last_id: str, block: float
+) -> List[Tuple[str, dict]]:
+    """
+    Returns the organization's events after `last_id`, waiting up to `block`
+    seconds for one to arrive.
+    """
+    response = await stream_redis_client.xread(
+        {deployment_events_key(organization_id): last_id}, block=int(block * 1000)
+    )
+    return response[0][1] if response else []
+
+
+def completion_deadline(deployment: DeploymentModel) -> float:
+    """
+    Returns the epoch timestamp at which a RUNNING deployment completes.
+    """
+    finish = deployment.started_at + timedelta(seconds=deployment.required_time)
+    return finish.timestamp()
+
+
+async def index_deadlines(
+    deployments: Iterable[DeploymentModel], pipe: Optional[redis.client.Pipeline] = None
+) -> None:
+    """
+    Adds the RUNNING deployments among the given ones to the deadline index
+    and wakes the sweeper if one of them completes before its next planned
+    sweep. When a pipeline is given, the write is queued on it instead of
+    sent immediately.
     """
-    Periodically check Redis for updates and sync with the database.
+    deadlines = {
+        str(d.id): completion_deadline(d)
+        for d in deployments
+        if d.status == DeploymentStatus.RUNNING
+    }
+    if not deadlines:
+        return
+
+    if pipe is not None:
+        pipe.zadd(DEADLINES_KEY, deadlines)
+    else:
+        await redis_client.zadd(DEADLINES_KEY, deadlines)
+    deadline_waker.notify(min(deadlines.values()))
+
+
+async def rebuild_deadline_index(db: AsyncSession) -> None:
+    """
+    Re-indexes every RUNNING deployment, e.g. after a restart lost claimed
+    entries before their completion was committed.
+    """
+    running = await db.scalars(
+        select(DeploymentModel).where(
+            DeploymentModel.status == DeploymentStatus.RUNNING
+        )
+    )
+    await index_deadlines(running)
+
+
+async def pop_due_deployments(now: float) -> Dict[str, float]:
     """
-    redis_key = f"org:{current_user.organization_id}:deployments"
+    Atomically claims the deployments whose deadline has passed, returning
+    their ids mapped to their deadlines.
 
-    deployment_ids = redis_client.lrange(redis_key, 0, -1)
+    The range read and the removal run in one MULTI/EXEC, so concurrent
+    sweepers on other workers never claim the same deployment twice.
+    """
+    pipe = redis_client.pipeline()
+    pipe.zrangebyscore(DEADLINES_KEY, "-inf", now, withscores=True)
+    pipe.zremrangebyscore(DEADLINES_KEY, "-inf", now)
+    due, _ = await pipe.execute()
+    return dict(due)
 
-    for deployment_id in deployment_ids:
-        deployment_data = redis_client.hgetall(f"deployment:{deployment_id}")
 
-        if not deployment_data:
-            continue
+async def seconds_until_next_deadline() -> float:
+    """
+    Returns how long the sweeper may sleep, capped at
+    `DEADLINE_SWEEP_MAX_INTERVAL` so deadlines indexed by other workers are
+    still picked up.
+    """
+    head = await redis_client.zrange(DEADLINES_KEY, 0, 0, withscores=True)
+    if not head:
+        return settings.DEADLINE_SWEEP_MAX_INTERVAL
 
-        status = deployment_data.get("status")
-        created_at_str = deployment_data.get("created_at")
-        required_time = int(deployment_data.get("required_time", 0))
+    delay = head[0][1] - time.time()
+    return min(max(delay, 0.0), settings.DEADLINE_SWEEP_MAX_INTERVAL)
 
-        created_at = datetime.fromisoformat(created_at_str)
 
-        elapsed_time = datetime.now() - created_at
+async def update_deployment_status(db: AsyncSession) -> int:
+    """
+    Completes every deployment whose deadline has passed and starts queued
+    deployments on the clusters that freed resources.
 
-        if elapsed_time >= timedelta(seconds=required_time):
-            if status == DeploymentStatus.RUNNING:
-                redis_client.hset(
-                    f"deployment:{deployment_id}", "status", DeploymentStatus.COMPLETED
-                )
+    All due deployments of a sweep are completed with one set-based UPDATE and
+    their resources released in the same transaction, one UPDATE per cluster;
+    the Redis side is written through a single pipeline. Whichever worker
+    claims a deadline does the scheduling, so the freed clusters' queues are
+    first topped up with PENDING rows from the database, including those
+    submitted through other workers.
+
+    If the transaction fails, the claimed deadlines are put back so the next
+    sweep retries them; completing a deployment twice is a no-op.
+
+    Returns:
+        The number of deployments this sweep completed.
+    """
+    due = await pop_due_deployments(time.time())
+    if not due:
+        return 0
 
-                updated_status = redis_client.hget(
-                    f"deployment:{deployment_id}", "status"
-                )
+    try:
+        completed = await crud.complete_deployments(
+            db, [int(deployment_id) for deployment_id in due], datetime.now()
+        )
+        freed: Dict[int, List[float]] = {}
+        for row in completed:
+            totals = freed.setdefault(row.cluster_id, [0.0, 0.0, 0.0, 0])
+            totals[0] += row.cpu_required
+            totals[1] += row.ram_required
+            totals[2] += row.gpu_required
+            totals[3] += 1
+        for cluster_id, (cpu, ram, gpu, count) in freed.items():
+            await scheduler.release(db, cluster_id, cpu, ram, gpu, completed=count)
+        await db.commit()
+    except BaseException:
+        await db.rollback()
+        await redis_client.zadd(DEADLINES_KEY, due)
+        raise
 
-                deployment = (
-                    db.query(DeploymentModel).filter_by(id=deployment_id).first()
-                )
-                if deployment:
-                    deployment.status = updated_status
-                    deployment.completed_at = datetime.now()
-                    db.add(deployment)
-                    db.commit()
+    # Freed resources may let queued deployments start.
+    await scheduler.refresh(db, list(freed))
+    started: List[DeploymentModel] = []
+    for cluster_id in freed:
+        started.extend(await scheduler.schedule(db, cluster_id))
 
-                redis_client.delete(f"deployment:{deployment_id}")
+    pipe = redis_client.pipeline(transaction=False)
+    for deployment_id in due:
+        pipe.delete(f"deployment:{deployment_id}")
+    for row in completed:
+        queue_status_event(
+            pipe,
+            row.organization_id,
+            row.id,
+            row.cluster_id,
+            DeploymentStatus.COMPLETED,
+        )
+    for deployment in started:
+        cache_deployment(pipe, deployment)
+        queue_status_event(
+            pipe,
+            deployment.organization_id,
+            deployment.id,
+            deployment.cluster_id,
+            deployment.status,
+        )
+    await index_deadlines(started, pipe)
+    await pipe.execute()
+    return len(completed)
@@ -0,0 +1,603 @@
+import asyncio
+import heapq
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import crud
+from app.core.config import settings
+from app.core.fairshare import FairShare, fair_share_from_settings
+from app.core.placement import capacity_view
+from app.models.deployment import Deployment, DeploymentStatus
+
+
+class QueuedDeployment(NamedTuple):
+    """
+    Heap entry for a PENDING deployment. Tuples compare field by field, so the
+    field order defines the queue order: highest priority first, then oldest.
+    """
+
+    neg_priority: int
+    created_at: datetime
+    deployment_id: int
+    cpu_required: float
+    ram_required: float
+    gpu_required: float
+    required_time: int
+    user_id: Optional[int]
+
+
+def choose_victims(candidates: Sequence, need: Tuple[float, float, float]) -> List:
+    """
+    Picks a minimal set of RUNNING deployments whose eviction frees `need`
+    (cpu, ram, gpu).
+
+    Candidates are taken in the given order, lowest priority first, until the
+    need is covered; then, from the most important pick down, any deployment
+    the others already cover for is spared. No deployment can be dropped
+    from the result without leaving the need uncovered.
+
+    Returns:
+        The deployments to evict, or an empty list if all candidates together
+        cannot cover the need.
+    """
+
+    def covers(chosen) -> bool:
+        return (
+            sum(c.cpu_required for c in chosen) >= need[0]
+            and sum(c.ram_required for c in chosen) >= need[1]
+            and sum(c.gpu_required for c in chosen) >= need[2]
+        )
+
+    chosen = []
+    for candidate in candidates:
+        if covers(chosen):
+            break
+        chosen.append(candidate)
+    if not covers(chosen):
+        return []
+
+    for candidate in reversed(list(chosen)):
+        rest = [c for c in chosen if c is not candidate]
+        if covers(rest):
+            chosen = rest
+    return chosen
+
+
+def projected_start(
+    available: Sequence[float],
+    need: Tuple[float, float, float],
+    running: Sequence,
+    now: datetime,
+) -> Optional[datetime]:
+    """
+    Earliest time the cluster is sure to have `need` (cpu, ram, gpu) free,
+    from the `available` resources and the RUNNING deployments' declared
+    `required_time`, assuming nothing else starts meanwhile. Deployments past
+    their deadline count as ending `now`.
+
+    Returns:
+        That time, or None if even every RUNNING deployment ending would not
+        free enough.
+    """
+    cpu, ram, gpu = available
+    if cpu >= need[0] and ram >= need[1] and gpu >= need[2]:
+        return now
+
+    def end(reservation) -> datetime:
+        deadline = reservation.started_at + timedelta(seconds=reservation.required_time)
+        return max(deadline, now)
+
+    for reservation in sorted(running, key=end):
+        cpu += reservation.cpu_required
+        ram += reservation.ram_required
+        gpu += reservation.gpu_required
+        if cpu >= need[0] and ram >= need[1] and gpu >= need[2]:
+            return end(reservation)
+    return None
+
+
+def _unused(reservation, now: datetime) -> float:
+    """
+    Fraction of a RUNNING deployment's `required_time` still ahead of it.
+    """
+    ran = (now - reservation.started_at).total_seconds()
+    return max(1 - ran / (reservation.required_time or 1), 0.0)
+
+
+class ClusterQueue:
+    """
+    PENDING deployments of one cluster in scheduling order.
+
+    Without fair share this is a single heap in `QueuedDeployment` order.
+    With it, each submitter has a heap in that order and the head of the
+    queue is whichever submitter's head ranks first under the fair-share
+    policy, so the order follows usage as it changes without re-sorting
+    anything; finding the head costs one rank per submitter with work queued.
+    """
+
+    def __init__(self, fair_share: Optional[FairShare] = None) -> None:
+        self._fair_share = fair_share
+        self._heaps: Dict[Optional[int], List[QueuedDeployment]] = {}
+        self._size = 0
+
+    def _heap_key(self, entry: QueuedDeployment) -> Optional[int]:
+        return entry.user_id if self._fair_share else None
+
+    def _rank(self, entry: QueuedDeployment) -> tuple:
+        return self._fair_share.rank(entry) if self._fair_share else entry
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self) -> Iterator[QueuedDeployment]:
+        for heap in self._heaps.values():
+            yield from heap
+
+    def push(self, entry: QueuedDeployment) -> None:
+        heapq.heappush(self._heaps.setdefault(self._heap_key(entry), []), entry)
+        self._size += 1
+
+    def head(self) -> QueuedDeployment:
+        return min((heap[0] for heap in self._heaps.values()), key=self._rank)
+
+    def pop(self) -> QueuedDeployment:
+        key = self._heap_key(self.head())
+        heap = self._heaps[key]
+        entry = heapq.heappop(heap)
+        if not heap:
+            del self._heaps[key]
+        self._size -= 1
+        return entry
+
+    def ordered(self, limit: int) -> List[QueuedDeployment]:
+        """
+        The first `limit` entries in scheduling order at current usage.
+        """
+        return heapq.nsmallest(limit, self, key=self._rank)
+
+    def remove(self, deployment_ids: Iterable[int]) -> None:
+        removed = set(deployment_ids)
+        entries = [entry for entry in self if entry.deployment_id not in removed]
+        self._heaps = {}
+        self._size = 0
+        for entry in entries:
+            self.push(entry)
+
+
+class DeploymentScheduler:
+    """
+    Keeps a priority queue of PENDING deployments per cluster and moves them to
+    RUNNING as soon as the cluster has enough free resources.
+
+    The database stays the source of truth: the queues are rebuilt from PENDING
+    rows on startup, and each admission reserves resources with a conditional
+    UPDATE, so several workers can schedule the same cluster safely. Within a
+    worker, each cluster has an asyncio lock so only one coroutine at a time
+    drains its queue; heap operations themselves never await.
+
+    With `preemption`, a high-priority deployment that does not fit may evict
+    lower-priority RUNNING ones, which go back to their cluster's queue. With
+    `backfill`, queued deployments behind a head that does not fit may start
+    out of order if they are sure to finish before the head can start. With
+    `fair_share`, queues are ordered by priority plus a bonus for submitters
+    with little recent usage, charged as deployments start. Usage is tracked
+    per worker from the admissions it makes.
+    """
+
+    def __init__(
+        self,
+        preemption: bool = False,
+        backfill: bool = False,
+        fair_share: Optional[FairShare] = None,
+    ) -> None:
+        self._preemption = preemption
+        self._backfill = backfill
+        self._fair_share = fair_share
+        self._queues: Dict[int, ClusterQueue] = {}
+        self._cluster_locks: Dict[int, asyncio.Lock] = {}
+
+    @staticmethod
+    def _entry(deployment: Deployment) -> QueuedDeployment:
+        return QueuedDeployment(
+            neg_priority=-(deployment.priority or 0),
+            created_at=deployment.created_at,
+            deployment_id=deployment.id,
+            cpu_required=deployment.cpu_required,
+            ram_required=deployment.ram_required,
+            gpu_required=deployment.gpu_required,
+            required_time=deployment.required_time,
+            user_id=deployment.user_id,
+        )
+
+    def _charge(self, entries: Iterable[QueuedDeployment], fraction: float) -> None:
+        if self._fair_share:
+            for entry in entries:
+                self._fair_share.charge(entry, fraction)
+
+    def _cluster_queue(self, cluster_id: int) -> ClusterQueue:
+        queue = self._queues.get(cluster_id)
+        if queue is None:
+            queue = self._queues[cluster_id] = ClusterQueue(self._fair_share)
+        return queue
+
+    def _cluster_lock(self, cluster_id: int) -> asyncio.Lock:
+        return self._cluster_locks.setdefault(cluster_id, asyncio.Lock())
+
+    async def load(self, db: AsyncSession) -> None:
+        """
+        Rebuilds every cluster queue from the PENDING deployments in the database.
+        """
+        pending = await db.scalars(
+            select(Deployment).where(Deployment.status == DeploymentStatus.PENDING)
+        )
+        self._queues = {}
+        for deployment in pending:
+            self._cluster_queue(deployment.cluster_id).push(self._entry(deployment))
+
+    async def refresh(self, db: AsyncSession, cluster_ids: List[int]) -> None:
+        """
+        Adds the PENDING deployments of the given clusters that are missing
+        from their queues, such as those accepted by another worker, so that
+        scheduling here considers them too.
+        """
+        if not cluster_ids:
+            return
+        pending = await crud.get_pending_deployments(db, cluster_ids)
+        queued = {
+            entry.deployment_id
+            for cluster_id in cluster_ids
+            for entry in self._queues.get(cluster_id, ())
+        }
+        for deployment in pending:
+            if deployment.id not in queued:
+                self._cluster_queue(deployment.cluster_id).push(self._entry(deployment))
+
+    def enqueue(self, deployment: Deployment) -> None:
+        """
+        Adds a PENDING deployment to its cluster's queue.
+        """
+        self._cluster_queue(deployment.cluster_id).push(self._entry(deployment))
+
+    def queue_depth(self, cluster_id: int) -> int:
+        queue = self._queues.get(cluster_id)
+        return len(queue) if queue else 0
+
+    def pending_summary(self) -> Tuple[int, Optional[datetime]]:
+        """
+        Returns how many deployments are queued across all clusters and the
+        creation time of the oldest one.
+        """
+        queued = sum(len(queue) for queue in self._queues.values())
+        oldest = min(
+            (entry.created_at for queue in self._queues.values() for entry in queue),
+            default=None,
+        )
+        return queued, oldest
+
+    async def _admit(
+        self, db: AsyncSession, cluster_id: int, queue: ClusterQueue
+    ) -> List[int]:
+        """
+        Starts the run of queue heads that fits the cluster's free resources.
+
+        Returns:
+            The ids of the deployments moved to RUNNING.
+        """
+        available = await crud.get_cluster_availability(db, cluster_id)
+        if available is None:
+            await db.commit()
+            return []
+
+        # Pop before awaiting so entries enqueued meanwhile cannot take the
+        # heads' places; anything not started is pushed back.
+        cpu_left, ram_left, gpu_left = available
+        batch: List[QueuedDeployment] = []
+        while queue:
+            head = queue.head()
+            if (
+                head.cpu_required > cpu_left
+                or head.ram_required > ram_left
+                or head.gpu_required > gpu_left
+            ):
+                break
+            batch.append(queue.pop())
+            # Charged as it is taken, so fair share sees it for the next head
+            self._charge([head], 1.0)
+            cpu_left -= head.cpu_required
+            ram_left -= head.ram_required
+            gpu_left -= head.gpu_required
+
+        if not batch:
+            # Nothing was changed; end the transaction without a rollback,
+            # which would expire the caller's objects.
+            await db.commit()
+            return []
+        return await self._start(db, cluster_id, queue, batch)
+
+    async def _admit_backfill(
+        self, db: AsyncSession, cluster_id: int, queue: ClusterQueue
+    ) -> List[int]:
+        """
+        Starts queued deployments behind a head that does not fit, highest
+        priority first, when they fit now and their `required_time` ends
+        before the head's projected start, so the head is never delayed.
+
+        Returns:
+            The ids of the deployments moved to RUNNING.
+        """
+        head = queue.head()
+        available = await crud.get_cluster_availability(db, cluster_id)
+        if available is None:
+            await db.commit()
+            return []
+        now = datetime.now()
+        start_by = projected_start(
+            available,
+            (head.cpu_required, head.ram_required, head.gpu_required),
+            await crud.get_running_reservations(db, cluster_id),
+            now,
+        )
+        if start_by is None:
+            await db.commit()
+            return []
+
+        cpu_left, ram_left, gpu_left = available
+        batch: List[QueuedDeployment] = []
+        for entry in queue.ordered(settings.BACKFILL_MAX_CANDIDATES)[1:]:
+            if (
+                entry.cpu_required > cpu_left
+                or entry.ram_required > ram_left
+                or entry.gpu_required > gpu_left
+                or now + timedelta(seconds=entry.required_time) > start_by
+            ):
+                continue
+            batch.append(entry)
+            cpu_left -= entry.cpu_required
+            ram_left -= entry.ram_required
+            gpu_left -= entry.gpu_required
+
+        if not batch:
+            await db.commit()
+            return []
+        queue.remove(entry.deployment_id for entry in batch)
+        self._charge(batch, 1.0)
+        return await self._start(db, cluster_id, queue, batch)
+
+    async def _start(
+        self,
+        db: AsyncSession,
+        cluster_id: int,
+        queue: ClusterQueue,
+        batch: List[QueuedDeployment],
+    ) -> List[int]:
+        """
+        Reserves the summed requirements of `batch`, already taken off the
+        queue and charged, and moves its deployments to RUNNING in one
+        transaction. If the reservation fails the batch goes back on the queue.
+
+        Returns:
+            The ids of the deployments moved to RUNNING.
+        """
+        cpu = sum(entry.cpu_required for entry in batch)
+        ram = sum(entry.ram_required for entry in batch)
+        gpu = sum(entry.gpu_required for entry in batch)
+        if not await crud.reserve_cluster_resources(
+            db,
+            cluster_id,
+            cpu,
+            ram,
+            gpu,
+            pending_count=-len(batch),
+            running_count=len(batch),
+        ):
+            # Another worker took the resources since they were read.
+            await db.commit()
+            self._charge(batch, -1.0)
+            for entry in batch:
+                queue.push(entry)
+            return []
+
+        started_ids = await crud.transition_deployments(
+            db,
+            [entry.deployment_id for entry in batch],
+            DeploymentStatus.PENDING,
+            DeploymentStatus.RUNNING,
+            started_at=datetime.now(),
+        )
+
+        # Deployments already started or removed elsewhere hand their share
+        # of the reservation back in the same transaction.
+        transitioned = set(started_ids)
+        skipped = [e for e in batch if e.deployment_id not in transitioned]
+        self._charge(skipped, -1.0)
+        if skipped:
+            await crud.release_cluster_resources(
+                db,
+                cluster_id,
+                sum(entry.cpu_required for entry in skipped),
+                sum(entry.ram_required for entry in skipped),
+                sum(entry.gpu_required for entry in skipped),
+                pending_count=len(skipped),
+                running_count=-len(skipped),
+            )
+        await db.commit()
+
+        for entry in batch:
+            if entry.deployment_id in transitioned:
+                capacity_view.adjust(
+                    cluster_id,
+                    -entry.cpu_required,
+                    -entry.ram_required,
+                    -entry.gpu_required,
+                )
+        return started_ids
+
+    async def _preempt(
+        self, db: AsyncSession, cluster_id: int, queue: ClusterQueue
+    ) -> List[int]:
+        """
+        Evicts a minimal set of lower-priority RUNNING deployments so the head
+        of the queue fits, and re-queues them as PENDING. With fair share, a
+        deployment is only evicted if it will rank behind the head once back
+        in the queue.
+
+        Returns:
+            The ids of the evicted deployments.
+        """
+        head = queue.head()
+        # It may have been started, cancelled or removed by another worker
+        # since it was queued; nothing is evicted for it then. Otherwise its
+        # row stays locked, and PENDING, until the victims are committed.
+        if not await crud.lock_pending_deployment(db, head.deployment_id):
+            await db.commit()
+            queue.pop()
+            return []
+        available = await crud.get_cluster_availability(db, cluster_id)
+        if available is None:
+            await db.commit()
+            return []
+        need = (
+            head.cpu_required - available.cpu_available,
+            head.ram_required - available.ram_available,
+            head.gpu_required - available.gpu_available,
+        )
+        candidates = await crud.get_preemption_candidates(
+            db, cluster_id, -head.neg_priority, settings.PREEMPTION_MAX_VICTIMS
+        )
+        now = datetime.now()
+        if self._fair_share:
+            # A victim goes back to the queue with its unused time refunded;
+            # if it would then rank ahead of the head, it would be restarted
+            # first and evicted again, over and over.
+            head_rank = self._fair_share.rank(head)
+            candidates = [
+                candidate
+                for candidate in candidates
+                if self._fair_share.rank(
+                    self._entry(candidate),
+                    _unused(candidate, now) * self._fair_share.cost(candidate),
+                )
+                > head_rank
+            ]
+        victims = choose_victims(candidates, need)
+        if not victims:
+            await db.commit()
+            return []
+
+        evicted_ids = set(
+            await crud.transition_deployments(
+                db,
+                [victim.id for victim in victims],
+                DeploymentStatus.RUNNING,
+                DeploymentStatus.PENDING,
+                started_at=None,
+            )
+        )
+        evicted = [victim for victim in victims if victim.id in evicted_ids]
+        if evicted:
+            cpu = sum(victim.cpu_required for victim in evicted)
+            ram = sum(victim.ram_required for victim in evicted)
+            gpu = sum(victim.gpu_required for victim in evicted)
+            await crud.release_cluster_resources(
+                db,
+                cluster_id,
+                cpu,
+                ram,
+                gpu,
+                running_count=-len(evicted),
+                pending_count=len(evicted),
+            )
+        await db.commit()
+
+        for victim in evicted:
+            capacity_view.adjust(
+                cluster_id,
+                victim.cpu_required,
+                victim.ram_required,
+                victim.gpu_required,
+            )
+            entry = self._entry(victim)
+            # Refund the part of its charge the victim will not get to run
+            self._charge([entry], -_unused(victim, now))
+            queue.push(entry)
+        return [victim.id for victim in evicted]
+
+    async def schedule(self, db: AsyncSession, cluster_id: int) -> List[Deployment]:
+        """
+        Starts queued deployments on the cluster in priority order until the head
+        of the queue no longer fits.
+
+        Admission is set-based: the run of queue heads that fits the cluster's
+        free resources is reserved with one conditional UPDATE of their summed
+        requirements and flipped to RUNNING with one more, in a single short
+        transaction, however many deployments start.
+
+        With preemption enabled, a head that still does not fit may evict
+        lower-priority RUNNING deployments back to the queue, after which
+        admission runs once more. With backfill enabled, a head that still
+        does not fit lets shorter deployments behind it use the idle
+        resources until it can start.
+
+        Returns:
+            The deployments whose status changed: those moved to RUNNING and
+            any evicted back to PENDING.
+        """
+        changed_ids: List[int] = []
+
+        async with self._cluster_lock(cluster_id):
+            queue = self._queues.get(cluster_id)
+            if not queue:
+                return []
+
+            changed_ids += await self._admit(db, cluster_id, queue)
+            if self._preemption and queue:
+                evicted_ids = await self._preempt(db, cluster_id, queue)
+                if evicted_ids:
+                    changed_ids += evicted_ids
+                    changed_ids += await self._admit(db, cluster_id, queue)
+            if self._backfill and queue:
+                changed_ids += await self._admit_backfill(db, cluster_id, queue)
+
+        if not changed_ids:
+            return []
+        changed = await db.scalars(
+            select(Deployment)
+            .where(Deployment.id.in_(set(changed_ids)))
+            .execution_options(populate_existing=True)
+        )
+        return changed.all()
+
+    async def release(
+        self,
+        db: AsyncSession,
+        cluster_id: int,
+        cpu: float,
+        ram: float,
+        gpu: float,
+        completed: int = 0,
+    ) -> None:
+        """
+        Returns the resources of `completed` finished deployments to their
+        cluster. The caller is responsible for committing and for calling
+        `schedule` afterwards.
+        """
+        await crud.release_cluster_resources(
+            db,
+            cluster_id,
+            cpu,
+            ram,
+            gpu,
+            running_count=-completed,
+            completed_count=completed,
+        )
+        capacity_view.adjust(cluster_id, cpu, ram, gpu)
+
+
+scheduler = DeploymentScheduler(
+    preemption=settings.PREEMPTION_ENABLED,
+    backfill=settings.BACKFILL_ENABLED,
+    fair_share=fair_share_from_settings() if settings.FAIR_SHARE_ENABLED else None,
+)
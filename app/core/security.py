@@ -1,7 +1,16 @@
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional
 from passlib.context import CryptContext
+from app.core.config import settings
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# Upper bounds, in seconds, of the hash latency histogram buckets
+HASH_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, float("inf"))
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """
@@ -28,3 +37,106 @@ def get_password_hash(password: str) -> str:
         The hashed password as a string.
     """
     return pwd_context.hash(password)
+
+
+class PasswordHasherBusy(Exception):
+    """
+    Raised when the password hasher already has its maximum number of
+    operations in flight.
+    """
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt hashing and verification in a dedicated, size-limited process
+    pool so that they never block the event loop.
+
+    At most `max_pending` operations may be running or queued at once; beyond
+    that, calls fail fast with `PasswordHasherBusy` instead of piling up.
+    """
+
+    def __init__(self, workers: int, max_pending: int) -> None:
+        self._workers = workers
+        self._max_pending = max_pending
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._in_flight = 0
+        self._rejected = 0
+        self._completed = 0
+        self._latency_sum = 0.0
+        self._latency_buckets = [0] * len(HASH_LATENCY_BUCKETS)
+
+    async def _run(self, func, *args):
+        if self._in_flight >= self._max_pending:
+            self._rejected += 1
+            raise PasswordHasherBusy()
+
+        if self._executor is None:
+            # Forking a process that runs an event loop, DB and Redis pools
+            # can copy held locks and shared sockets into the workers; spawn
+            # starts them clean, and they only need this module.
+            self._executor = ProcessPoolExecutor(
+                max_workers=self._workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+
+        self._in_flight += 1
+        started = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, func, *args)
+        finally:
+            self._in_flight -= 1
+            self._observe(time.perf_counter() - started)
+
+    def _observe(self, seconds: float) -> None:
+        self._completed += 1
+        self._latency_sum += seconds
+        for i, bound in enumerate(HASH_LATENCY_BUCKETS):
+            if seconds <= bound:
+                self._latency_buckets[i] += 1
+                break
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        """
+        Verifies a password against its hash in the process pool.
+
+        Raises:
+            PasswordHasherBusy: Too many hashing operations are in flight
+        """
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    async def hash(self, password: str) -> str:
+        """
+        Hashes a password in the process pool.
+
+        Raises:
+            PasswordHasherBusy: Too many hashing operations are in flight
+        """
+        return await self._run(get_password_hash, password)
+
+    def stats(self) -> Dict:
+        """
+        Returns the current queue depth and cumulative latency metrics.
+        """
+        return {
+            "workers": self._workers,
+            "in_flight": self._in_flight,
+            "queue_depth": max(self._in_flight - self._workers, 0),
+            "rejected": self._rejected,
+            "completed": self._completed,
+            "latency_seconds_sum": self._latency_sum,
+            "latency_seconds_buckets": dict(
+                zip(HASH_LATENCY_BUCKETS, self._latency_buckets)
+            ),
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher(
+    workers=settings.PASSWORD_HASH_WORKERS,
+    max_pending=settings.PASSWORD_HASH_MAX_PENDING,
+)
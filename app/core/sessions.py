@@ -0,0 +1,214 @@
+import json
+import secrets
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from starlette.datastructures import MutableHeaders
+from starlette.requests import HTTPConnection
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+from app.core.redis import redis_client
+
+
+class SessionBackend(ABC):
+    """
+    Storage for server-side sessions, keyed by an opaque session id.
+    """
+
+    @abstractmethod
+    async def load(self, session_id: str, max_age: int) -> Optional[dict]:
+        """
+        Returns the session's data and extends its expiry to `max_age` seconds
+        from now, or None if the session does not exist.
+        """
+
+    @abstractmethod
+    async def save(self, session_id: str, data: dict, max_age: int) -> None:
+        pass
+
+    @abstractmethod
+    async def delete(self, session_id: str) -> None:
+        pass
+
+
+class RedisSessionBackend(SessionBackend):
+    """
+    Keeps each session as a JSON string under `session:{id}` with a TTL, so
+    every worker and host sees the same sessions and a logout on one of them
+    revokes the session everywhere.
+    """
+
+    @staticmethod
+    def _key(session_id: str) -> str:
+        return f"session:{session_id}"
+
+    async def load(self, session_id: str, max_age: int) -> Optional[dict]:
+        # GETEX reads the session and slides its expiry in one round trip.
+        raw = await redis_client.getex(self._key(session_id), ex=max_age)
+        return json.loads(raw) if raw is not None else None
+
+    async def save(self, session_id: str, data: dict, max_age: int) -> None:
+        await redis_client.set(self._key(session_id), json.dumps(data), ex=max_age)
+
+    async def delete(self, session_id: str) -> None:
+        await redis_client.delete(self._key(session_id))
+
+
+class MemorySessionBackend(SessionBackend):
+    """
+    Keeps sessions in the process. Only suitable for a single worker.
+    """
+
+    def __init__(self) -> None:
+        self._sessions: Dict[str, Tuple[float, dict]] = {}
+
+    async def load(self, session_id: str, max_age: int) -> Optional[dict]:
+        entry = self._sessions.get(session_id)
+        if entry is None or entry[0] <= time.monotonic():
+            self._sessions.pop(session_id, None)
+            return None
+        self._sessions[session_id] = (time.monotonic() + max_age, entry[1])
+        return dict(entry[1])
+
+    async def save(self, session_id: str, data: dict, max_age: int) -> None:
+        self._sessions[session_id] = (time.monotonic() + max_age, dict(data))
+
+    async def delete(self, session_id: str) -> None:
+        self._sessions.pop(session_id, None)
+
+
+SESSION_BACKENDS = {
+    "redis": RedisSessionBackend,
+    "memory": MemorySessionBackend,
+}
+
+
+class SessionReadCache:
+    """
+    Small LRU cache of recently read sessions with a short TTL.
+
+    A hit skips the backend round trip, so a session revoked on another worker
+    stays readable here for at most `ttl` seconds, and its sliding expiry is
+    refreshed at most once per `ttl`. Writes and deletes on this worker update
+    the cache directly.
+    """
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, dict]]" = OrderedDict()
+
+    def get(self, session_id: str) -> Optional[dict]:
+        entry = self._entries.get(session_id)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._entries[session_id]
+            return None
+        self._entries.move_to_end(session_id)
+        return dict(entry[1])
+
+    def set(self, session_id: str, data: dict) -> None:
+        if self._ttl <= 0:
+            return
+        self._entries[session_id] = (time.monotonic() + self._ttl, dict(data))
+        self._entries.move_to_end(session_id)
+        while len(self._entries) > self._maxsize:
+            self._entries.popitem(last=False)
+
+    def discard(self, session_id: str) -> None:
+        self._entries.pop(session_id, None)
+
+
+class ServerSessionMiddleware:
+    """
+    Drop-in replacement for Starlette's `SessionMiddleware` that keeps the
+    session data on the server and only puts an opaque, constant-size id in
+    the cookie.
+
+    Ids are always generated here: a cookie naming an unknown or expired
+    session starts a new session under a fresh id. Each request slides the
+    session's expiry to `max_age` seconds from now.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        backend: SessionBackend,
+        session_cookie: str = "session",
+        max_age: int = 14 * 24 * 60 * 60,
+        path: str = "/",
+        same_site: str = "lax",
+        https_only: bool = False,
+        cache_size: int = 10000,
+        cache_ttl: float = 2.0,
+    ) -> None:
+        self.app = app
+        self.backend = backend
+        self.session_cookie = session_cookie
+        self.max_age = max_age
+        self.cache = SessionReadCache(cache_size, cache_ttl)
+        self.cookie_flags = f"httponly; samesite={same_site}"
+        if https_only:
+            self.cookie_flags += "; secure"
+        self.path = path
+
+    async def _load(self, session_id: str) -> Optional[dict]:
+        data = self.cache.get(session_id)
+        if data is None:
+            data = await self.backend.load(session_id, self.max_age)
+            if data is not None:
+                self.cache.set(session_id, data)
+        return data
+
+    def _cookie(self, value: str, max_age: int) -> str:
+        return (
+            f"{self.session_cookie}={value}; path={self.path}; "
+            f"Max-Age={max_age}; {self.cookie_flags}"
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        connection = HTTPConnection(scope)
+        session_id = connection.cookies.get(self.session_cookie)
+        data = await self._load(session_id) if session_id else None
+        if data is None:
+            session_id = None
+            data = {}
+        initial = dict(data)
+        scope["session"] = data
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal session_id
+            if message["type"] != "http.response.start":
+                await send(message)
+                return
+
+            headers = MutableHeaders(scope=message)
+            session = scope["session"]
+            if session:
+                if session != initial or session_id is None:
+                    session_id = session_id or secrets.token_urlsafe(32)
+                    await self.backend.save(session_id, session, self.max_age)
+                    self.cache.set(session_id, session)
+                headers.append("Set-Cookie", self._cookie(session_id, self.max_age))
+            elif session_id is not None:
+                await self.backend.delete(session_id)
+                self.cache.discard(session_id)
+                headers.append("Set-Cookie", self._cookie("null", 0))
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+def session_backend() -> SessionBackend:
+    """
+    Builds the session backend named by `SESSION_BACKEND`.
+    """
+    return SESSION_BACKENDS[settings.SESSION_BACKEND]()
@@ -0,0 +1,240 @@
+import heapq
+import math
+from datetime import datetime
+from typing import NamedTuple, Sequence
+
+import numpy as np
+
+from app.core.placement import CapacityIndex
+from app.models.deployment import DeploymentStatus
+
+
+class Projection(NamedTuple):
+    """
+    Outcome of a simulation. Times are seconds from the simulation's `now`.
+    """
+
+    cluster_ids: np.ndarray  # Cluster of each proposed deployment, -1 if none
+    starts: np.ndarray  # NaN for deployments that would never start
+    ends: np.ndarray
+    times: np.ndarray  # Timeline sample times
+    used: np.ndarray  # (len(times), 3) cpu, ram, gpu in use at each sample
+    limits: np.ndarray  # cpu, ram, gpu limits summed over the clusters
+
+
+def _admit(
+    limits: np.ndarray,
+    available: np.ndarray,
+    running_rows: np.ndarray,
+    running_ends: np.ndarray,
+    running_shapes: np.ndarray,
+    rows: np.ndarray,
+    shapes: np.ndarray,
+    durations: np.ndarray,
+    order: np.ndarray,
+) -> np.ndarray:
+    """
+    Walks the queued deployments in `order` and returns when each starts.
+
+    Each cluster keeps a clock and a heap of the ends of what it runs; a
+    deployment that does not fit advances its cluster's clock to the next
+    ends until it does, so a head that cannot start blocks the ones behind
+    it, as in the scheduler. The work per deployment is a few heap operations
+    on plain floats, since every start depends on the ones before it.
+    """
+    free = available.tolist()
+    limit_rows = limits.tolist()
+    clocks = [0.0] * len(limits)
+    heaps = [[] for _ in range(len(limits))]
+    for row, end, shape in zip(
+        running_rows.tolist(), running_ends.tolist(), running_shapes.tolist()
+    ):
+        heaps[row].append((end, *shape))
+    for heap in heaps:
+        heapq.heapify(heap)
+
+    starts = np.full(len(rows), np.nan)
+    rows_list, shapes_list = rows.tolist(), shapes.tolist()
+    durations_list = durations.tolist()
+    for k in order.tolist():
+        row = rows_list[k]
+        if row < 0:
+            continue
+        cpu, ram, gpu = shapes_list[k]
+        limit = limit_rows[row]
+        if not (cpu <= limit[0] and ram <= limit[1] and gpu <= limit[2]):
+            continue
+
+        f, heap, clock = free[row], heaps[row], clocks[row]
+        while not (f[0] >= cpu and f[1] >= ram and f[2] >= gpu):
+            if not heap:
+                # Nothing left to end, so the cluster's free resources were
+                # inconsistent with what runs on it; nothing behind starts.
+                clock = math.inf
+                break
+            end, released_cpu, released_ram, released_gpu = heapq.heappop(heap)
+            clock = max(clock, end)
+            f[0] += released_cpu
+            f[1] += released_ram
+            f[2] += released_gpu
+        clocks[row] = clock
+        if clock == math.inf:
+            continue
+
+        starts[k] = clock
+        f[0] -= cpu
+        f[1] -= ram
+        f[2] -= gpu
+        heapq.heappush(heap, (clock + durations_list[k], cpu, ram, gpu))
+    return starts
+
+
+def _timeline(
+    initial: np.ndarray,
+    event_times: np.ndarray,
+    event_deltas: np.ndarray,
+    points: int,
+) -> tuple:
+    """
+    Samples resources in use at `points` evenly spaced times up to the last
+    event, from the resources in use now and every later change, with one
+    sort and one cumulative sum.
+    """
+    if not len(event_times):
+        return np.zeros(points), np.tile(initial, (points, 1))
+    times = np.linspace(0.0, float(event_times.max()), points)
+    order = np.argsort(event_times, kind="stable")
+    used = initial + np.cumsum(event_deltas[order], axis=0)
+    # Changes at a sample's time are already applied at that sample
+    reached = np.searchsorted(event_times[order], times, side="right")
+    samples = np.where(
+        (reached > 0)[:, None], used[np.maximum(reached - 1, 0)], initial
+    )
+    return times, samples
+
+
+def simulate(
+    index: CapacityIndex,
+    workload: Sequence,
+    deployments: Sequence,
+    now: datetime,
+    points: int,
+) -> Projection:
+    """
+    Projects when proposed deployments would start and end if submitted
+    `now`, and how much of the clusters' resources would be in use over
+    time.
+
+    Args:
+        index: The organization's clusters.
+        workload: Its RUNNING and PENDING deployments, as rows from
+            `crud.get_organization_workload`. RUNNING ones end after their
+            `required_time`, or now if they are past it; PENDING ones are
+            queued ahead of the proposed ones of the same priority.
+        deployments: The proposed `DeploymentCreate` items. Those without a
+            `cluster_id` are placed as a batch submission would place them.
+        now: The time submission is assumed at.
+        points: Number of timeline samples.
+
+    Deployments are admitted in priority order, oldest first within a
+    priority, as the scheduler does without preemption, backfill or fair
+    share.
+    """
+    running = [row for row in workload if row.status == DeploymentStatus.RUNNING]
+    pending = [row for row in workload if row.status != DeploymentStatus.RUNNING]
+
+    running_rows = index.rows([row.cluster_id for row in running])
+    running_shapes = np.array(
+        [(r.cpu_required, r.ram_required, r.gpu_required) for r in running],
+        dtype=float,
+    ).reshape(-1, 3)
+    running_ends = np.array(
+        [
+            (
+                (r.started_at - now).total_seconds() + r.required_time
+                if r.started_at is not None
+                else 0.0
+            )
+            for r in running
+        ],
+        dtype=float,
+    )
+    running_ends = np.maximum(running_ends, 0.0)
+    known = running_rows >= 0
+    running_rows = running_rows[known]
+    running_ends = running_ends[known]
+    running_shapes = running_shapes[known]
+
+    proposed = np.array(
+        [(d.cpu_required, d.ram_required, d.gpu_required) for d in deployments],
+        dtype=float,
+    ).reshape(-1, 3)
+    cluster_ids = [d.cluster_id for d in deployments]
+    unplaced = [k for k, cluster_id in enumerate(cluster_ids) if cluster_id is None]
+    if unplaced:
+        for k, cluster_id in zip(
+            unplaced, index.place_many(proposed[unplaced].tolist())
+        ):
+            cluster_ids[k] = cluster_id
+
+    queued = len(pending)
+    rows = np.concatenate(
+        [index.rows([row.cluster_id for row in pending]), index.rows(cluster_ids)]
+    )
+    shapes = np.concatenate(
+        [
+            np.array(
+                [(r.cpu_required, r.ram_required, r.gpu_required) for r in pending],
+                dtype=float,
+            ).reshape(-1, 3),
+            proposed,
+        ]
+    )
+    durations = np.array(
+        [r.required_time for r in pending] + [d.required_time for d in deployments],
+        dtype=float,
+    )
+    priorities = np.array(
+        [r.priority or 0 for r in pending] + [d.priority for d in deployments],
+        dtype=np.int64,
+    )
+    submitted = np.concatenate(
+        [
+            np.array(
+                [(r.created_at - now).total_seconds() for r in pending], dtype=float
+            ),
+            np.zeros(len(deployments)),
+        ]
+    )
+    # Highest priority first, then oldest; lexsort is stable, so proposed
+    # deployments keep their submission order among equals.
+    order = np.lexsort((submitted, -priorities))
+
+    starts = _admit(
+        index.limits,
+        index.available,
+        running_rows,
+        running_ends,
+        running_shapes,
+        rows,
+        shapes,
+        durations,
+        order,
+    )
+    ends = starts + durations
+
+    started = ~np.isnan(starts)
+    event_times = np.concatenate([running_ends, starts[started], ends[started]])
+    event_deltas = np.concatenate([-running_shapes, shapes[started], -shapes[started]])
+    in_use = np.nansum(index.limits - index.available, axis=0)
+    times, used = _timeline(in_use, event_times, event_deltas, points)
+
+    return Projection(
+        # Row -1 picks the appended -1
+        cluster_ids=np.append(index.cluster_ids, -1)[rows[queued:]],
+        starts=starts[queued:],
+        ends=ends[queued:],
+        times=times,
+        used=used,
+        limits=np.nansum(index.limits, axis=0),
+    )
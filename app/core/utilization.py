@@ -0,0 +1,432 @@
+import fcntl
+import json
+import math
+import os
+from typing import IO, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+
+# Columns of every sample
+FIELDS = (
+    "cpu_used",
+    "ram_used",
+    "gpu_used",
+    "cpu_available",
+    "ram_available",
+    "gpu_available",
+)
+
+
+class Resolution:
+    """
+    Ring of samples `step` seconds apart for every cluster, in preallocated
+    arrays: `values[row, slot]` holds one cluster's sample for the bucket
+    (time // step) in `buckets[slot]`, and a new bucket overwrites the slot
+    of the one `len(buckets)` buckets older. Memory is fixed by the number of
+    slots, however long the service runs.
+
+    The arrays live in memory, or in memory-mapped files once `attach`ed, so
+    that other processes can read the ring while one process writes it.
+
+    It also averages samples of a finer resolution into its current bucket,
+    and hands back the mean once a sample for a later bucket arrives.
+    """
+
+    def __init__(self, step: int, slots: int) -> None:
+        self.step = step
+        self.buckets = np.full(slots, -1, dtype=np.int64)
+        self.values = np.full((0, slots, len(FIELDS)), np.nan, np.float32)
+        self.clusters = 0  # Rows in use; the arrays have room for more
+        self._path: Optional[str] = None  # Prefix of the files, when attached
+        self._bucket = -1
+        self._sums = np.zeros((0, len(FIELDS)))
+        self._counts = np.zeros((0, len(FIELDS)))
+
+    def attach(self, path: str, keep: bool, writable: bool) -> None:
+        """
+        Maps the ring from the files `{path}.buckets` and `{path}.values`.
+        A writer starts them afresh unless `keep` is true and their size
+        matches this ring; files are only ever replaced or extended, never
+        truncated, so readers' mappings stay valid.
+        """
+        slots = len(self.buckets)
+        if writable and not (
+            keep
+            and os.path.exists(f"{path}.values")
+            and os.path.exists(f"{path}.buckets")
+            and os.path.getsize(f"{path}.buckets") == slots * 8
+        ):
+            np.full(slots, -1, dtype=np.int64).tofile(f"{path}.buckets.tmp")
+            open(f"{path}.values.tmp", "wb").close()
+            os.replace(f"{path}.buckets.tmp", f"{path}.buckets")
+            os.replace(f"{path}.values.tmp", f"{path}.values")
+        mode = "r+" if writable else "r"
+        self.buckets = np.memmap(f"{path}.buckets", np.int64, mode, shape=(slots,))
+        self._path = path
+        self.values = self._map_values(mode)
+        self.clusters = 0
+        self._sums = np.zeros((len(self.values), len(FIELDS)))
+        self._counts = np.zeros((len(self.values), len(FIELDS)))
+
+    def _map_values(self, mode: str) -> np.ndarray:
+        shape = (0, len(self.buckets), len(FIELDS))
+        rows = os.path.getsize(f"{self._path}.values") // (4 * shape[1] * shape[2])
+        if not rows:
+            return np.empty(shape, np.float32)
+        return np.memmap(
+            f"{self._path}.values", np.float32, mode, shape=(rows, *shape[1:])
+        )
+
+    def remap(self, clusters: int) -> None:
+        """
+        Picks up, read-only, the rows a writing process has added since.
+        """
+        if clusters > len(self.values):
+            self.values = self._map_values("r")
+        self.clusters = clusters
+
+    def flush(self) -> None:
+        for array in (self.buckets, self.values):
+            if isinstance(array, np.memmap):
+                array.flush()
+
+    def grow(self, clusters: int) -> None:
+        """
+        Makes room for `clusters` rows, the new ones with no samples. Row
+        capacity doubles when it runs out, so adding clusters one at a time
+        costs amortized O(1) copies of the arrays, or extensions of the file.
+        """
+        if clusters > len(self.values):
+            capacity = max(clusters, 2 * len(self.values))
+            if self._path is None:
+                values = np.full(
+                    (capacity, len(self.buckets), len(FIELDS)), np.nan, np.float32
+                )
+                values[: self.clusters] = self.values[: self.clusters]
+            else:
+                rows = len(self.values)
+                with open(f"{self._path}.values", "r+b") as f:
+                    f.truncate(capacity * len(self.buckets) * len(FIELDS) * 4)
+                values = self._map_values("r+")
+                values[rows:] = np.nan
+            sums = np.zeros((capacity, len(FIELDS)))
+            sums[: self.clusters] = self._sums[: self.clusters]
+            counts = np.zeros((capacity, len(FIELDS)))
+            counts[: self.clusters] = self._counts[: self.clusters]
+            self.values, self._sums, self._counts = values, sums, counts
+        self.clusters = max(self.clusters, clusters)
+
+    def write(self, bucket: int, values: np.ndarray) -> None:
+        slot = bucket % len(self.buckets)
+        self.buckets[slot] = bucket
+        self.values[: len(values), slot] = values
+
+    def accumulate(
+        self, at: float, values: np.ndarray
+    ) -> Optional[Tuple[int, np.ndarray]]:
+        """
+        Adds a finer sample taken at `at` seconds to its bucket's mean.
+
+        Returns:
+            The previous bucket and its mean per cluster if `at` starts a new
+            bucket, otherwise None.
+        """
+        bucket = int(at // self.step)
+        done = None
+        if bucket != self._bucket:
+            if self._bucket >= 0:
+                sums = self._sums[: self.clusters]
+                counts = self._counts[: self.clusters]
+                mean = np.divide(
+                    sums, counts, out=np.full(sums.shape, np.nan), where=counts > 0
+                )
+                done = (self._bucket, mean)
+            self._bucket = bucket
+            self._sums[:] = 0
+            self._counts[:] = 0
+        known = ~np.isnan(values)
+        self._sums[: len(values)] += np.where(known, values, 0)
+        self._counts[: len(values)] += known
+        return done
+
+    def read(self, row: int, start: float, end: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        The samples of one cluster taken in [start, end), oldest first.
+
+        Returns:
+            Their times in seconds and their (n, len(FIELDS)) values.
+        """
+        times = self.buckets * self.step
+        slots = np.flatnonzero((self.buckets >= 0) & (times >= start) & (times < end))
+        slots = slots[np.argsort(times[slots], kind="stable")]
+        return times[slots], self.values[row, slots]
+
+
+class UtilizationStore:
+    """
+    History of every cluster's used and available resources.
+
+    Samples land in a ring at the sample interval and are averaged into
+    rings of 1-minute and 1-hour means, so recent history is kept finely and
+    older history coarsely, at a fixed cost per cluster. The rings are kept
+    in memory, or in memory-mapped files under a directory (see `open`)
+    that persist them, not the database, and let other processes read them.
+    """
+
+    def __init__(self, interval: int, slots: Sequence[int]) -> None:
+        steps = (interval, 60, 3600)
+        self.resolutions = [Resolution(step, n) for step, n in zip(steps, slots)]
+        self.cluster_ids: List[int] = []
+        self._rows: Dict[int, int] = {}
+        self._latest = -1  # Last bucket sampled at the finest resolution
+        self._ids_path: Optional[str] = None  # Cluster ids file, when open
+        self._lock: Optional[IO] = None  # Held while this process writes files
+        self.recording = False  # Whether this process samples into the rings
+
+    def _layout(self) -> List[List[int]]:
+        return [[r.step, len(r.buckets)] for r in self.resolutions]
+
+    def _add(self, cluster_ids: Sequence[int]) -> None:
+        """
+        Gives a row to every cluster id not seen before, growing the rings
+        once for all of them. Once the rings are in files, the new ids are
+        appended to the ids file after the rings have room for them, so a
+        reader never sees an id without its row.
+        """
+        added = []
+        for cluster_id in cluster_ids:
+            if cluster_id not in self._rows:
+                self._rows[cluster_id] = len(self.cluster_ids)
+                self.cluster_ids.append(cluster_id)
+                added.append(cluster_id)
+        if added:
+            for resolution in self.resolutions:
+                resolution.grow(len(self.cluster_ids))
+            if self._ids_path is not None:
+                with open(self._ids_path, "ab") as f:
+                    np.array(added, dtype=np.int64).tofile(f)
+
+    def open(self, path: str) -> bool:
+        """
+        Moves the rings into memory-mapped files under the directory `path`,
+        restoring the history already there, so that it survives restarts
+        and other processes can serve it through `shared`. Call it before the
+        first `record`. Resolutions whose step or slot count has been
+        reconfigured since start empty; the partial minute and hour being
+        averaged at the time of a restart are lost.
+
+        Only one process may write the files: this takes a lock on them that
+        is held until the process exits.
+
+        Returns:
+            Whether the lock was free and the rings were opened.
+        """
+        os.makedirs(path, exist_ok=True)
+        lock = open(os.path.join(path, "writer.lock"), "a")
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock.close()
+            return False
+        self._lock = lock
+
+        layout_path = os.path.join(path, "layout.json")
+        previous = []
+        if os.path.exists(layout_path):
+            with open(layout_path) as f:
+                previous = json.load(f)
+        for level, resolution in enumerate(self.resolutions):
+            keep = previous[level : level + 1] == [self._layout()[level]]
+            resolution.attach(os.path.join(path, f"level_{level}"), keep, True)
+
+        ids_path = os.path.join(path, "cluster_ids")
+        ids = np.fromfile(ids_path, np.int64) if os.path.exists(ids_path) else []
+        self.cluster_ids, self._rows = [], {}
+        self._add([int(cluster_id) for cluster_id in ids])
+        self._ids_path = ids_path
+        self._latest = int(self.resolutions[0].buckets.max(initial=-1))
+
+        with open(f"{layout_path}.tmp", "w") as f:
+            json.dump(self._layout(), f)
+        os.replace(f"{layout_path}.tmp", layout_path)
+        return True
+
+    @classmethod
+    def shared(cls, path: str) -> Optional["UtilizationStore"]:
+        """
+        Maps, read-only, the rings a sampling process keeps under `path`,
+        or returns None if it has not opened them yet. Call `refresh` to pick
+        up clusters it added since.
+        """
+        layout_path = os.path.join(path, "layout.json")
+        if not os.path.exists(layout_path):
+            return None
+        with open(layout_path) as f:
+            layout = json.load(f)
+        store = cls(interval=layout[0][0], slots=[slots for _, slots in layout])
+        for level, resolution in enumerate(store.resolutions):
+            resolution.attach(os.path.join(path, f"level_{level}"), True, False)
+        store._ids_path = os.path.join(path, "cluster_ids")
+        store.refresh()
+        return store
+
+    def refresh(self) -> None:
+        """
+        Reads the cluster ids a writing process has added to shared rings.
+        """
+        if not os.path.exists(self._ids_path):
+            return
+        known = len(self.cluster_ids)
+        added = np.fromfile(self._ids_path, np.int64, offset=known * 8)
+        if not len(added):
+            return
+        for cluster_id in added.tolist():
+            self._rows[cluster_id] = len(self.cluster_ids)
+            self.cluster_ids.append(cluster_id)
+        for resolution in self.resolutions:
+            resolution.remap(len(self.cluster_ids))
+
+    def flush(self) -> None:
+        """
+        Writes the rings' dirty pages to their files, if they are in files.
+        """
+        for resolution in self.resolutions:
+            resolution.flush()
+
+    def close(self) -> None:
+        """
+        Flushes the rings and gives up the lock on their files, if held.
+        """
+        self.flush()
+        self.recording = False
+        if self._lock is not None:
+            self._lock.close()
+            self._lock = None
+
+    def record(self, at: float, rows: Sequence) -> None:
+        """
+        Records a sample of every cluster taken at `at` seconds since the
+        epoch, from rows of (id, cpu_limit, ram_limit, gpu_limit,
+        cpu_available, ram_available, gpu_available). Clusters missing from
+        the rows get no sample. A second sample in the same interval is
+        ignored.
+        """
+        finest = self.resolutions[0]
+        bucket = int(at // finest.step)
+        if bucket <= self._latest:
+            return
+        self._latest = bucket
+
+        self._add([row[0] for row in rows])
+        row_index = [self._rows[row[0]] for row in rows]
+        values = np.full((len(self.cluster_ids), len(FIELDS)), np.nan)
+        if rows:
+            capacity = np.array([tuple(row)[1:] for row in rows], dtype=float)
+            limits, available = capacity[:, :3], capacity[:, 3:]
+            values[row_index] = np.hstack([limits - available, available])
+
+        finest.write(bucket, values)
+        at = bucket * finest.step
+        for resolution in self.resolutions[1:]:
+            done = resolution.accumulate(at, values)
+            if done is None:
+                break
+            bucket, values = done
+            resolution.write(bucket, values)
+            at = bucket * resolution.step
+
+    def series(
+        self, cluster_id: int, start: float, end: float, step: int
+    ) -> Tuple[int, np.ndarray, np.ndarray]:
+        """
+        Means of a cluster's samples over consecutive `step`-second windows,
+        aligned to multiples of `step`, from `start` to `end`. They are read
+        from the finest resolution that still holds `start`, or the coarsest
+        one. Windows without samples are left out.
+
+        Returns:
+            The step used, which is never finer than the resolution read, the
+            start time of each window and their (n, len(FIELDS)) means.
+        """
+        resolution = self.resolutions[-1]
+        for candidate in self.resolutions:
+            # One bucket of slack, so a window as long as the ring is read
+            # from it rather than from a coarser one
+            oldest = candidate.buckets.max(initial=0) - len(candidate.buckets)
+            if oldest * candidate.step <= start:
+                resolution = candidate
+                break
+        step = max(step, resolution.step)
+
+        row = self._rows.get(cluster_id)
+        if row is None:
+            return step, np.zeros(0), np.zeros((0, len(FIELDS)))
+        times, values = resolution.read(row, start, end)
+        # Windows are aligned to multiples of `step` since the epoch
+        first = math.floor(start / step)
+        windows = (times // step - first).astype(np.int64)
+        count = math.ceil(end / step) - first
+
+        known = ~np.isnan(values)
+        sums = np.empty((count, len(FIELDS)))
+        counts = np.empty((count, len(FIELDS)))
+        for column in range(len(FIELDS)):
+            sums[:, column] = np.bincount(
+                windows,
+                weights=np.where(known[:, column], values[:, column], 0),
+                minlength=count,
+            )
+            counts[:, column] = np.bincount(
+                windows, weights=known[:, column], minlength=count
+            )
+        sampled = np.flatnonzero(counts.any(axis=1))
+        means = np.divide(
+            sums[sampled],
+            counts[sampled],
+            out=np.full((len(sampled), len(FIELDS)), np.nan),
+            where=counts[sampled] > 0,
+        )
+        return step, (first + sampled) * step, means
+
+
+utilization_store = UtilizationStore(
+    interval=settings.UTILIZATION_SAMPLE_INTERVAL,
+    slots=(
+        settings.UTILIZATION_SAMPLE_SLOTS,
+        settings.UTILIZATION_MINUTE_SLOTS,
+        settings.UTILIZATION_HOUR_SLOTS,
+    ),
+)
+
+_shared: Dict[str, Tuple[Tuple[int, int], UtilizationStore]] = {}
+
+
+def utilization_history() -> Optional[UtilizationStore]:
+    """
+    The history this worker serves: the rings it records itself when it
+    samples, otherwise those the sampling worker shares under
+    `UTILIZATION_HISTORY_PATH`. None if neither is available.
+
+    The shared rings are mapped again when the sampler restarts, which
+    rewrites their layout file.
+    """
+    if utilization_store.recording:
+        return utilization_store
+    path = settings.UTILIZATION_HISTORY_PATH
+    if not path:
+        return None
+    try:
+        stat = os.stat(os.path.join(path, "layout.json"))
+    except FileNotFoundError:
+        return None
+    layout = (stat.st_ino, stat.st_mtime_ns)
+    if path not in _shared or _shared[path][0] != layout:
+        store = UtilizationStore.shared(path)
+        if store is None:
+            return None
+        _shared[path] = (layout, store)
+    store = _shared[path][1]
+    store.refresh()
+    return store
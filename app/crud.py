@@ -1,48 +1,52 @@
 import uuid
-from sqlalchemy.orm import Session
+from datetime import datetime
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.models.organization import Organization
 from app.schemas.organization import OrganizationCreate
 
 from fastapi import HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from app.models.cluster import Cluster
+from app.models.deployment import Deployment, DeploymentStatus
 
 
-def create_organization(
-    db: Session, organization_in: OrganizationCreate, invite_code: str
+async def create_organization(
+    db: AsyncSession, organization_in: OrganizationCreate, invite_code: str
 ) -> Organization:
     """Creates a new organization record in the database."""
     organization = Organization(name=organization_in.name, invite_code=invite_code)
     db.add(organization)
-    db.commit()
-    db.refresh(organization)
+    await db.commit()
+    await db.refresh(organization)
     return organization
 
 
-def get_organization_by_invite_code(db: Session, invite_code: str) -> Organization:
+async def get_organization_by_invite_code(
+    db: AsyncSession, invite_code: str
+) -> Organization:
     """Retrieves an organization by its invite code."""
-    return (
-        db.query(Organization).filter(Organization.invite_code == invite_code).first()
+    return await db.scalar(
+        select(Organization).where(Organization.invite_code == invite_code)
     )
 
 
-def get_organization_by_id(db: Session, id: int) -> Organization | None:
+async def get_organization_by_id(db: AsyncSession, id: int) -> Organization | None:
     """
     Retrieves an organization by its ID from the database.
 
     Args:
-        db: SQLAlchemy database session.
+        db: SQLAlchemy async database session.
         id: The ID of the organization to retrieve.
 
     Returns:
         The Organization object if found, otherwise None.
     """
-    return db.query(Organization).filter(Organization.id == id).first()
+    return await db.get(Organization, id)
 
 
-def create_cluster(db: Session, cluster: Cluster) -> Cluster:
+async def create_cluster(db: AsyncSession, cluster: Cluster) -> Cluster:
     """
     Create a new cluster in the database.
     """
@@ -57,20 +61,478 @@ def create_cluster(db: Session, cluster: Cluster) -> Cluster:
         gpu_available=cluster.gpu_limit,
     )
     db.add(new_cluster)
-    db.commit()
-    db.refresh(new_cluster)
+    await db.commit()
+    await db.refresh(new_cluster)
     return new_cluster
 
 
-def get_clusters_by_organization(db: Session, organization_id: int) -> List[Cluster]:
+async def get_clusters_by_organization(
+    db: AsyncSession, organization_id: int, limit: int, after: Optional[int] = None
+) -> List[Cluster]:
     """
-    Retrieve all clusters belonging to a specific organization.
+    Retrieve a page of clusters belonging to a specific organization, ordered
+    by id and starting after the cluster id `after`.
     """
-    clusters = (
-        db.query(Cluster).filter(Cluster.organization_id == organization_id).all()
-    )
-    if not clusters:
+    query = select(Cluster).where(Cluster.organization_id == organization_id)
+    if after is not None:
+        query = query.where(Cluster.id > after)
+    clusters = (await db.scalars(query.order_by(Cluster.id).limit(limit))).all()
+    if not clusters and after is None:
         raise HTTPException(
             status_code=404, detail="No clusters found for the organization"
         )
     return clusters
+
+
+async def get_deployments_by_organization(
+    db: AsyncSession,
+    organization_id: int,
+    limit: int,
+    after: Optional[int] = None,
+    status: Optional[DeploymentStatus] = None,
+    cluster_id: Optional[int] = None,
+    min_priority: Optional[int] = None,
+    max_priority: Optional[int] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+) -> List[Deployment]:
+    """
+    Retrieve a page of an organization's deployments, ordered by id and
+    starting after the deployment id `after`.
+
+    The organization, status and cluster filters are served by the composite
+    indexes on Deployment; priority and creation-time bounds are applied to
+    the rows those indexes return.
+    """
+    query = select(Deployment).where(Deployment.organization_id == organization_id)
+    if after is not None:
+        query = query.where(Deployment.id > after)
+    if status is not None:
+        query = query.where(Deployment.status == status)
+    if cluster_id is not None:
+        query = query.where(Deployment.cluster_id == cluster_id)
+    if min_priority is not None:
+        query = query.where(Deployment.priority >= min_priority)
+    if max_priority is not None:
+        query = query.where(Deployment.priority <= max_priority)
+    if created_after is not None:
+        query = query.where(Deployment.created_at >= created_after)
+    if created_before is not None:
+        query = query.where(Deployment.created_at < created_before)
+    return (await db.scalars(query.order_by(Deployment.id).limit(limit))).all()
+
+
+async def get_deployment_ids_by_organization(
+    db: AsyncSession,
+    organization_id: int,
+    limit: Optional[int] = None,
+    after: Optional[int] = None,
+) -> List[int]:
+    """
+    Retrieve the ids of an organization's deployments in order, straight from
+    the (organization_id, id) index, optionally a page at a time.
+    """
+    query = select(Deployment.id).where(Deployment.organization_id == organization_id)
+    if after is not None:
+        query = query.where(Deployment.id > after)
+    ids = await db.scalars(query.order_by(Deployment.id).limit(limit))
+    return ids.all()
+
+
+CLUSTER_COUNTERS = ("pending_count", "running_count", "completed_count")
+
+
+def _count_deltas(counts: dict) -> dict:
+    """
+    Turns counter deltas such as `{"running_count": 2}` into UPDATE values.
+    """
+    for name in counts:
+        if name not in CLUSTER_COUNTERS:
+            raise ValueError(f"Unknown cluster counter: {name}")
+    return {
+        name: getattr(Cluster, name) + delta for name, delta in counts.items() if delta
+    }
+
+
+async def reserve_cluster_resources(
+    db: AsyncSession, cluster_id: int, cpu: float, ram: float, gpu: float, **counts
+) -> bool:
+    """
+    Atomically takes resources from a cluster if all of them are available.
+
+    The check and the decrement happen in a single conditional UPDATE, so
+    concurrent reservations cannot both pass the check; only the cluster's
+    row is locked, and only until the caller commits. Keyword arguments such
+    as `running_count=1` are applied to the cluster's counters in the same
+    statement.
+
+    Returns:
+        True if the resources were reserved, False if the cluster lacks room.
+    """
+    result = await db.execute(
+        update(Cluster)
+        .where(
+            Cluster.id == cluster_id,
+            Cluster.cpu_available >= cpu,
+            Cluster.ram_available >= ram,
+            Cluster.gpu_available >= gpu,
+        )
+        .values(
+            cpu_available=Cluster.cpu_available - cpu,
+            ram_available=Cluster.ram_available - ram,
+            gpu_available=Cluster.gpu_available - gpu,
+            **_count_deltas(counts),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+async def complete_deployments(
+    db: AsyncSession, deployment_ids: List[int], completed_at: datetime
+) -> List:
+    """
+    Marks every RUNNING deployment among the given ids as COMPLETED with a
+    single set-based UPDATE. Ids that are no longer RUNNING are left alone.
+
+    Returns:
+        Rows of (id, cluster_id, organization_id, cpu_required, ram_required,
+        gpu_required) for the deployments that were completed by this call.
+    """
+    if not deployment_ids:
+        return []
+
+    result = await db.execute(
+        update(Deployment)
+        .where(
+            Deployment.id.in_(deployment_ids),
+            Deployment.status == DeploymentStatus.RUNNING,
+        )
+        .values(status=DeploymentStatus.COMPLETED, completed_at=completed_at)
+        .returning(
+            Deployment.id,
+            Deployment.cluster_id,
+            Deployment.organization_id,
+            Deployment.cpu_required,
+            Deployment.ram_required,
+            Deployment.gpu_required,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    return result.all()
+
+
+async def release_cluster_resources(
+    db: AsyncSession, cluster_id: int, cpu: float, ram: float, gpu: float, **counts
+) -> None:
+    """
+    Atomically returns previously reserved resources to a cluster, applying
+    any counter deltas given as keyword arguments in the same statement.
+    """
+    await db.execute(
+        update(Cluster)
+        .where(Cluster.id == cluster_id)
+        .values(
+            cpu_available=Cluster.cpu_available + cpu,
+            ram_available=Cluster.ram_available + ram,
+            gpu_available=Cluster.gpu_available + gpu,
+            **_count_deltas(counts),
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def count_submitted_deployments(
+    db: AsyncSession, cluster_id: int, submitted: int
+) -> None:
+    """
+    Adds newly inserted PENDING deployments to a cluster's pending counter.
+    Call it in the transaction that inserts them.
+    """
+    await db.execute(
+        update(Cluster)
+        .where(Cluster.id == cluster_id)
+        .values(pending_count=Cluster.pending_count + submitted)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def transition_deployment(
+    db: AsyncSession,
+    deployment_id: int,
+    from_status: DeploymentStatus,
+    to_status: DeploymentStatus,
+    **values,
+) -> bool:
+    """
+    Moves a deployment between statuses only if it is still in `from_status`,
+    so a transition is applied at most once even when raced.
+
+    Returns:
+        True if this call performed the transition.
+    """
+    result = await db.execute(
+        update(Deployment)
+        .where(Deployment.id == deployment_id, Deployment.status == from_status)
+        .values(status=to_status, **values)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+async def transition_deployments(
+    db: AsyncSession,
+    deployment_ids: List[int],
+    from_status: DeploymentStatus,
+    to_status: DeploymentStatus,
+    **values,
+) -> List[int]:
+    """
+    Set-based `transition_deployment`: moves every deployment among the given
+    ids that is still in `from_status` with a single UPDATE.
+
+    Returns:
+        The ids this call transitioned.
+    """
+    if not deployment_ids:
+        return []
+
+    result = await db.execute(
+        update(Deployment)
+        .where(Deployment.id.in_(deployment_ids), Deployment.status == from_status)
+        .values(status=to_status, **values)
+        .returning(Deployment.id)
+        .execution_options(synchronize_session=False)
+    )
+    return result.scalars().all()
+
+
+async def lock_pending_deployment(db: AsyncSession, deployment_id: int) -> bool:
+    """
+    Checks that a deployment is still PENDING with a no-op conditional UPDATE,
+    which also locks its row until the transaction ends, so it cannot be
+    started or removed elsewhere before the caller commits.
+
+    Returns:
+        True if the deployment is PENDING.
+    """
+    return bool(
+        await transition_deployments(
+            db, [deployment_id], DeploymentStatus.PENDING, DeploymentStatus.PENDING
+        )
+    )
+
+
+async def get_cluster_summaries(
+    db: AsyncSession, organization_id: int
+) -> List[Cluster]:
+    """
+    Retrieve every cluster of an organization with its resources and
+    counters; one indexed range read, independent of the number of
+    deployments.
+    """
+    clusters = await db.scalars(
+        select(Cluster)
+        .where(Cluster.organization_id == organization_id)
+        .order_by(Cluster.id)
+    )
+    return clusters.all()
+
+
+async def get_preemption_candidates(
+    db: AsyncSession, cluster_id: int, below_priority: int, limit: int
+) -> List:
+    """
+    Retrieve RUNNING deployments of a cluster with a priority below
+    `below_priority`, lowest priority first and, within a priority, the most
+    recently started first, since evicting those loses the least work. Served
+    by the (cluster_id, status, priority) index.
+
+    Returns:
+        Rows of (id, user_id, priority, created_at, started_at, required_time,
+        cpu_required, ram_required, gpu_required).
+    """
+    result = await db.execute(
+        select(
+            Deployment.id,
+            Deployment.user_id,
+            Deployment.priority,
+            Deployment.created_at,
+            Deployment.started_at,
+            Deployment.required_time,
+            Deployment.cpu_required,
+            Deployment.ram_required,
+            Deployment.gpu_required,
+        )
+        .where(
+            Deployment.cluster_id == cluster_id,
+            Deployment.status == DeploymentStatus.RUNNING,
+            Deployment.priority < below_priority,
+        )
+        .order_by(Deployment.priority, Deployment.started_at.desc())
+        .limit(limit)
+    )
+    return result.all()
+
+
+async def get_pending_deployments(db: AsyncSession, cluster_ids: List[int]) -> List:
+    """
+    Retrieve the PENDING deployments of the given clusters, with only the
+    columns a scheduler queue entry needs. Served by the (cluster_id, status,
+    priority) index.
+
+    Returns:
+        Rows of (id, cluster_id, user_id, priority, created_at, required_time,
+        cpu_required, ram_required, gpu_required).
+    """
+    result = await db.execute(
+        select(
+            Deployment.id,
+            Deployment.cluster_id,
+            Deployment.user_id,
+            Deployment.priority,
+            Deployment.created_at,
+            Deployment.required_time,
+            Deployment.cpu_required,
+            Deployment.ram_required,
+            Deployment.gpu_required,
+        ).where(
+            Deployment.cluster_id.in_(cluster_ids),
+            Deployment.status == DeploymentStatus.PENDING,
+        )
+    )
+    return result.all()
+
+
+async def get_running_reservations(db: AsyncSession, cluster_id: int) -> List:
+    """
+    Retrieve what each RUNNING deployment of a cluster holds and for how long.
+    Served by the (cluster_id, status, priority) index.
+
+    Returns:
+        Rows of (started_at, required_time, cpu_required, ram_required,
+        gpu_required).
+    """
+    result = await db.execute(
+        select(
+            Deployment.started_at,
+            Deployment.required_time,
+            Deployment.cpu_required,
+            Deployment.ram_required,
+            Deployment.gpu_required,
+        ).where(
+            Deployment.cluster_id == cluster_id,
+            Deployment.status == DeploymentStatus.RUNNING,
+        )
+    )
+    return result.all()
+
+
+# Columns of the rows `CapacityIndex.from_rows` and the utilization store read
+CAPACITY_COLUMNS = (
+    Cluster.id,
+    Cluster.cpu_limit,
+    Cluster.ram_limit,
+    Cluster.gpu_limit,
+    Cluster.cpu_available,
+    Cluster.ram_available,
+    Cluster.gpu_available,
+)
+
+
+async def get_cluster_capacities(db: AsyncSession, organization_id: int) -> List:
+    """
+    Retrieve the limits and free resources of every cluster of an
+    organization without loading ORM objects.
+
+    Returns:
+        Rows of (id, cpu_limit, ram_limit, gpu_limit, cpu_available,
+        ram_available, gpu_available).
+    """
+    result = await db.execute(
+        select(*CAPACITY_COLUMNS).where(Cluster.organization_id == organization_id)
+    )
+    return result.all()
+
+
+async def get_all_cluster_capacities(db: AsyncSession) -> List:
+    """
+    Retrieve the limits and free resources of every cluster of every
+    organization, as `get_cluster_capacities` does. Only for internal
+    bookkeeping such as utilization sampling, never for a user's request.
+    """
+    result = await db.execute(select(*CAPACITY_COLUMNS))
+    return result.all()
+
+
+async def get_cluster_organization_id(
+    db: AsyncSession, cluster_id: int
+) -> Optional[int]:
+    """
+    Reads the organization a cluster belongs to, or None if there is no such
+    cluster.
+    """
+    return await db.scalar(
+        select(Cluster.organization_id).where(Cluster.id == cluster_id)
+    )
+
+
+async def get_organization_workload(db: AsyncSession, organization_id: int) -> List:
+    """
+    Retrieve the RUNNING and PENDING deployments of an organization, as the
+    columns needed to project when they start and end. Served by the
+    (organization_id, status, created_at) index.
+
+    Returns:
+        Rows of (cluster_id, status, priority, created_at, started_at,
+        required_time, cpu_required, ram_required, gpu_required).
+    """
+    result = await db.execute(
+        select(
+            Deployment.cluster_id,
+            Deployment.status,
+            Deployment.priority,
+            Deployment.created_at,
+            Deployment.started_at,
+            Deployment.required_time,
+            Deployment.cpu_required,
+            Deployment.ram_required,
+            Deployment.gpu_required,
+        ).where(
+            Deployment.organization_id == organization_id,
+            Deployment.status.in_([DeploymentStatus.RUNNING, DeploymentStatus.PENDING]),
+        )
+    )
+    return result.all()
+
+
+async def get_cluster_availability(db: AsyncSession, cluster_id: int):
+    """
+    Reads a cluster's free resources without loading the ORM object.
+
+    Returns:
+        A row of (cpu_available, ram_available, gpu_available), or None.
+    """
+    result = await db.execute(
+        select(
+            Cluster.cpu_available, Cluster.ram_available, Cluster.gpu_available
+        ).where(Cluster.id == cluster_id)
+    )
+    return result.first()
+
+
+async def get_reserved_resources(db: AsyncSession):
+    """
+    Sums the resources currently reserved across all clusters.
+
+    Returns:
+        A row of (cpu, ram, gpu); the sums are None when there are no clusters.
+    """
+    result = await db.execute(
+        select(
+            func.sum(Cluster.cpu_limit - Cluster.cpu_available).label("cpu"),
+            func.sum(Cluster.ram_limit - Cluster.ram_available).label("ram"),
+            func.sum(Cluster.gpu_limit - Cluster.gpu_available).label("gpu"),
+        )
+    )
+    return result.one()
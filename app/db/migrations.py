@@ -0,0 +1,59 @@
+import os
+from alembic import command
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+MIGRATIONS_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "migrations"
+)
+
+
+class SchemaOutOfDate(RuntimeError):
+    pass
+
+
+def alembic_config() -> Config:
+    # No ini file, so running migrations in-process leaves logging alone.
+    config = Config()
+    config.set_main_option("script_location", MIGRATIONS_DIR)
+    return config
+
+
+async def upgrade_database(engine: AsyncEngine) -> None:
+    """
+    Applies pending migrations over a connection of `engine`.
+    """
+    config = alembic_config()
+
+    def upgrade(connection) -> None:
+        config.attributes["connection"] = connection
+        command.upgrade(config, "head")
+
+    async with engine.begin() as connection:
+        await connection.run_sync(upgrade)
+
+
+async def check_database_revision(engine: AsyncEngine) -> None:
+    """
+    Verifies the database is at the latest migration, in one round trip and
+    without any DDL.
+
+    Raises:
+        SchemaOutOfDate: The database is missing migrations or is newer than
+            this code
+    """
+    expected = set(ScriptDirectory.from_config(alembic_config()).get_heads())
+
+    def current_heads(connection) -> set:
+        return set(MigrationContext.configure(connection).get_current_heads())
+
+    async with engine.connect() as connection:
+        current = await connection.run_sync(current_heads)
+    if current != expected:
+        raise SchemaOutOfDate(
+            f"Database is at revision {sorted(current) or 'none'}, expected "
+            f"{sorted(expected)}; run `alembic upgrade head` or set "
+            "DB_MIGRATE_ON_STARTUP"
+        )
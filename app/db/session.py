@@ -1,6 +1,71 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from app.core.config import settings
+from app.core.metrics import instrument_engine
+from app.core.pools import InstrumentedQueuePool, db_pool_stats
 
-engine = create_engine(settings.DATABASE_URL, pool_pre_ping=True)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Async driver used for each synchronous database URL scheme
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def make_async_url(url: str) -> str:
+    """
+    Rewrites a synchronous database URL to use the matching asyncio driver.
+    """
+    parsed = make_url(url)
+    drivername = ASYNC_DRIVERS.get(parsed.drivername, parsed.drivername)
+    return parsed.set(drivername=drivername).render_as_string(hide_password=False)
+
+
+def async_engine_options(url: str) -> dict:
+    """
+    Pool and connection options for the request-path engine. SQLite keeps
+    SQLAlchemy's default pool, which does not take sizing options.
+    """
+    if make_url(url).get_backend_name() == "sqlite":
+        return {}
+    return {
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "connect_args": {
+            "server_settings": {
+                "statement_timeout": str(settings.DB_STATEMENT_TIMEOUT_MS)
+            }
+        },
+    }
+
+
+# Creating the engine opens no connection; the first checkout does.
+async_engine = create_async_engine(
+    make_async_url(settings.DATABASE_URL),
+    pool_pre_ping=True,
+    **async_engine_options(settings.DATABASE_URL),
+)
+instrument_engine(async_engine.sync_engine)
+
+# Objects stay usable after commit; lazy refreshes are not possible under asyncio.
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, autoflush=False, expire_on_commit=False
+)
+
+
+def db_pool_snapshot() -> dict:
+    """
+    Current state and running checkout stats of the request-path pool.
+    """
+    pool = async_engine.pool
+    snapshot = db_pool_stats.snapshot()
+    if isinstance(pool, InstrumentedQueuePool):
+        snapshot.update(
+            checked_out=pool.checkedout(),
+            size=pool.size(),
+            overflow=max(pool.overflow(), 0),
+        )
+    return snapshot
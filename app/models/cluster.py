@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from app.db.base_class import Base
 
@@ -18,6 +18,15 @@ class Cluster(Base):
     ram_available = Column(Float)
     gpu_available = Column(Float)
 
+    # Deployment counts by status, maintained in the same UPDATEs that
+    # reserve and release resources
+    pending_count = Column(Integer, nullable=False, default=0, server_default="0")
+    running_count = Column(Integer, nullable=False, default=0, server_default="0")
+    completed_count = Column(Integer, nullable=False, default=0, server_default="0")
+
     # Relationships
     organization = relationship("Organization", back_populates="clusters")
     deployments = relationship("Deployment", back_populates="cluster")
+
+    # Keyset pagination index for org-scoped listings
+    __table_args__ = (Index("ix_cluster_org_id", "organization_id", "id"),)
@@ -1,5 +1,14 @@
 from venv import create
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, Enum, DateTime
+from sqlalchemy import (
+    Column,
+    Integer,
+    String,
+    Float,
+    ForeignKey,
+    Enum,
+    DateTime,
+    Index,
+)
 from datetime import datetime
 from sqlalchemy.orm import relationship
 import enum
@@ -17,12 +26,21 @@ class Deployment(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True)
     cluster_id = Column(Integer, ForeignKey("cluster.id"))
+    organization_id = Column(
+        Integer, ForeignKey("organization.id")
+    )  # Denormalized from the cluster for org-scoped listings
+    user_id = Column(
+        Integer, ForeignKey("user.id"), nullable=True
+    )  # Submitter, charged for the deployment's usage under fair share
     docker_image = Column(String)
     status = Column(Enum(DeploymentStatus))
     priority = Column(Integer, default=0)
     created_at = Column(
         DateTime, default=datetime.now, nullable=False
     )  # Timestamp when created
+    started_at = Column(
+        DateTime, default=None, nullable=True
+    )  # Timestamp when moved to RUNNING
     completed_at = Column(
         DateTime, default=None, nullable=True
     )  # Timestamp when completed
@@ -35,3 +53,23 @@ class Deployment(Base):
 
     # Relationships
     cluster = relationship("Cluster", back_populates="deployments")
+
+    # Keyset pagination indexes; listings are ordered by id within an org
+    __table_args__ = (
+        Index("ix_deployment_org_id", "organization_id", "id"),
+        Index("ix_deployment_org_status_id", "organization_id", "status", "id"),
+        Index("ix_deployment_org_cluster_id", "organization_id", "cluster_id", "id"),
+        # Preemption victims: a cluster's RUNNING deployments by priority
+        Index(
+            "ix_deployment_cluster_status_priority",
+            "cluster_id",
+            "status",
+            "priority",
+        ),
+        Index(
+            "ix_deployment_org_status_created_at",
+            "organization_id",
+            "status",
+            "created_at",
+        ),
+    )
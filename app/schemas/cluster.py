@@ -1,4 +1,6 @@
+from datetime import datetime
 from pydantic import BaseModel
+from typing import List, Optional
 
 
 class ClusterBase(BaseModel):
@@ -17,6 +19,7 @@ class ClusterUpdate(ClusterBase):
 
 
 class Cluster(ClusterBase):
+    id: Optional[int] = None
     organization_id: int
     cpu_available: float
     ram_available: float
@@ -24,3 +27,70 @@ class Cluster(ClusterBase):
 
     class Config:
         from_attributes = True
+
+
+class UtilizationSummary(BaseModel):
+    cpu_limit: float = 0
+    ram_limit: float = 0
+    gpu_limit: float = 0
+    cpu_used: float = 0
+    ram_used: float = 0
+    gpu_used: float = 0
+    pending_count: int = 0
+    running_count: int = 0
+    completed_count: int = 0
+
+
+class ClusterSummary(UtilizationSummary):
+    id: int
+    name: str
+
+
+class OrganizationSummary(UtilizationSummary):
+    clusters: List[ClusterSummary] = []
+
+
+class SimulatedDeployments(BaseModel):
+    """
+    Projection of the submitted items, one entry per item in submission order.
+    """
+
+    cluster_id: List[Optional[int]] = []
+    start_at: List[Optional[datetime]] = []  # None if it would never start
+    end_at: List[Optional[datetime]] = []
+    queue_wait: List[Optional[float]] = []  # Seconds from submission to start
+    error: List[Optional[str]] = []
+
+
+class UtilizationTimeline(BaseModel):
+    """
+    Resources in use across the organization's clusters at evenly spaced times.
+    """
+
+    at: List[datetime] = []
+    cpu_used: List[float] = []
+    ram_used: List[float] = []
+    gpu_used: List[float] = []
+
+
+class ClusterUtilization(UtilizationTimeline):
+    """
+    Mean resources used and available in consecutive `step`-second windows
+    starting at each `at`; windows without samples are left out.
+    """
+
+    cluster_id: int
+    step: int
+    cpu_available: List[float] = []
+    ram_available: List[float] = []
+    gpu_available: List[float] = []
+
+
+class SimulationResult(BaseModel):
+    simulated_at: datetime
+    finished_at: Optional[datetime] = None  # When the last submitted item ends
+    cpu_limit: float = 0
+    ram_limit: float = 0
+    gpu_limit: float = 0
+    deployments: SimulatedDeployments = SimulatedDeployments()
+    timeline: UtilizationTimeline = UtilizationTimeline()
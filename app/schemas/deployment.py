@@ -7,15 +7,15 @@ from app.models.deployment import DeploymentStatus
 class DeploymentBase(BaseModel):
     name: str
     docker_image: str
-    cpu_required: float
-    ram_required: float
-    gpu_required: float
+    cpu_required: float = Field(ge=0)
+    ram_required: float = Field(ge=0)
+    gpu_required: float = Field(ge=0)
     priority: int = 0
 
 
 class DeploymentCreate(DeploymentBase):
-    cluster_id: int
-    required_time: int
+    cluster_id: Optional[int] = None  # Placed automatically when omitted
+    required_time: int = Field(gt=0)  # Seconds
 
 
 class DeploymentUpdate(DeploymentBase):
@@ -23,8 +23,16 @@ class DeploymentUpdate(DeploymentBase):
 
 
 class Deployment(DeploymentBase):
+    id: int
     cluster_id: int
     status: DeploymentStatus
 
     class Config:
         from_attributes = True
+
+
+class DeploymentBatchResult(BaseModel):
+    index: int  # Position of the item in the submitted batch
+    status_code: int = 200
+    deployment: Optional[Deployment] = None
+    error: Optional[str] = None
@@ -0,0 +1,376 @@
+"""
+Load and scale benchmark for the API and the scheduler.
+
+Seeds synthetic organizations, clusters and deployments straight into the
+database, then drives the app in-process over ASGI and reports throughput and
+latency percentiles per operation as JSON, so runs can be diffed.
+
+    python -m benchmarks.run --deployments 100000 --output bench.json
+    python -m benchmarks.run --database-url postgresql://... --redis real
+
+By default the database is a throwaway SQLite file and Redis is faked with
+fakeredis, which needs `lupa` for the Lua scripts. A `--database-url` must
+point at an empty database; `--redis real` uses the server configured by the
+REDIS_* settings. Both must be chosen before the app is imported, hence the
+late imports below.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List
+
+SEED_CHUNK = 10000
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--database-url", default=None)
+    parser.add_argument("--redis", choices=("fake", "real"), default="fake")
+    parser.add_argument("--organizations", type=int, default=10)
+    parser.add_argument("--clusters-per-org", type=int, default=10)
+    parser.add_argument("--deployments", type=int, default=10000)
+    parser.add_argument(
+        "--requests", type=int, default=500, help="Timed calls per operation"
+    )
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument(
+        "--sweep-size", type=int, default=1000, help="Deployments due per sweep"
+    )
+    parser.add_argument("--sweeps", type=int, default=20, help="Timed sweeps")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="JSON file, else stdout")
+    return parser.parse_args(argv)
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> dict:
+    """
+    Throughput and latency percentiles, in milliseconds, of one operation.
+    """
+    if not latencies:
+        return {"count": 0, "errors": errors}
+    ordered = sorted(latencies)
+
+    def percentile(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000
+
+    return {
+        "count": len(ordered),
+        "errors": errors,
+        "throughput_per_s": len(ordered) / elapsed if elapsed else None,
+        "mean_ms": statistics.fmean(ordered) * 1000,
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+async def measure(
+    call: Callable[[int], Awaitable[bool]], requests: int, concurrency: int
+) -> dict:
+    """
+    Runs `call(i)` for i in range(requests) with bounded concurrency; a call
+    returns False to count as an error.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    async def one(i: int) -> None:
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            ok = await call(i)
+            if ok:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+
+def use_fake_redis() -> None:
+    import fakeredis
+    from fakeredis.aioredis import FakeAsyncRedisConnection
+    from app.core.pools import redis_pool, stream_redis_pool
+
+    server = fakeredis.FakeServer()
+    for pool in (redis_pool, stream_redis_pool):
+        pool.connection_class = FakeAsyncRedisConnection
+        pool.connection_kwargs["server"] = server
+
+
+async def seed(args: argparse.Namespace, rng: random.Random) -> None:
+    """
+    Bulk-inserts organizations, clusters and `deployments` COMPLETED
+    deployments, plus `sweeps * sweep_size` RUNNING ones that hold resources
+    and as many PENDING ones waiting for them. Each cluster starts with only
+    its base capacity free, so every sweep releases resources and starts
+    queued deployments.
+    """
+    from sqlalchemy import insert, select
+    from app.db.session import AsyncSessionLocal
+    from app.models.cluster import Cluster
+    from app.models.deployment import Deployment, DeploymentStatus
+    from app.models.organization import Organization
+
+    now = datetime.now()
+    clusters = args.organizations * args.clusters_per_org
+    live = args.sweeps * args.sweep_size
+    shapes = [
+        (rng.choice([1, 2, 4]), rng.choice([1, 4, 16]), rng.choice([0, 0, 1]))
+        for _ in range(2 * live)
+    ]
+    # Resources held on each cluster by its RUNNING deployments
+    reserved = [[0, 0, 0] for _ in range(clusters)]
+    for i, shape in enumerate(shapes[:live]):
+        for k, amount in enumerate(shape):
+            reserved[i % clusters][k] += amount
+
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            insert(Organization),
+            [
+                {"name": f"org-{i}", "invite_code": f"bench-{i}"}
+                for i in range(args.organizations)
+            ],
+        )
+        org_ids = (
+            await db.scalars(select(Organization.id).order_by(Organization.id))
+        ).all()
+        base = (64, 256, 8)
+        rows = []
+        for i in range(clusters):
+            row = {
+                "name": f"cluster-{i}",
+                "organization_id": org_ids[i // args.clusters_per_org],
+            }
+            for k, resource in enumerate(("cpu", "ram", "gpu")):
+                row[f"{resource}_limit"] = base[k] + reserved[i][k]
+                row[f"{resource}_available"] = base[k]
+            rows.append(row)
+        await db.execute(insert(Cluster), rows)
+        clusters = (
+            await db.execute(
+                select(Cluster.id, Cluster.organization_id).order_by(Cluster.id)
+            )
+        ).all()
+
+        rows = []
+        for i in range(args.deployments + 2 * live):
+            cluster_id, org_id = clusters[i % len(clusters)]
+            if i < live:
+                status = DeploymentStatus.RUNNING
+            elif i < 2 * live:
+                status = DeploymentStatus.PENDING
+            else:
+                status = DeploymentStatus.COMPLETED
+            cpu, ram, gpu = shapes[i] if i < 2 * live else (0, 0, 0)
+            rows.append(
+                {
+                    "name": f"deployment-{i}",
+                    "docker_image": "bench:latest",
+                    "cluster_id": cluster_id,
+                    "organization_id": org_id,
+                    "status": status,
+                    "priority": rng.randint(0, 9),
+                    "created_at": now - timedelta(hours=1),
+                    # Sweeps choose which deployments are due; none is yet
+                    "started_at": (None if status == DeploymentStatus.PENDING else now),
+                    "completed_at": (
+                        now if status == DeploymentStatus.COMPLETED else None
+                    ),
+                    "required_time": 86400,
+                    "cpu_required": cpu,
+                    "ram_required": ram,
+                    "gpu_required": gpu,
+                }
+            )
+            if len(rows) == SEED_CHUNK:
+                await db.execute(insert(Deployment), rows)
+                rows = []
+        if rows:
+            await db.execute(insert(Deployment), rows)
+        await db.commit()
+
+
+async def measure_sweeps(args: argparse.Namespace) -> dict:
+    """
+    Times `sweeps` deadline sweeps, each with the deadlines of the next
+    `sweep_size` seeded RUNNING deployments moved into the past, and counts
+    the deployments they completed and started.
+    """
+    from sqlalchemy import func, select
+    from app.core.redis import (
+        DEADLINES_KEY,
+        rebuild_deadline_index,
+        redis_client,
+        update_deployment_status,
+    )
+    from app.core.scheduler import scheduler
+    from app.db.session import AsyncSessionLocal
+    from app.models.deployment import Deployment, DeploymentStatus
+
+    async def pending() -> int:
+        async with AsyncSessionLocal() as db:
+            return await db.scalar(
+                select(func.count()).where(
+                    Deployment.status == DeploymentStatus.PENDING
+                )
+            )
+
+    async with AsyncSessionLocal() as db:
+        await scheduler.load(db)
+        await rebuild_deadline_index(db)
+        due = (
+            await db.scalars(
+                select(Deployment.id)
+                .where(
+                    Deployment.status == DeploymentStatus.RUNNING,
+                    Deployment.name.like("deployment-%"),
+                )
+                .order_by(Deployment.id)
+            )
+        ).all()
+    pending_before = await pending()
+
+    latencies: List[float] = []
+    completed = 0
+    start = time.perf_counter()
+    for i in range(args.sweeps):
+        batch = due[i * args.sweep_size : (i + 1) * args.sweep_size]
+        await redis_client.zadd(DEADLINES_KEY, {str(d): 0 for d in batch})
+        sweep_start = time.perf_counter()
+        async with AsyncSessionLocal() as db:
+            completed += await update_deployment_status(db)
+        latencies.append(time.perf_counter() - sweep_start)
+    elapsed = time.perf_counter() - start
+
+    return {
+        **summarize(latencies, 0, elapsed),
+        "deployments_completed": completed,
+        "deployments_started": pending_before - await pending(),
+    }
+
+
+async def run(args: argparse.Namespace) -> dict:
+    import httpx
+    from app.core.security import password_hasher
+    from app.db.migrations import upgrade_database
+    from app.db.session import async_engine
+    from main import app
+
+    rng = random.Random(args.seed)
+    await upgrade_database(async_engine)
+    seed_start = time.perf_counter()
+    await seed(args, rng)
+    seed_seconds = time.perf_counter() - seed_start
+
+    results: Dict[str, dict] = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+        prefix = "/api/v1"
+        credentials = {"username": "bench", "password": "bench-password"}
+        await client.post(
+            f"{prefix}/auth/register",
+            json={**credentials, "email": "bench@example.com"},
+        )
+        await client.post(f"{prefix}/auth/login", params=credentials)
+        await client.post(f"{prefix}/organizations/bench-0/join")
+
+        async def login(i: int) -> bool:
+            async with httpx.AsyncClient(
+                transport=transport, base_url="http://bench"
+            ) as other:
+                response = await other.post(f"{prefix}/auth/login", params=credentials)
+            return response.status_code == 200
+
+        async def create_deployment(i: int) -> bool:
+            response = await client.post(
+                f"{prefix}/deployments/",
+                json={
+                    "name": f"bench-{i}",
+                    "docker_image": "bench:latest",
+                    "cpu_required": rng.choice([1, 2, 4]),
+                    "ram_required": rng.choice([1, 4, 16]),
+                    "gpu_required": rng.choice([0, 0, 1]),
+                    "priority": rng.randint(0, 9),
+                    "required_time": 3600,
+                },
+            )
+            return response.status_code == 200
+
+        async def list_deployments(i: int) -> bool:
+            response = await client.get(f"{prefix}/deployments/", params={"limit": 100})
+            return response.status_code == 200
+
+        async def list_clusters(i: int) -> bool:
+            response = await client.get(f"{prefix}/clusters/", params={"limit": 100})
+            return response.status_code == 200
+
+        # Bounded by the bcrypt pool rather than by the request count.
+        results["login"] = await measure(
+            login, min(args.requests, 100), args.concurrency
+        )
+        results["create_deployment"] = await measure(
+            create_deployment, args.requests, args.concurrency
+        )
+        results["list_deployments"] = await measure(
+            list_deployments, args.requests, args.concurrency
+        )
+        results["list_clusters"] = await measure(
+            list_clusters, args.requests, args.concurrency
+        )
+
+    results["update_deployment_status"] = await measure_sweeps(args)
+    password_hasher.shutdown()
+
+    return {
+        "started_at": datetime.now().isoformat(),
+        "config": {
+            **vars(args),
+            "database_url": os.environ["DATABASE_URL"].split("@")[-1],
+        },
+        "environment": {
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+        },
+        "seed_seconds": seed_seconds,
+        "results": results,
+    }
+
+
+def main(argv: List[str]) -> None:
+    args = parse_args(argv)
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    else:
+        directory = tempfile.mkdtemp(prefix="bench-")
+        os.environ["DATABASE_URL"] = f"sqlite:///{directory}/bench.db"
+    if args.redis == "fake":
+        use_fake_redis()
+
+    report = asyncio.run(run(args))
+    output = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
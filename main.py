@@ -1,17 +1,151 @@
-from fastapi import FastAPI
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
-from starlette.middleware.sessions import SessionMiddleware
-from sqlalchemy import create_engine
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from app import crud
 from app.api.v1.api import api_router
 from app.core.config import settings
-from app.db.base import Base
-from app.db.session import engine, SessionLocal
-from fastapi_utils.tasks import repeat_every
-from app.core.redis import update_deployment_status
+from app.db.migrations import check_database_revision, upgrade_database
+from app.db.session import async_engine, AsyncSessionLocal, db_pool_snapshot
+from app.core.metrics import (
+    DEADLINE_SWEEP_SECONDS,
+    RESOURCES_RESERVED,
+    MetricsMiddleware,
+    PasswordHasherCollector,
+    PoolCollector,
+    SchedulerCollector,
+    registry,
+)
+from app.core.pools import redis_pool, stream_redis_pool
+from app.core.redis import (
+    deadline_waker,
+    rebuild_deadline_index,
+    seconds_until_next_deadline,
+    update_deployment_status,
+)
+from app.core.scheduler import scheduler
+from app.core.sessions import ServerSessionMiddleware, session_backend
+from app.core.security import password_hasher
+from app.core.utilization import utilization_store
+
+
+async def load_deployment_queues() -> None:
+    """
+    Rebuild the scheduler's per-cluster queues from PENDING deployments and
+    the deadline index from RUNNING ones.
+    """
+    async with AsyncSessionLocal() as db:
+        await scheduler.load(db)
+        await rebuild_deadline_index(db)
+
+
+async def sync_deployment_status_with_db() -> float:
+    """
+    Complete due deployments and return how long to sleep until the next one.
+    """
+    async with AsyncSessionLocal() as db:
+        await update_deployment_status(db)
+    return await seconds_until_next_deadline()
+
+
+async def sweep_deployment_deadlines(stopping: asyncio.Event) -> None:
+    """
+    Sweep due deployments, then sleep until the next deadline or until a
+    newly started deployment finishes earlier. A sweep in progress when
+    `stopping` is set runs to completion.
+    """
+    deadline_waker.bind()
+    while not stopping.is_set():
+        delay = settings.DEADLINE_SWEEP_MAX_INTERVAL
+        try:
+            with DEADLINE_SWEEP_SECONDS.time():
+                delay = await sync_deployment_status_with_db()
+        except Exception as e:
+            print(f"Error during deployment status sync: {e}")
+        if not stopping.is_set():
+            await deadline_waker.wait(delay)
 
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+async def sample_cluster_utilization(stopping: asyncio.Event) -> None:
+    """
+    Record every cluster's used and available resources once per sample
+    interval, aligned to the interval's boundaries.
+
+    With `UTILIZATION_HISTORY_PATH` set, only the worker holding the lock on
+    the rings there samples; the others keep trying to take it over each
+    interval, and serve the shared rings meanwhile. The sampling worker
+    flushes them to disk periodically and closes them on the way out.
+    """
+    path = settings.UTILIZATION_HISTORY_PATH
+    interval = settings.UTILIZATION_SAMPLE_INTERVAL
+    flushed_at = time.monotonic()
+    utilization_store.recording = not path
+    while not stopping.is_set():
+        try:
+            if not utilization_store.recording:
+                opened = await asyncio.to_thread(utilization_store.open, path)
+                utilization_store.recording = opened
+        except Exception as e:
+            print(f"Error opening the utilization history: {e}")
+        try:
+            if utilization_store.recording:
+                async with AsyncSessionLocal() as db:
+                    rows = await crud.get_all_cluster_capacities(db)
+                utilization_store.record(time.time(), rows)
+                if time.monotonic() - flushed_at >= settings.UTILIZATION_FLUSH_INTERVAL:
+                    flushed_at = time.monotonic()
+                    await asyncio.to_thread(utilization_store.flush)
+        except Exception as e:
+            print(f"Error during utilization sampling: {e}")
+        try:
+            await asyncio.wait_for(stopping.wait(), interval - time.time() % interval)
+        except asyncio.TimeoutError:
+            pass
+    await asyncio.to_thread(utilization_store.close)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Sets up the worker on startup and drains it on shutdown. Importing this
+    module does no I/O, so neither a worker spawn nor test collection pays
+    for database or Redis round trips before the app actually starts.
+    """
+    if settings.DB_MIGRATE_ON_STARTUP:
+        await upgrade_database(async_engine)
+    else:
+        await check_database_revision(async_engine)
+    await load_deployment_queues()
+
+    stopping = asyncio.Event()
+    sweeper = asyncio.create_task(sweep_deployment_deadlines(stopping))
+    sampler = None
+    if settings.UTILIZATION_SAMPLING_ENABLED:
+        sampler = asyncio.create_task(sample_cluster_utilization(stopping))
+    try:
+        yield
+    finally:
+        # The server has stopped accepting and finished in-flight requests
+        # by now; let a running sweep commit and the utilization history be
+        # flushed before closing connections.
+        stopping.set()
+        deadline_waker.wake()
+        try:
+            await asyncio.wait_for(sweeper, settings.SHUTDOWN_GRACE_PERIOD)
+        except asyncio.TimeoutError:
+            print("Deadline sweep cancelled at shutdown")
+        if sampler is not None:
+            try:
+                await asyncio.wait_for(sampler, settings.SHUTDOWN_GRACE_PERIOD)
+            except asyncio.TimeoutError:
+                print("Utilization flush cancelled at shutdown")
+        password_hasher.shutdown()
+        await redis_pool.disconnect()
+        await stream_redis_pool.disconnect()
+        await async_engine.dispose()
+
 
 app = FastAPI(
     title="Cluster Management API",
@@ -72,6 +206,7 @@ app = FastAPI(
     ],
     docs_url="/docs",
     redoc_url="/redoc",
+    lifespan=lifespan,
 )
 
 # Configure CORS and Session
@@ -84,25 +219,29 @@ app.add_middleware(
 )
 
 app.add_middleware(
-    SessionMiddleware,
-    secret_key=settings.SECRET_KEY,
+    ServerSessionMiddleware,
+    backend=session_backend(),
     session_cookie=settings.SESSION_COOKIE_NAME,
     max_age=settings.SESSION_MAX_AGE,
+    cache_size=settings.SESSION_CACHE_SIZE,
+    cache_ttl=settings.SESSION_CACHE_TTL,
 )
 
+# Added last so it is outermost and also sees the session middleware's I/O
+app.add_middleware(MetricsMiddleware)
 
-from fastapi import FastAPI
-from fastapi_utils.tasks import repeat_every
 
+def pool_snapshots() -> dict:
+    return {
+        "postgres": db_pool_snapshot(),
+        "redis": redis_pool.snapshot(),
+        "redis_streams": stream_redis_pool.snapshot(),
+    }
 
-@app.on_event("startup")
-@repeat_every(seconds=60)
-def sync_deployment_status_with_db() -> None:
-    """
-    Sync deployment statuses from Redis to the database every 60 seconds.
-    """
-    with SessionLocal() as db:
-        update_deployment_status(db)
+
+registry.register(SchedulerCollector(scheduler))
+registry.register(PasswordHasherCollector(password_hasher))
+registry.register(PoolCollector(pool_snapshots))
 
 
 # Include API router
@@ -111,7 +250,21 @@ app.include_router(api_router, prefix="/api/v1")
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
+    return {"status": "healthy", "pools": pool_snapshots()}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """
+    Expose request, I/O, scheduler, password hashing and pool metrics in the
+    Prometheus text format.
+    """
+    async with AsyncSessionLocal() as db:
+        reserved = await crud.get_reserved_resources(db)
+    for resource in ("cpu", "ram", "gpu"):
+        RESOURCES_RESERVED.labels(resource).set(getattr(reserved, resource) or 0)
+
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
 
 
 if __name__ == "__main__":
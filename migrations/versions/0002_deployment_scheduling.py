@@ -0,0 +1,115 @@
+"""deployment scheduling
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17 22:54:08.417305
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("cluster", schema=None) as batch_op:
+        batch_op.add_column(
+            sa.Column("pending_count", sa.Integer(), server_default="0", nullable=False)
+        )
+        batch_op.add_column(
+            sa.Column("running_count", sa.Integer(), server_default="0", nullable=False)
+        )
+        batch_op.add_column(
+            sa.Column(
+                "completed_count", sa.Integer(), server_default="0", nullable=False
+            )
+        )
+        batch_op.create_index(
+            "ix_cluster_org_id", ["organization_id", "id"], unique=False
+        )
+
+    with op.batch_alter_table("deployment", schema=None) as batch_op:
+        batch_op.add_column(sa.Column("organization_id", sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column("started_at", sa.DateTime(), nullable=True))
+        batch_op.create_foreign_key(
+            "fk_deployment_organization_id_organization",
+            "organization",
+            ["organization_id"],
+            ["id"],
+        )
+        batch_op.create_index(
+            "ix_deployment_cluster_status_priority",
+            ["cluster_id", "status", "priority"],
+            unique=False,
+        )
+        batch_op.create_index(
+            "ix_deployment_org_cluster_id",
+            ["organization_id", "cluster_id", "id"],
+            unique=False,
+        )
+        batch_op.create_index(
+            "ix_deployment_org_id", ["organization_id", "id"], unique=False
+        )
+        batch_op.create_index(
+            "ix_deployment_org_status_created_at",
+            ["organization_id", "status", "created_at"],
+            unique=False,
+        )
+        batch_op.create_index(
+            "ix_deployment_org_status_id",
+            ["organization_id", "status", "id"],
+            unique=False,
+        )
+
+    # Existing rows: the organization comes from the cluster, deployments
+    # already running were timed from creation, and the counters start from
+    # what is in the table.
+    op.execute(
+        "UPDATE deployment SET organization_id = ("
+        "SELECT cluster.organization_id FROM cluster "
+        "WHERE cluster.id = deployment.cluster_id)"
+    )
+    op.execute(
+        "UPDATE deployment SET started_at = created_at "
+        "WHERE status = 'RUNNING' AND started_at IS NULL"
+    )
+    op.execute(
+        "UPDATE cluster SET "
+        + ", ".join(
+            f"{counter} = (SELECT count(*) FROM deployment "
+            f"WHERE deployment.cluster_id = cluster.id "
+            f"AND deployment.status = '{status}')"
+            for counter, status in (
+                ("pending_count", "PENDING"),
+                ("running_count", "RUNNING"),
+                ("completed_count", "COMPLETED"),
+            )
+        )
+    )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("deployment", schema=None) as batch_op:
+        batch_op.drop_index("ix_deployment_org_status_id")
+        batch_op.drop_index("ix_deployment_org_status_created_at")
+        batch_op.drop_index("ix_deployment_org_id")
+        batch_op.drop_index("ix_deployment_org_cluster_id")
+        batch_op.drop_index("ix_deployment_cluster_status_priority")
+        batch_op.drop_constraint(
+            "fk_deployment_organization_id_organization", type_="foreignkey"
+        )
+        batch_op.drop_column("started_at")
+        batch_op.drop_column("organization_id")
+
+    with op.batch_alter_table("cluster", schema=None) as batch_op:
+        batch_op.drop_index("ix_cluster_org_id")
+        batch_op.drop_column("completed_count")
+        batch_op.drop_column("running_count")
+        batch_op.drop_column("pending_count")
@@ -0,0 +1,32 @@
+"""deployment submitter
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17 22:57:19.931511
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0003"
+down_revision: Union[str, None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("deployment", schema=None) as batch_op:
+        batch_op.add_column(sa.Column("user_id", sa.Integer(), nullable=True))
+        batch_op.create_foreign_key(
+            "fk_deployment_user_id_user", "user", ["user_id"], ["id"]
+        )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("deployment", schema=None) as batch_op:
+        batch_op.drop_constraint("fk_deployment_user_id_user", type_="foreignkey")
+        batch_op.drop_column("user_id")
@@ -0,0 +1,96 @@
+import fakeredis
+import pytest
+import pytest_asyncio
+from contextlib import asynccontextmanager, contextmanager
+from fakeredis.aioredis import FakeAsyncRedisConnection
+from fastapi import FastAPI
+from sqlalchemy import create_engine, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+from app.api.v1.api import api_router
+from app.core.config import settings
+from app.core.deps import get_db
+from app.core.metrics import instrument_engine
+from app.core.placement import capacity_view
+from app.core.pools import redis_pool, stream_redis_pool
+from app.core.principals import principal_cache
+from app.core.scheduler import scheduler
+from app.core.sessions import RedisSessionBackend, ServerSessionMiddleware
+from app.db.base import Base
+from app.models.organization import Organization
+from app.models.user import User
+
+
+@contextmanager
+def fake_redis_pools():
+    """
+    Points the shared Redis pools at a fresh in-process fakeredis server.
+    """
+    server = fakeredis.FakeServer()
+    with pytest.MonkeyPatch.context() as mp:
+        for pool in (redis_pool, stream_redis_pool):
+            pool.reset()
+            mp.setattr(pool, "connection_class", FakeAsyncRedisConnection)
+            mp.setitem(pool.connection_kwargs, "server", server)
+        yield
+        for pool in (redis_pool, stream_redis_pool):
+            pool.reset()
+
+
+@pytest.fixture
+def fake_redis():
+    with fake_redis_pools():
+        yield
+
+
+@pytest_asyncio.fixture
+async def db():
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with async_sessionmaker(engine, expire_on_commit=False)() as session:
+        yield session
+    await engine.dispose()
+
+
+@pytest.fixture(scope="module")
+def api(tmp_path_factory):
+    """
+    The v1 API with server-side sessions, on a fresh SQLite file and fakeredis.
+
+    Sessions on the same database come from `api.state.session_factory`. Every
+    module's database reuses the same ids, so the process-wide scheduler
+    queues are reloaded when a client starts the app, and the principal cache
+    and capacity view forget the module's users and organizations on shutdown.
+    """
+    url = f"sqlite:///{tmp_path_factory.mktemp('api')}/api.db"
+    Base.metadata.create_all(bind=create_engine(url))
+    engine = create_async_engine(url.replace("sqlite", "sqlite+aiosqlite"))
+    instrument_engine(engine.sync_engine)
+    session_factory = async_sessionmaker(
+        engine, expire_on_commit=False, autoflush=False
+    )
+
+    async def get_test_db():
+        async with session_factory() as db:
+            yield db
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        async with session_factory() as db:
+            await scheduler.load(db)
+        yield
+        async with session_factory() as db:
+            for user_id in await db.scalars(select(User.id)):
+                await principal_cache.invalidate(user_id)
+            for organization_id in await db.scalars(select(Organization.id)):
+                capacity_view.invalidate(organization_id)
+
+    app = FastAPI(lifespan=lifespan)
+    app.include_router(api_router, prefix=settings.API_V1_STR)
+    app.add_middleware(ServerSessionMiddleware, backend=RedisSessionBackend())
+    app.dependency_overrides[get_db] = get_test_db
+    app.state.session_factory = session_factory
+
+    with fake_redis_pools():
+        yield app
@@ -0,0 +1,132 @@
+import pytest
+import pytest_asyncio
+from datetime import datetime, timedelta
+from app import crud
+from app.models.cluster import Cluster
+from app.models.deployment import Deployment, DeploymentStatus
+
+
+@pytest_asyncio.fixture
+async def clusters(db):
+    clusters = [
+        Cluster(
+            name=f"Cluster {i}",
+            organization_id=1,
+            cpu_limit=8,
+            ram_limit=16,
+            gpu_limit=2,
+            cpu_available=8,
+            ram_available=16,
+            gpu_available=2,
+        )
+        for i in range(3)
+    ]
+    db.add_all(clusters)
+    await db.commit()
+    return clusters
+
+
+@pytest_asyncio.fixture
+async def deployments(db, clusters):
+    now = datetime.now()
+    deployments = [
+        Deployment(
+            name=f"deployment-{i}",
+            docker_image="image:latest",
+            cluster_id=clusters[i % 2].id,
+            organization_id=1,
+            status=DeploymentStatus.PENDING if i % 2 else DeploymentStatus.RUNNING,
+            priority=i,
+            created_at=now + timedelta(minutes=i),
+            required_time=60,
+            cpu_required=1,
+            ram_required=1,
+            gpu_required=0,
+        )
+        for i in range(6)
+    ]
+    db.add_all(deployments)
+    await db.commit()
+    return deployments
+
+
+@pytest.mark.asyncio
+async def test_get_clusters_by_organization_pages_by_id(db, clusters):
+    first = await crud.get_clusters_by_organization(db, organization_id=1, limit=2)
+    second = await crud.get_clusters_by_organization(
+        db, organization_id=1, limit=2, after=first[-1].id
+    )
+
+    assert [c.id for c in first + second] == [c.id for c in clusters]
+
+
+@pytest.mark.asyncio
+async def test_get_deployments_by_organization_pages_by_id(db, deployments):
+    first = await crud.get_deployments_by_organization(db, organization_id=1, limit=4)
+    second = await crud.get_deployments_by_organization(
+        db, organization_id=1, limit=4, after=first[-1].id
+    )
+
+    assert [d.id for d in first] == [d.id for d in deployments[:4]]
+    assert [d.id for d in second] == [d.id for d in deployments[4:]]
+
+
+@pytest.mark.asyncio
+async def test_get_deployments_by_organization_filters(db, clusters, deployments):
+    pending = await crud.get_deployments_by_organization(
+        db, organization_id=1, limit=10, status=DeploymentStatus.PENDING
+    )
+    on_cluster = await crud.get_deployments_by_organization(
+        db, organization_id=1, limit=10, cluster_id=clusters[0].id
+    )
+    in_range = await crud.get_deployments_by_organization(
+        db,
+        organization_id=1,
+        limit=10,
+        min_priority=2,
+        max_priority=4,
+        created_before=deployments[4].created_at,
+    )
+
+    assert [d.name for d in pending] == ["deployment-1", "deployment-3", "deployment-5"]
+    assert [d.name for d in on_cluster] == [
+        "deployment-0",
+        "deployment-2",
+        "deployment-4",
+    ]
+    assert [d.name for d in in_range] == ["deployment-2", "deployment-3"]
+
+
+@pytest.mark.asyncio
+async def test_get_deployment_ids_by_organization(db, deployments):
+    assert await crud.get_deployment_ids_by_organization(db, 1) == [
+        d.id for d in deployments
+    ]
+    assert await crud.get_deployment_ids_by_organization(db, 2) == []
+    assert await crud.get_deployment_ids_by_organization(
+        db, 1, limit=2, after=deployments[2].id
+    ) == [d.id for d in deployments[3:5]]
+
+
+@pytest.mark.asyncio
+async def test_cluster_capacities_are_scoped_to_the_organization(db, clusters):
+    other = Cluster(
+        name="Other",
+        organization_id=2,
+        cpu_limit=4,
+        ram_limit=4,
+        gpu_limit=0,
+        cpu_available=4,
+        ram_available=4,
+        gpu_available=0,
+    )
+    db.add(other)
+    await db.commit()
+
+    scoped = await crud.get_cluster_capacities(db, 1)
+    everything = await crud.get_all_cluster_capacities(db)
+
+    assert [row[0] for row in scoped] == [c.id for c in clusters]
+    by_id = {row[0]: tuple(row) for row in everything}
+    assert sorted(by_id) == [c.id for c in clusters] + [other.id]
+    assert by_id[other.id] == (other.id, 4, 4, 0, 4, 4, 0)
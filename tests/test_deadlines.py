@@ -0,0 +1,127 @@
+import asyncio
+import time
+import pytest
+from datetime import datetime, timedelta
+from app import crud
+from app.core.config import settings
+from app.core.redis import (
+    DEADLINES_KEY,
+    DeadlineWaker,
+    pop_due_deployments,
+    redis_client,
+    seconds_until_next_deadline,
+    update_deployment_status,
+)
+from app.models.cluster import Cluster
+from app.models.deployment import Deployment, DeploymentStatus
+
+pytestmark = pytest.mark.usefixtures("fake_redis")
+
+
+@pytest.mark.asyncio
+async def test_pop_due_deployments_claims_only_due_ids_once():
+    now = time.time()
+    await redis_client.zadd(DEADLINES_KEY, {"1": now - 10, "2": now, "3": now + 60})
+
+    assert await pop_due_deployments(now) == {"1": now - 10, "2": now}
+    assert await pop_due_deployments(now) == {}
+    assert await redis_client.zrange(DEADLINES_KEY, 0, -1) == ["3"]
+
+
+@pytest.mark.asyncio
+async def test_seconds_until_next_deadline_is_capped():
+    assert await seconds_until_next_deadline() == settings.DEADLINE_SWEEP_MAX_INTERVAL
+
+    await redis_client.zadd(DEADLINES_KEY, {"1": time.time() + 1e6})
+    assert await seconds_until_next_deadline() == settings.DEADLINE_SWEEP_MAX_INTERVAL
+
+    await redis_client.zadd(DEADLINES_KEY, {"2": time.time() - 5})
+    assert await seconds_until_next_deadline() == 0
+
+
+@pytest.mark.asyncio
+async def test_notify_wakes_wait_early():
+    waker = DeadlineWaker()
+    waker.bind()
+    asyncio.get_running_loop().call_later(0.05, waker.notify, time.time())
+
+    started = time.monotonic()
+    await waker.wait(10)
+    assert time.monotonic() - started < 5
+
+    # A deadline after the one being waited for does not wake it
+    asyncio.get_running_loop().call_later(0.05, waker.notify, time.time() + 60)
+    started = time.monotonic()
+    await waker.wait(0.3)
+    assert time.monotonic() - started >= 0.25
+
+
+@pytest.mark.asyncio
+async def test_sweep_skips_deployments_no_longer_running(db):
+    cluster = Cluster(
+        name="Test Cluster",
+        organization_id=1,
+        cpu_limit=8,
+        ram_limit=16,
+        gpu_limit=0,
+        cpu_available=2,
+        ram_available=16,
+        gpu_available=0,
+        running_count=1,
+        pending_count=1,
+    )
+    db.add(cluster)
+    await db.commit()
+    now = datetime.now()
+    deployments = {
+        status: Deployment(
+            name=status.value,
+            docker_image="image:latest",
+            cluster_id=cluster.id,
+            organization_id=1,
+            status=status,
+            priority=0,
+            started_at=now - timedelta(hours=1),
+            required_time=60,
+            cpu_required=6,
+            ram_required=0,
+            gpu_required=0,
+        )
+        # The PENDING one was evicted after its deadline was indexed
+        for status in (DeploymentStatus.RUNNING, DeploymentStatus.PENDING)
+    }
+    db.add_all(deployments.values())
+    await db.commit()
+    await redis_client.zadd(
+        DEADLINES_KEY, {str(d.id): time.time() - 1 for d in deployments.values()}
+    )
+
+    assert await update_deployment_status(db) == 1
+    for deployment in (cluster, *deployments.values()):
+        await db.refresh(deployment)
+
+    finished, evicted = deployments.values()
+    assert finished.status == DeploymentStatus.COMPLETED
+    # Not completed; it starts afresh on the freed resources instead
+    assert evicted.status == DeploymentStatus.RUNNING
+    assert evicted.started_at > now
+    assert cluster.cpu_available == 2
+    counts = (cluster.pending_count, cluster.running_count, cluster.completed_count)
+    assert counts == (0, 1, 1)
+    assert await redis_client.zrange(DEADLINES_KEY, 0, -1) == [str(evicted.id)]
+
+
+@pytest.mark.asyncio
+async def test_failed_sweep_puts_claimed_deadlines_back(db, monkeypatch):
+    deadlines = {"1": time.time() - 10, "2": time.time() - 5}
+    await redis_client.zadd(DEADLINES_KEY, deadlines)
+
+    async def time_out(*args, **kwargs):
+        raise TimeoutError("statement timeout")
+
+    monkeypatch.setattr(crud, "complete_deployments", time_out)
+    with pytest.raises(TimeoutError):
+        await update_deployment_status(db)
+
+    restored = await redis_client.zrange(DEADLINES_KEY, 0, -1, withscores=True)
+    assert dict(restored) == deadlines
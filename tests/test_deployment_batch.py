@@ -0,0 +1,186 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from app.core.config import settings
+from app.models.cluster import Cluster
+from app.models.organization import Organization
+
+PREFIX = "/api/v1"
+CREDENTIALS = {"username": "batch", "password": "batch-password"}
+
+
+@pytest.fixture(scope="module")
+def client(api):
+    with TestClient(api) as test_client:
+        test_client.engine = api.state.session_factory.kw["bind"]
+        seed(test_client)
+        yield test_client
+
+
+def seed(client: TestClient) -> None:
+    requests = [
+        ("/auth/register", {"json": {**CREDENTIALS, "email": "batch@example.com"}}),
+        ("/auth/login", {"params": CREDENTIALS}),
+        ("/organizations/", {"json": {"name": "Batch Org"}}),
+    ]
+    for path, kwargs in requests:
+        response = client.post(f"{PREFIX}{path}", **kwargs)
+        assert response.status_code == 200, response.text
+    client.cluster_id = add_cluster(client, "CPU Cluster", cpu=8, gpu=0)
+
+    async def add_other_organization_cluster() -> int:
+        async with client.app.state.session_factory() as db:
+            organization = Organization(name="Other Org")
+            db.add(organization)
+            await db.flush()
+            cluster = Cluster(
+                name="Other Cluster",
+                organization_id=organization.id,
+                cpu_limit=8,
+                ram_limit=8,
+                gpu_limit=0,
+                cpu_available=8,
+                ram_available=8,
+                gpu_available=0,
+            )
+            db.add(cluster)
+            await db.commit()
+            return cluster.id
+
+    client.other_cluster_id = client.portal.call(add_other_organization_cluster)
+
+
+def add_cluster(client: TestClient, name: str, cpu: float, gpu: float) -> int:
+    cluster = {"name": name, "organization_id": 0}
+    for resource, limit in (("cpu", cpu), ("ram", 8), ("gpu", gpu)):
+        cluster.update({f"{resource}_limit": limit, f"{resource}_available": limit})
+    response = client.post(f"{PREFIX}/clusters/", json=cluster)
+    assert response.status_code == 200, response.text
+    return response.json()["id"]
+
+
+def item(name: str, cpu: float = 1, gpu: float = 0, cluster_id=None) -> dict:
+    return {
+        "name": name,
+        "docker_image": "image:latest",
+        "cpu_required": cpu,
+        "ram_required": 1,
+        "gpu_required": gpu,
+        "required_time": 3600,
+        "cluster_id": cluster_id,
+    }
+
+
+def submit(client: TestClient, items: list) -> list:
+    response = client.post(f"{PREFIX}/deployments/batch", json=items)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_batch_reports_each_item_in_submission_order(client):
+    results = submit(
+        client,
+        [
+            item("missing", cluster_id=999999),
+            item("accepted", cluster_id=client.cluster_id),
+            item("foreign", cluster_id=client.other_cluster_id),
+            item("too-large", cpu=100, cluster_id=client.cluster_id),
+            item("nowhere", cpu=100),
+        ],
+    )
+
+    assert [result["index"] for result in results] == [0, 1, 2, 3, 4]
+    assert [(result["status_code"], result["error"]) for result in results] == [
+        (404, "Cluster not found"),
+        (200, None),
+        (403, "User does not have access to this organization's cluster"),
+        (400, "Deployment exceeds cluster resource limits"),
+        (400, "No cluster in the organization can fit this deployment"),
+    ]
+    accepted = results[1]["deployment"]
+    assert (accepted["name"], accepted["cluster_id"]) == ("accepted", client.cluster_id)
+    assert all(
+        result["deployment"] is None for i, result in enumerate(results) if i != 1
+    )
+
+
+def test_batch_places_items_without_a_cluster_alongside_explicit_ones(client):
+    gpu_cluster_id = add_cluster(client, "GPU Cluster", cpu=8, gpu=2)
+
+    results = submit(
+        client,
+        [
+            item("explicit", cluster_id=client.cluster_id),
+            item("gpu-0", gpu=1),
+            item("gpu-1", gpu=1),
+            # No room left anywhere, but the GPU cluster's limits hold it
+            item("gpu-2", gpu=1),
+            item("gpu-too-many", gpu=4),
+        ],
+    )
+
+    placed = [
+        (result["deployment"]["cluster_id"], result["deployment"]["status"])
+        for result in results[:4]
+    ]
+    assert placed == [
+        (client.cluster_id, "running"),
+        (gpu_cluster_id, "running"),
+        (gpu_cluster_id, "running"),
+        (gpu_cluster_id, "pending"),
+    ]
+    assert results[4]["status_code"] == 400
+    assert results[4]["deployment"] is None
+
+
+def test_batch_with_every_item_rejected_writes_nothing(client):
+    statements, commits = [], []
+
+    def record_statement(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    def record_commit(conn):
+        commits.append(conn)
+
+    engine = client.engine.sync_engine
+    event.listen(engine, "before_cursor_execute", record_statement)
+    event.listen(engine, "commit", record_commit)
+    try:
+        results = submit(
+            client,
+            [
+                item("missing", cluster_id=999999),
+                item("foreign", cluster_id=client.other_cluster_id),
+            ],
+        )
+    finally:
+        event.remove(engine, "before_cursor_execute", record_statement)
+        event.remove(engine, "commit", record_commit)
+
+    assert [result["status_code"] for result in results] == [404, 403]
+    assert statements
+    assert all(statement.lstrip().startswith("SELECT") for statement in statements)
+    assert commits == []
+
+
+def test_batch_above_the_maximum_is_rejected(client):
+    items = [item("d", cluster_id=client.cluster_id)] * (
+        settings.DEPLOYMENT_BATCH_MAX + 1
+    )
+
+    response = client.post(f"{PREFIX}/deployments/batch", json=items)
+
+    assert response.status_code == 422
+
+
+def test_batch_above_the_placement_bound_is_rejected(client, monkeypatch):
+    monkeypatch.setattr(settings, "PLACEMENT_MAX_WORK", 1)
+
+    response = client.post(f"{PREFIX}/deployments/batch", json=[item("unplaced")])
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == (
+        "Too many deployments to place; set `cluster_id` on some"
+    )
+    # Items with a cluster need no placement
+    assert submit(client, [item("placed", cluster_id=client.cluster_id)])
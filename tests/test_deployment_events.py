@@ -0,0 +1,156 @@
+import json
+import pytest
+from fastapi import Request
+from fastapi.testclient import TestClient
+from app.core.config import settings
+from app.core.redis import (
+    DEADLINES_KEY,
+    queue_status_event,
+    read_status_events,
+    redis_client,
+    update_deployment_status,
+)
+from app.models.deployment import DeploymentStatus
+
+PREFIX = "/api/v1"
+CREDENTIALS = {"username": "events", "password": "events-password"}
+
+
+@pytest.fixture(scope="module")
+def client(api):
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(settings, "DEPLOYMENT_EVENTS_HEARTBEAT", 0.05)
+        with TestClient(api) as test_client:
+            test_client.session_factory = api.state.session_factory
+            seed(test_client)
+            yield test_client
+
+
+def seed(client: TestClient) -> None:
+    response = client.post(
+        f"{PREFIX}/auth/register", json={**CREDENTIALS, "email": "e@example.com"}
+    )
+    assert response.status_code == 200, response.text
+
+    requests = [
+        ("/auth/login", {"params": CREDENTIALS}),
+        ("/organizations/", {"json": {"name": "Events Org"}}),
+    ]
+    for path, kwargs in requests:
+        response = client.post(f"{PREFIX}{path}", **kwargs)
+        assert response.status_code == 200, response.text
+    organization_id = response.json()["id"]
+
+    cluster = {"name": "Events Cluster", "organization_id": organization_id}
+    for resource, limit in (("cpu", 4), ("ram", 4), ("gpu", 0)):
+        cluster.update({f"{resource}_limit": limit, f"{resource}_available": limit})
+    response = client.post(f"{PREFIX}/clusters/", json=cluster)
+    assert response.status_code == 200, response.text
+    client.cluster_id = response.json()["id"]
+
+
+def create_deployment(client: TestClient, cpu: float) -> dict:
+    deployment = {
+        "name": "d",
+        "docker_image": "image:latest",
+        "cpu_required": cpu,
+        "ram_required": 0,
+        "gpu_required": 0,
+        "required_time": 3600,
+        "cluster_id": client.cluster_id,
+    }
+    response = client.post(f"{PREFIX}/deployments/", json=deployment)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def read_frames(client, monkeypatch, last_event_id=None) -> list:
+    """
+    Reads one batch of events from the stream, as (id, data) pairs.
+    """
+    checks = iter([False])
+
+    async def is_disconnected(self) -> bool:
+        return next(checks, True)
+
+    monkeypatch.setattr(Request, "is_disconnected", is_disconnected)
+    headers = {"Last-Event-ID": last_event_id} if last_event_id else {}
+    response = client.get(f"{PREFIX}/deployments/events", headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"].startswith("text/event-stream")
+
+    frames = []
+    for block in response.text.split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines() if ": " in line)
+        if "id" in lines:
+            assert lines["event"] == "status"
+            frames.append((lines["id"], json.loads(lines["data"])))
+    return frames
+
+
+def test_events_follow_creation_and_completion(client, monkeypatch):
+    running = create_deployment(client, cpu=4)
+    pending = create_deployment(client, cpu=2)
+
+    frames = read_frames(client, monkeypatch, last_event_id="0")
+    assert [data for _, data in frames][-2:] == [
+        {
+            "deployment_id": str(running["id"]),
+            "cluster_id": str(client.cluster_id),
+            "status": "running",
+        },
+        {
+            "deployment_id": str(pending["id"]),
+            "cluster_id": str(client.cluster_id),
+            "status": "pending",
+        },
+    ]
+
+    # The running deployment's deadline passes; the sweep completes it and
+    # starts the pending one in its place.
+    async def sweep():
+        await redis_client.zadd(DEADLINES_KEY, {str(running["id"]): 0})
+        async with client.session_factory() as db:
+            await update_deployment_status(db)
+
+    client.portal.call(sweep)
+
+    swept = read_frames(client, monkeypatch, last_event_id=frames[-1][0])
+    assert [(data["deployment_id"], data["status"]) for _, data in swept] == [
+        (str(running["id"]), "completed"),
+        (str(pending["id"]), "running"),
+    ]
+
+
+def test_events_resume_after_last_event_id(client, monkeypatch):
+    for _ in range(3):
+        create_deployment(client, cpu=0)
+    frames = read_frames(client, monkeypatch, last_event_id="0-0")
+
+    resumed = read_frames(client, monkeypatch, last_event_id=frames[-3][0])
+
+    assert resumed == frames[-2:]
+
+
+def test_events_reject_malformed_last_event_id(client):
+    response = client.get(
+        f"{PREFIX}/deployments/events", headers={"Last-Event-ID": "not-an-id"}
+    )
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Malformed Last-Event-ID"
+
+
+def test_status_events_round_trip_through_the_stream(client):
+    async def publish_and_read():
+        pipe = redis_client.pipeline(transaction=False)
+        queue_status_event(pipe, 999, 1, 2, DeploymentStatus.FAILED)
+        queue_status_event(pipe, None, 3, 4, DeploymentStatus.FAILED)  # Dropped
+        await pipe.execute()
+        return await read_status_events(999, "0-0", block=0.05)
+
+    entries = client.portal.call(publish_and_read)
+
+    assert [fields for _, fields in entries] == [
+        {"deployment_id": "1", "cluster_id": "2", "status": "failed"}
+    ]
@@ -0,0 +1,103 @@
+import pytest
+import pytest_asyncio
+from datetime import datetime
+from app import crud
+from app.api.v1.endpoints.deployments import (
+    deployment_index_keys,
+    index_deployment,
+    load_deployments,
+    rebuild_deployment_index,
+)
+from app.core.config import settings
+from app.core.redis import redis_client, serialize_deployment
+from app.models.deployment import Deployment, DeploymentStatus
+
+pytestmark = pytest.mark.usefixtures("fake_redis")
+
+
+@pytest_asyncio.fixture
+async def deployments(db):
+    deployments = [
+        Deployment(
+            name=f"deployment-{i}",
+            docker_image="image:latest",
+            cluster_id=1,
+            organization_id=1,
+            status=DeploymentStatus.PENDING,
+            created_at=datetime.now(),
+            required_time=60,
+            cpu_required=1,
+            ram_required=1,
+            gpu_required=0,
+        )
+        for i in range(5)
+    ]
+    db.add_all(deployments)
+    await db.commit()
+    return deployments
+
+
+@pytest.mark.asyncio
+async def test_rebuild_keeps_ids_created_while_it_runs(db, deployments, monkeypatch):
+    monkeypatch.setattr(settings, "DEPLOYMENT_INDEX_CHUNK", 2)
+    index_key, _ = keys = deployment_index_keys(1)
+    read_ids = crud.get_deployment_ids_by_organization
+
+    async def read_ids_during_create(*args, **kwargs):
+        ids = await read_ids(*args, **kwargs)
+        # Committed after the first chunk was read, indexed like create does
+        if kwargs["after"] is None:
+            await index_deployment(keys=keys, args=[99, 99])
+            # A second rebuild meanwhile leaves this one alone
+            assert not await rebuild_deployment_index(db, 1)
+        return ids
+
+    monkeypatch.setattr(
+        crud, "get_deployment_ids_by_organization", read_ids_during_create
+    )
+
+    assert await rebuild_deployment_index(db, 1)
+
+    members = await redis_client.zrange(index_key, 0, -1)
+    assert members == [str(d.id) for d in deployments] + ["99"]
+    assert 0 < await redis_client.ttl(index_key) <= settings.DEPLOYMENT_CACHE_TTL
+    assert await redis_client.keys("*staging*") == []
+
+
+@pytest.mark.asyncio
+async def test_rebuild_that_lost_its_staging_set_publishes_nothing(db, deployments):
+    index_key, staging_key = deployment_index_keys(1)
+    read_ids = crud.get_deployment_ids_by_organization
+
+    async def expire_staging(*args, **kwargs):
+        await redis_client.delete(staging_key)
+        return await read_ids(*args, **kwargs)
+
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(crud, "get_deployment_ids_by_organization", expire_staging)
+        assert not await rebuild_deployment_index(db, 1)
+
+    assert not await redis_client.exists(index_key, staging_key)
+
+
+@pytest.mark.asyncio
+async def test_load_deployments_keeps_state_cached_meanwhile(
+    db, deployments, monkeypatch
+):
+    raced, other = deployments[:2]
+    scalars = db.scalars
+
+    async def read_then_start(*args, **kwargs):
+        rows = await scalars(*args, **kwargs)
+        # Another worker starts the deployment and caches it after this read
+        started = {**serialize_deployment(raced), "status": "running"}
+        await redis_client.hset(f"deployment:{raced.id}", mapping=started)
+        return rows
+
+    monkeypatch.setattr(db, "scalars", read_then_start)
+
+    await load_deployments(db, [str(raced.id), str(other.id)])
+
+    assert await redis_client.hget(f"deployment:{raced.id}", "status") == "running"
+    assert await redis_client.hget(f"deployment:{other.id}", "status") == "pending"
+    assert 0 < await redis_client.ttl(f"deployment:{other.id}")
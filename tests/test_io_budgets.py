@@ -0,0 +1,142 @@
+"""
+Per-endpoint I/O budgets: how many SQL statements, commits and Redis round
+trips one request may cost. A change that adds a query or a round trip to a
+hot path fails here with the counts, instead of surfacing later as latency.
+
+Budgets are for warm steady-state requests: caches are primed first, so they
+pin the cost of the common path rather than of a cold start.
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+from app.core.metrics import RequestStats, request_stats
+from app.core.utilization import utilization_store
+
+PREFIX = "/api/v1"
+CREDENTIALS = {"username": "budget", "password": "budget-password"}
+DEPLOYMENT = {
+    "docker_image": "image:latest",
+    "cpu_required": 1,
+    "ram_required": 1,
+    "gpu_required": 0,
+    "priority": 1,
+    "required_time": 3600,
+}
+
+
+class RequestIORecorder:
+    """
+    ASGI wrapper that keeps the I/O counts of the last request it served.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+        self.last = RequestStats()
+
+    async def __call__(self, scope, receive, send) -> None:
+        stats = RequestStats()
+        token = request_stats.set(stats)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            request_stats.reset(token)
+            self.last = stats
+
+
+def assert_io_budget(
+    stats: RequestStats, db_statements: int, db_commits: int, redis_round_trips: int
+) -> None:
+    spent = (stats.db_statements, stats.db_commits, stats.redis_round_trips)
+    budget = (db_statements, db_commits, redis_round_trips)
+    assert all(
+        s <= b for s, b in zip(spent, budget)
+    ), f"spent (statements, commits, round trips) {spent}, budget {budget}"
+
+
+@pytest.fixture(scope="module")
+def client(api):
+    recorder = RequestIORecorder(api)
+    with TestClient(recorder) as test_client:
+        test_client.recorder = recorder
+        seed(test_client)
+        yield test_client
+
+
+def seed(client: TestClient) -> None:
+    cluster = {"name": "Budget Cluster", "organization_id": 0}
+    for resource, limit in (("cpu", 64), ("ram", 64), ("gpu", 0)):
+        cluster.update({f"{resource}_limit": limit, f"{resource}_available": limit})
+    requests = [
+        ("/auth/register", {"json": {**CREDENTIALS, "email": "b@example.com"}}),
+        ("/auth/login", {"params": CREDENTIALS}),
+        ("/organizations/", {"json": {"name": "Budget Org"}}),
+        ("/clusters/", {"json": cluster}),
+    ]
+    requests += [
+        ("/deployments/", {"json": {**DEPLOYMENT, "name": f"seed-{i}"}})
+        for i in range(20)
+    ]
+    for path, kwargs in requests:
+        response = client.post(f"{PREFIX}{path}", **kwargs)
+        assert response.status_code == 200, response.text
+
+
+def spend(client: TestClient, method: str, path: str, **kwargs) -> RequestStats:
+    response = client.request(method, f"{PREFIX}{path}", **kwargs)
+    assert response.status_code == 200, response.text
+    return client.recorder.last
+
+
+def test_list_deployments_budget(client):
+    # The first page hydrates the org's id index from the database.
+    spend(client, "GET", "/deployments/", params={"limit": 100})
+    stats = spend(client, "GET", "/deployments/", params={"limit": 100})
+    assert_io_budget(stats, db_statements=0, db_commits=0, redis_round_trips=2)
+
+
+def test_create_deployment_budget(client):
+    stats = spend(
+        client, "POST", "/deployments/", json={**DEPLOYMENT, "name": "budgeted"}
+    )
+    # One transaction to insert, one to admit; one pipeline for the events.
+    assert_io_budget(stats, db_statements=9, db_commits=2, redis_round_trips=1)
+
+
+def test_create_deployments_batch_budget(client):
+    batch = [{**DEPLOYMENT, "name": f"batch-{i}"} for i in range(10)]
+    stats = spend(client, "POST", "/deployments/batch", json=batch)
+    # SQLite cannot batch INSERT ... RETURNING, so each row costs a statement
+    # there; on Postgres the ORM sends the rows in one.
+    assert_io_budget(
+        stats, db_statements=6 + len(batch), db_commits=2, redis_round_trips=1
+    )
+
+
+def test_list_clusters_budget(client):
+    stats = spend(client, "GET", "/clusters/")
+    assert_io_budget(stats, db_statements=1, db_commits=0, redis_round_trips=0)
+
+
+def test_summarize_clusters_budget(client):
+    stats = spend(client, "GET", "/clusters/summary")
+    assert_io_budget(stats, db_statements=1, db_commits=0, redis_round_trips=0)
+
+
+def test_simulate_deployments_budget(client):
+    proposals = [{**DEPLOYMENT, "name": f"what-if-{i}"} for i in range(100)]
+    stats = spend(client, "POST", "/clusters/simulate", json=proposals)
+    # The clusters and their workload are read once, whatever the batch size.
+    assert_io_budget(stats, db_statements=2, db_commits=0, redis_round_trips=0)
+
+
+def test_cluster_utilization_budget(client, monkeypatch):
+    monkeypatch.setattr(utilization_store, "recording", True)
+    cluster_id = client.get(f"{PREFIX}/clusters/").json()[0]["id"]
+    stats = spend(client, "GET", f"/clusters/{cluster_id}/utilization")
+    # Only the access check touches the database; samples are in memory.
+    assert_io_budget(stats, db_statements=1, db_commits=0, redis_round_trips=0)
+
+
+def test_login_budget(client):
+    stats = spend(client, "POST", "/auth/login", params=CREDENTIALS)
+    assert_io_budget(stats, db_statements=1, db_commits=0, redis_round_trips=0)
@@ -0,0 +1,78 @@
+import pytest
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.runtime.migration import MigrationContext
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+from app.db.base import Base
+from app.db.migrations import (
+    SchemaOutOfDate,
+    alembic_config,
+    check_database_revision,
+    upgrade_database,
+)
+
+
+@pytest.mark.asyncio
+async def test_migrations_build_the_models_schema(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/migrated.db")
+
+    with pytest.raises(SchemaOutOfDate):
+        await check_database_revision(engine)
+
+    await upgrade_database(engine)
+    await check_database_revision(engine)
+
+    def diff(connection):
+        return compare_metadata(MigrationContext.configure(connection), Base.metadata)
+
+    async with engine.connect() as connection:
+        assert await connection.run_sync(diff) == []
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_upgrade_from_the_baseline_backfills_existing_rows(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/baseline.db")
+    config = alembic_config()
+
+    def upgrade_to_baseline(connection) -> None:
+        config.attributes["connection"] = connection
+        command.upgrade(config, "0001")
+
+    async with engine.begin() as connection:
+        await connection.run_sync(upgrade_to_baseline)
+        await connection.execute(
+            text("INSERT INTO organization (id, name) VALUES (7, 'org');")
+        )
+        await connection.execute(
+            text("INSERT INTO cluster (id, name, organization_id) VALUES (3, 'c', 7)")
+        )
+        for status in ("PENDING", "RUNNING", "RUNNING", "COMPLETED"):
+            await connection.execute(
+                text(
+                    "INSERT INTO deployment (cluster_id, status, created_at, "
+                    "required_time) VALUES (3, :status, '2026-01-01 00:00:00', 60)"
+                ),
+                {"status": status},
+            )
+
+    await upgrade_database(engine)
+
+    async with engine.connect() as connection:
+        counters = await connection.execute(
+            text("SELECT pending_count, running_count, completed_count FROM cluster")
+        )
+        assert counters.one() == (1, 2, 1)
+        deployments = await connection.execute(
+            text("SELECT DISTINCT organization_id FROM deployment")
+        )
+        assert deployments.scalars().all() == [7]
+        started = await connection.execute(
+            text(
+                "SELECT count(*) FROM deployment "
+                "WHERE status = 'RUNNING' AND started_at = created_at"
+            )
+        )
+        assert started.scalar() == 2
+    await engine.dispose()
@@ -0,0 +1,130 @@
+import numpy as np
+import pytest
+from app.models.cluster import Cluster
+from app.core.placement import CapacityIndex, ClusterCapacityView
+
+
+async def add_cluster(db, name, cpu_available, organization_id=1, cpu_limit=16):
+    cluster = Cluster(
+        name=name,
+        organization_id=organization_id,
+        cpu_limit=cpu_limit,
+        ram_limit=32,
+        gpu_limit=4,
+        cpu_available=cpu_available,
+        ram_available=32,
+        gpu_available=4,
+    )
+    db.add(cluster)
+    await db.commit()
+    return cluster
+
+
+@pytest.mark.asyncio
+async def test_place_prefers_tightest_fit(db):
+    await add_cluster(db, "empty", cpu_available=16)
+    tight = await add_cluster(db, "tight", cpu_available=4)
+    view = ClusterCapacityView(ttl=60)
+
+    assert await view.place(db, 1, cpu=4, ram=32, gpu=4) == tight.id
+
+
+@pytest.mark.asyncio
+async def test_place_ignores_other_organizations(db):
+    await add_cluster(db, "other", cpu_available=4, organization_id=2)
+    own = await add_cluster(db, "own", cpu_available=16)
+    view = ClusterCapacityView(ttl=60)
+
+    assert await view.place(db, 1, cpu=4, ram=1, gpu=0) == own.id
+
+
+@pytest.mark.asyncio
+async def test_place_falls_back_to_least_loaded_cluster(db):
+    await add_cluster(db, "busy", cpu_available=1)
+    idle = await add_cluster(db, "idle", cpu_available=3)
+    view = ClusterCapacityView(ttl=60)
+
+    assert await view.place(db, 1, cpu=8, ram=1, gpu=0) == idle.id
+
+
+@pytest.mark.asyncio
+async def test_place_returns_none_when_limits_too_small(db):
+    await add_cluster(db, "small", cpu_available=16)
+    view = ClusterCapacityView(ttl=60)
+
+    assert await view.place(db, 1, cpu=64, ram=1, gpu=0) is None
+
+
+@pytest.mark.asyncio
+async def test_update_is_reflected_without_reload(db):
+    first = await add_cluster(db, "first", cpu_available=8)
+    second = await add_cluster(db, "second", cpu_available=12)
+    view = ClusterCapacityView(ttl=60)
+    assert await view.place(db, 1, cpu=8, ram=1, gpu=0) == first.id
+
+    first.cpu_available = 0
+    view.update(first)
+
+    assert await view.place(db, 1, cpu=8, ram=1, gpu=0) == second.id
+
+
+@pytest.mark.asyncio
+async def test_place_many_spreads_a_batch_without_changing_the_view(db):
+    first = await add_cluster(db, "first", cpu_available=8)
+    second = await add_cluster(db, "second", cpu_available=12)
+    view = ClusterCapacityView(ttl=60)
+
+    placements = await view.place_many(db, 1, [(8, 1, 0), (8, 1, 0)])
+
+    assert placements == [first.id, second.id]
+    assert await view.place(db, 1, cpu=8, ram=1, gpu=0) == first.id
+
+
+def test_capacity_index_ranks_fitting_clusters_and_counts_fits():
+    index = CapacityIndex.from_rows(
+        [
+            (1, 16, 32, 4, 16, 32, 4),
+            (2, 16, 32, 4, 4, 32, 4),
+            (3, 16, 32, 0, 8, 32, 0),
+            (4, None, None, None, None, None, None),
+        ]
+    )
+
+    assert [cluster_id for cluster_id, _ in index.ranked((4, 1, 0))] == [3, 1, 2]
+    assert index.choose((4, 1, 1)) == 1
+    assert index.count_fitting([(4, 1, 0), (8, 1, 1), (32, 1, 0)]).tolist() == [
+        3,
+        1,
+        0,
+    ]
+
+    index.adjust(3, -8, 0, 0)
+    assert [cluster_id for cluster_id, _ in index.ranked((4, 1, 0))] == [1, 2]
+
+
+def test_place_many_matches_choosing_one_at_a_time():
+    rng = np.random.default_rng(0)
+    for trial in range(20):
+        n = int(rng.integers(1, 300))
+        limits = rng.choice([0, 8, 16, 64], size=(n, 3)).astype(float)
+        available = np.floor(limits * rng.random((n, 3)))
+        # A cluster with a missing limit but free resources
+        limits[rng.integers(0, n), rng.integers(0, 3)] = np.nan
+        index = CapacityIndex(range(n), limits, available)
+        if trial % 2:
+            # Every shape distinct
+            shapes = rng.uniform(0, 12, size=(1000, 3)).tolist()
+        else:
+            # Few distinct shapes, so scores are reused and clusters fill up
+            templates = rng.integers(0, 12, size=(int(rng.integers(1, 100)), 3))
+            shapes = templates[rng.integers(0, len(templates), 1000)].tolist()
+
+        expected = []
+        reference = index.copy()
+        for shape in shapes:
+            cluster_id = reference.choose(shape)
+            expected.append(cluster_id)
+            if cluster_id is not None and reference.fits(cluster_id, shape):
+                reference.adjust(cluster_id, *(-amount for amount in shape))
+
+        assert index.place_many(shapes) == expected
@@ -0,0 +1,46 @@
+import pytest
+from app.core.principals import PrincipalCache, UserPrincipal
+
+
+@pytest.mark.asyncio
+async def test_cache_returns_stored_principal():
+    cache = PrincipalCache(maxsize=10, ttl=60, use_redis=False)
+    principal = UserPrincipal(id=1, organization_id=7, is_active=True)
+
+    await cache.set(principal)
+
+    assert await cache.get(1) == principal
+
+
+@pytest.mark.asyncio
+async def test_cache_skips_users_without_organization():
+    cache = PrincipalCache(maxsize=10, ttl=60, use_redis=False)
+
+    await cache.set(UserPrincipal(id=1, organization_id=None, is_active=True))
+
+    assert await cache.get(1) is None
+
+
+@pytest.mark.asyncio
+async def test_cache_evicts_least_recently_used():
+    cache = PrincipalCache(maxsize=2, ttl=60, use_redis=False)
+    for user_id in (1, 2):
+        await cache.set(UserPrincipal(id=user_id, organization_id=7, is_active=True))
+
+    await cache.get(1)
+    await cache.set(UserPrincipal(id=3, organization_id=7, is_active=True))
+
+    assert await cache.get(1) is not None
+    assert await cache.get(2) is None
+
+
+@pytest.mark.asyncio
+async def test_cache_expires_and_invalidates_entries():
+    cache = PrincipalCache(maxsize=10, ttl=0, use_redis=False)
+    await cache.set(UserPrincipal(id=1, organization_id=7, is_active=True))
+    assert await cache.get(1) is None
+
+    cache = PrincipalCache(maxsize=10, ttl=60, use_redis=False)
+    await cache.set(UserPrincipal(id=1, organization_id=7, is_active=True))
+    await cache.invalidate(1)
+    assert await cache.get(1) is None
@@ -0,0 +1,411 @@
+import pytest
+import pytest_asyncio
+from datetime import datetime, timedelta
+from app.models.cluster import Cluster
+from app.models.deployment import Deployment, DeploymentStatus
+from app import crud
+from app.core.fairshare import DecayedUsage, FairShare
+from app.core.scheduler import DeploymentScheduler, choose_victims, projected_start
+
+
+@pytest_asyncio.fixture
+async def cluster(db):
+    cluster = Cluster(
+        name="Test Cluster",
+        organization_id=1,
+        cpu_limit=8,
+        ram_limit=16,
+        gpu_limit=2,
+        cpu_available=8,
+        ram_available=16,
+        gpu_available=2,
+    )
+    db.add(cluster)
+    await db.commit()
+    return cluster
+
+
+async def make_deployment(
+    db, cluster, name, cpu, priority=0, created_at=None, required_time=60, user_id=None
+):
+    deployment = Deployment(
+        name=name,
+        docker_image="image:latest",
+        cluster_id=cluster.id,
+        user_id=user_id,
+        status=DeploymentStatus.PENDING,
+        priority=priority,
+        created_at=created_at or datetime.now(),
+        required_time=required_time,
+        cpu_required=cpu,
+        ram_required=1,
+        gpu_required=0,
+    )
+    db.add(deployment)
+    await db.commit()
+    return deployment
+
+
+@pytest.mark.asyncio
+async def test_schedule_starts_deployments_that_fit(db, cluster):
+    scheduler = DeploymentScheduler()
+    first = await make_deployment(db, cluster, "first", cpu=4)
+    second = await make_deployment(db, cluster, "second", cpu=6)
+    scheduler.enqueue(first)
+    scheduler.enqueue(second)
+
+    started = await scheduler.schedule(db, cluster.id)
+    await db.refresh(cluster)
+
+    assert [d.name for d in started] == ["first"]
+    assert first.status == DeploymentStatus.RUNNING
+    assert second.status == DeploymentStatus.PENDING
+    assert cluster.cpu_available == 4
+    assert scheduler.queue_depth(cluster.id) == 1
+
+
+@pytest.mark.asyncio
+async def test_schedule_orders_by_priority_then_created_at(db, cluster):
+    scheduler = DeploymentScheduler()
+    now = datetime.now()
+    old_low = await make_deployment(db, cluster, "old_low", cpu=8, created_at=now)
+    new_high = await make_deployment(
+        db, cluster, "new_high", cpu=8, priority=5, created_at=now + timedelta(1)
+    )
+    for deployment in (old_low, new_high):
+        scheduler.enqueue(deployment)
+
+    started = await scheduler.schedule(db, cluster.id)
+
+    assert [d.name for d in started] == ["new_high"]
+
+
+@pytest.mark.asyncio
+async def test_release_lets_queued_deployment_start(db, cluster):
+    scheduler = DeploymentScheduler()
+    running = await make_deployment(db, cluster, "running", cpu=8)
+    queued = await make_deployment(db, cluster, "queued", cpu=8)
+    scheduler.enqueue(running)
+    scheduler.enqueue(queued)
+    await scheduler.schedule(db, cluster.id)
+
+    running.status = DeploymentStatus.COMPLETED
+    await scheduler.release(db, cluster.id, cpu=8, ram=1, gpu=0)
+    await db.commit()
+    started = await scheduler.schedule(db, cluster.id)
+    await db.refresh(cluster)
+
+    assert [d.name for d in started] == ["queued"]
+    assert cluster.cpu_available == 0
+
+
+@pytest.mark.asyncio
+async def test_load_rebuilds_queues_from_pending_rows(db, cluster):
+    await make_deployment(db, cluster, "a", cpu=1)
+    await make_deployment(db, cluster, "b", cpu=1)
+    scheduler = DeploymentScheduler()
+
+    await scheduler.load(db)
+
+    assert scheduler.queue_depth(cluster.id) == 2
+
+
+@pytest.mark.asyncio
+async def test_reserve_cluster_resources_is_conditional(db, cluster):
+    assert await crud.reserve_cluster_resources(db, cluster.id, cpu=6, ram=1, gpu=0)
+    assert not await crud.reserve_cluster_resources(db, cluster.id, cpu=6, ram=1, gpu=0)
+    await db.commit()
+    await db.refresh(cluster)
+
+    assert cluster.cpu_available == 2
+
+
+@pytest.mark.asyncio
+async def test_schedule_skips_deployments_started_elsewhere(db, cluster):
+    scheduler = DeploymentScheduler()
+    stale = await make_deployment(db, cluster, "stale", cpu=4)
+    scheduler.enqueue(stale)
+    stale.status = DeploymentStatus.RUNNING
+    await db.commit()
+
+    started = await scheduler.schedule(db, cluster.id)
+    await db.refresh(cluster)
+
+    assert started == []
+    assert cluster.cpu_available == 8
+
+
+@pytest.mark.asyncio
+async def test_complete_deployments_only_touches_running_rows(db, cluster):
+    scheduler = DeploymentScheduler()
+    running = await make_deployment(db, cluster, "running", cpu=2)
+    pending = await make_deployment(db, cluster, "pending", cpu=2)
+    scheduler.enqueue(running)
+    await scheduler.schedule(db, cluster.id)
+
+    rows = await crud.complete_deployments(db, [running.id, pending.id], datetime.now())
+    await db.commit()
+    await db.refresh(running)
+    await db.refresh(pending)
+
+    assert [row.id for row in rows] == [running.id]
+    assert running.status == DeploymentStatus.COMPLETED
+    assert pending.status == DeploymentStatus.PENDING
+
+
+@pytest.mark.asyncio
+async def test_schedule_admits_every_fitting_head_at_once(db, cluster):
+    scheduler = DeploymentScheduler()
+    deployments = [await make_deployment(db, cluster, f"d{i}", cpu=2) for i in range(5)]
+    for deployment in deployments:
+        scheduler.enqueue(deployment)
+
+    started = await scheduler.schedule(db, cluster.id)
+    await db.refresh(cluster)
+
+    assert len(started) == 4
+    assert cluster.cpu_available == 0
+    assert scheduler.queue_depth(cluster.id) == 1
+
+
+@pytest.mark.asyncio
+async def test_cluster_counters_follow_admission_and_completion(db, cluster):
+    scheduler = DeploymentScheduler()
+    first = await make_deployment(db, cluster, "first", cpu=6)
+    second = await make_deployment(db, cluster, "second", cpu=6)
+    await crud.count_submitted_deployments(db, cluster.id, 2)
+    scheduler.enqueue(first)
+    scheduler.enqueue(second)
+
+    await scheduler.schedule(db, cluster.id)
+    await db.refresh(cluster)
+    assert (cluster.pending_count, cluster.running_count) == (1, 1)
+
+    await crud.complete_deployments(db, [first.id], datetime.now())
+    await scheduler.release(db, cluster.id, cpu=6, ram=1, gpu=0, completed=1)
+    await db.commit()
+    await scheduler.schedule(db, cluster.id)
+    await db.refresh(cluster)
+    assert (cluster.pending_count, cluster.running_count) == (0, 1)
+    assert cluster.completed_count == 1
+
+
+class Candidate:
+    def __init__(self, id, cpu, ram=0, gpu=0):
+        self.id = id
+        self.cpu_required = cpu
+        self.ram_required = ram
+        self.gpu_required = gpu
+
+
+def test_choose_victims_returns_a_minimal_set():
+    candidates = [Candidate(1, cpu=1), Candidate(2, cpu=1), Candidate(3, cpu=4)]
+
+    victims = choose_victims(candidates, need=(4, 0, 0))
+
+    assert [victim.id for victim in victims] == [3]
+
+
+def test_choose_victims_returns_nothing_when_need_cannot_be_covered():
+    candidates = [Candidate(1, cpu=1, gpu=0)]
+
+    assert choose_victims(candidates, need=(1, 0, 1)) == []
+
+
+@pytest.mark.asyncio
+async def test_preemption_evicts_lower_priority_and_requeues_it(db, cluster):
+    scheduler = DeploymentScheduler(preemption=True)
+    low = await make_deployment(db, cluster, "low", cpu=6, priority=0)
+    scheduler.enqueue(low)
+    await scheduler.schedule(db, cluster.id)
+
+    high = await make_deployment(db, cluster, "high", cpu=4, priority=5)
+    scheduler.enqueue(high)
+    changed = await scheduler.schedule(db, cluster.id)
+    await db.refresh(cluster)
+
+    statuses = {d.name: d.status for d in changed}
+    assert statuses == {
+        "low": DeploymentStatus.PENDING,
+        "high": DeploymentStatus.RUNNING,
+    }
+    assert cluster.cpu_available == 4
+    assert scheduler.queue_depth(cluster.id) == 1
+
+
+@pytest.mark.asyncio
+async def test_preemption_skips_a_head_no_longer_pending(db, cluster):
+    scheduler = DeploymentScheduler(preemption=True)
+    low = await make_deployment(db, cluster, "low", cpu=6, priority=0)
+    scheduler.enqueue(low)
+    await scheduler.schedule(db, cluster.id)
+
+    high = await make_deployment(db, cluster, "high", cpu=4, priority=5)
+    scheduler.enqueue(high)
+    # Another worker fails it while it is still in this worker's queue
+    await crud.transition_deployments(
+        db, [high.id], DeploymentStatus.PENDING, DeploymentStatus.FAILED
+    )
+    await db.commit()
+
+    assert await scheduler.schedule(db, cluster.id) == []
+    await db.refresh(low)
+    await db.refresh(cluster)
+    assert low.status == DeploymentStatus.RUNNING
+    assert cluster.cpu_available == 2
+    assert scheduler.queue_depth(cluster.id) == 0
+
+
+@pytest.mark.asyncio
+async def test_preemption_spares_equal_priority(db, cluster):
+    scheduler = DeploymentScheduler(preemption=True)
+    running = await make_deployment(db, cluster, "running", cpu=6, priority=5)
+    scheduler.enqueue(running)
+    await scheduler.schedule(db, cluster.id)
+
+    waiting = await make_deployment(db, cluster, "waiting", cpu=4, priority=5)
+    scheduler.enqueue(waiting)
+
+    assert await scheduler.schedule(db, cluster.id) == []
+
+
+class Reservation:
+    def __init__(self, started_at, required_time, cpu):
+        self.started_at = started_at
+        self.required_time = required_time
+        self.cpu_required = cpu
+        self.ram_required = 0
+        self.gpu_required = 0
+
+
+def test_projected_start_is_when_enough_running_work_ends():
+    now = datetime.now()
+    running = [
+        Reservation(now, 600, cpu=2),
+        Reservation(now - timedelta(hours=1), 60, cpu=1),  # overdue
+        Reservation(now, 300, cpu=2),
+    ]
+
+    assert projected_start((1, 0, 0), (1, 0, 0), running, now) == now
+    assert projected_start((1, 0, 0), (2, 0, 0), running, now) == now
+    assert projected_start((1, 0, 0), (4, 0, 0), running, now) == now + timedelta(
+        seconds=300
+    )
+    assert projected_start((1, 0, 0), (7, 0, 0), running, now) is None
+
+
+@pytest.mark.asyncio
+async def test_backfill_starts_only_work_that_ends_before_the_head(db, cluster):
+    scheduler = DeploymentScheduler(backfill=True)
+    running = await make_deployment(db, cluster, "running", cpu=6, required_time=600)
+    scheduler.enqueue(running)
+    await scheduler.schedule(db, cluster.id)
+
+    for name, cpu, priority, required_time in (
+        ("head", 4, 5, 60),
+        ("long", 2, 1, 3600),
+        ("short", 2, 0, 60),
+    ):
+        deployment = await make_deployment(
+            db, cluster, name, cpu, priority=priority, required_time=required_time
+        )
+        scheduler.enqueue(deployment)
+    changed = await scheduler.schedule(db, cluster.id)
+    await db.refresh(cluster)
+
+    assert {d.name: d.status for d in changed} == {"short": DeploymentStatus.RUNNING}
+    assert cluster.cpu_available == 0
+    assert scheduler.queue_depth(cluster.id) == 2
+
+
+def test_decayed_usage_halves_every_half_life():
+    usage = DecayedUsage(half_life=100)
+    usage.charge(1, 80, now=0)
+
+    assert usage.get(1, now=100) == pytest.approx(40)
+    usage.charge(1, 40, now=200)
+    assert usage.get(1, now=200) == pytest.approx(60)
+    usage.charge(1, -1000, now=200)
+    assert usage.get(1, now=200) == 0
+    assert usage.get(2, now=200) == 0
+
+
+def test_fair_share_bonus_shrinks_with_usage_relative_to_weight():
+    fair_share = FairShare(
+        half_life=3600, priority_weight=10, usage_scale=100, gpu_cost=8, weights={2: 2}
+    )
+    for user_id in (1, 2):
+        fair_share.usage.charge(user_id, 100)
+
+    assert fair_share.bonus(1) == pytest.approx(5, rel=1e-3)
+    assert fair_share.bonus(2) == pytest.approx(10 * 2**-0.5, rel=1e-3)
+    assert fair_share.bonus(3) == 10
+
+
+@pytest.mark.asyncio
+async def test_fair_share_interleaves_submitters(db, cluster):
+    fair_share = FairShare(
+        half_life=3600, priority_weight=10, usage_scale=120, gpu_cost=8, weights={}
+    )
+    scheduler = DeploymentScheduler(fair_share=fair_share)
+    now = datetime.now()
+    # User 1 floods the queue before user 2 submits anything.
+    for i, user_id in enumerate([1, 1, 1, 1, 2, 2]):
+        deployment = await make_deployment(
+            db,
+            cluster,
+            f"u{user_id}-{i}",
+            cpu=2,
+            created_at=now + timedelta(seconds=i),
+            user_id=user_id,
+        )
+        scheduler.enqueue(deployment)
+
+    started = await scheduler.schedule(db, cluster.id)
+
+    assert sorted(d.user_id for d in started) == [1, 1, 2, 2]
+    assert scheduler.queue_depth(cluster.id) == 2
+
+
+@pytest.mark.asyncio
+async def test_preemption_respects_fair_share_rank(db, cluster):
+    fair_share = FairShare(
+        half_life=3600, priority_weight=10, usage_scale=1000, gpu_cost=8, weights={}
+    )
+    fair_share.usage.charge(1, 1e6)  # User 1 is a heavy submitter
+    scheduler = DeploymentScheduler(preemption=True, fair_share=fair_share)
+    light = await make_deployment(db, cluster, "light", cpu=8, priority=0, user_id=2)
+    scheduler.enqueue(light)
+    await scheduler.schedule(db, cluster.id)
+
+    # Higher priority, but lower effective rank than the light user's job
+    # would have back in the queue: evicting it would restart it at once.
+    heavy = await make_deployment(db, cluster, "heavy", cpu=8, priority=1, user_id=1)
+    scheduler.enqueue(heavy)
+    assert await scheduler.schedule(db, cluster.id) == []
+    assert light.status == DeploymentStatus.RUNNING
+
+    urgent = await make_deployment(db, cluster, "urgent", cpu=8, priority=20, user_id=1)
+    scheduler.enqueue(urgent)
+    changed = await scheduler.schedule(db, cluster.id)
+
+    assert {d.name: d.status for d in changed} == {
+        "light": DeploymentStatus.PENDING,
+        "urgent": DeploymentStatus.RUNNING,
+    }
+    assert scheduler.queue_depth(cluster.id) == 2
+
+
+@pytest.mark.asyncio
+async def test_refresh_queues_pending_rows_from_other_workers(db, cluster):
+    scheduler = DeploymentScheduler()
+    local = await make_deployment(db, cluster, "local", cpu=2)
+    scheduler.enqueue(local)
+    await make_deployment(db, cluster, "elsewhere", cpu=2)  # Never enqueued here
+
+    await scheduler.refresh(db, [cluster.id])
+    await scheduler.refresh(db, [cluster.id])
+    assert scheduler.queue_depth(cluster.id) == 2
+
+    started = await scheduler.schedule(db, cluster.id)
+    assert sorted(d.name for d in started) == ["elsewhere", "local"]
@@ -0,0 +1,35 @@
+import pytest
+from pydantic import ValidationError
+from app.schemas.deployment import DeploymentCreate
+
+DEPLOYMENT = {
+    "name": "d",
+    "docker_image": "image:latest",
+    "cpu_required": 1,
+    "ram_required": 1,
+    "gpu_required": 0,
+    "required_time": 60,
+}
+
+
+@pytest.mark.parametrize(
+    "field, value",
+    [
+        ("cpu_required", -1),
+        ("ram_required", -0.5),
+        ("gpu_required", -2),
+        ("required_time", 0),
+        ("required_time", -60),
+    ],
+)
+def test_deployment_create_rejects_negative_resources_and_time(field, value):
+    with pytest.raises(ValidationError) as error:
+        DeploymentCreate(**{**DEPLOYMENT, field: value})
+
+    assert [e["loc"] for e in error.value.errors()] == [(field,)]
+
+
+def test_deployment_create_accepts_zero_resources():
+    deployment = DeploymentCreate(**{**DEPLOYMENT, "cpu_required": 0})
+
+    assert deployment.cpu_required == 0
@@ -0,0 +1,29 @@
+import pytest
+from app.core.security import PasswordHasher, PasswordHasherBusy
+
+
+@pytest.fixture
+def hasher():
+    hasher = PasswordHasher(workers=1, max_pending=4)
+    yield hasher
+    hasher.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_hash_and_verify_in_process_pool(hasher):
+    hashed = await hasher.hash("password123")
+
+    assert await hasher.verify("password123", hashed)
+    assert not await hasher.verify("wrongpassword", hashed)
+    assert hasher.stats()["completed"] == 3
+    assert hasher.stats()["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_rejects_when_too_many_operations_pending():
+    hasher = PasswordHasher(workers=1, max_pending=0)
+
+    with pytest.raises(PasswordHasherBusy):
+        await hasher.hash("password123")
+
+    assert hasher.stats()["rejected"] == 1
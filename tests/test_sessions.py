@@ -0,0 +1,77 @@
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from app.core.sessions import (
+    MemorySessionBackend,
+    ServerSessionMiddleware,
+    SessionBackend,
+)
+
+
+def make_client(backend):
+    app = FastAPI()
+    app.add_middleware(
+        ServerSessionMiddleware, backend=backend, max_age=60, cache_ttl=0
+    )
+
+    @app.post("/login")
+    async def login(request: Request):
+        request.session["user_id"] = 1
+        return {}
+
+    @app.get("/me")
+    async def me(request: Request):
+        return {"user_id": request.session.get("user_id")}
+
+    @app.post("/logout")
+    async def logout(request: Request):
+        request.session.clear()
+        return {}
+
+    return TestClient(app)
+
+
+def test_cookie_holds_only_an_opaque_id():
+    backend = MemorySessionBackend()
+    client = make_client(backend)
+
+    client.post("/login")
+    session_id = client.cookies["session"]
+
+    assert "user_id" not in session_id
+    assert backend._sessions[session_id][1] == {"user_id": 1}
+    assert client.get("/me").json() == {"user_id": 1}
+
+
+def test_logout_revokes_session_in_backend():
+    backend = MemorySessionBackend()
+    client = make_client(backend)
+    client.post("/login")
+    session_id = client.cookies["session"]
+
+    client.post("/logout")
+
+    assert session_id not in backend._sessions
+    other = make_client(backend)
+    other.cookies.set("session", session_id)
+    assert other.get("/me").json() == {"user_id": None}
+
+
+def test_unknown_session_id_is_not_adopted():
+    backend = MemorySessionBackend()
+    client = make_client(backend)
+    client.cookies.set("session", "chosen-by-client")
+
+    response = client.post("/login")
+
+    assert "chosen-by-client" not in backend._sessions
+    assert "chosen-by-client" not in response.headers["set-cookie"]
+
+
+def test_backend_must_implement_every_operation():
+    class LoadOnly(SessionBackend):
+        async def load(self, session_id, max_age):
+            return None
+
+    with pytest.raises(TypeError):
+        LoadOnly()
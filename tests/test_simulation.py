@@ -0,0 +1,107 @@
+import math
+import pytest
+import pytest_asyncio
+from datetime import datetime, timedelta
+from app.models.cluster import Cluster
+from app.models.deployment import Deployment, DeploymentStatus
+from app.schemas.deployment import DeploymentCreate
+from app import crud
+from app.core.placement import CapacityIndex
+from app.core.simulation import simulate
+
+
+@pytest_asyncio.fixture
+async def cluster(db):
+    # 8 CPUs, 4 of them held by a deployment that ends in 100 seconds
+    cluster = Cluster(
+        name="Test Cluster",
+        organization_id=1,
+        cpu_limit=8,
+        ram_limit=16,
+        gpu_limit=0,
+        cpu_available=4,
+        ram_available=16,
+        gpu_available=0,
+    )
+    db.add(cluster)
+    await db.commit()
+    return cluster
+
+
+async def add_deployment(db, cluster, status, cpu, required_time, **values):
+    deployment = Deployment(
+        name="d",
+        docker_image="img",
+        cluster_id=cluster.id,
+        organization_id=cluster.organization_id,
+        status=status,
+        cpu_required=cpu,
+        ram_required=0,
+        gpu_required=0,
+        required_time=required_time,
+        **values,
+    )
+    db.add(deployment)
+    await db.commit()
+    return deployment
+
+
+def proposed(cpu, required_time, priority=0, cluster_id=None):
+    return DeploymentCreate(
+        name="p",
+        docker_image="img",
+        cpu_required=cpu,
+        ram_required=0,
+        gpu_required=0,
+        priority=priority,
+        required_time=required_time,
+        cluster_id=cluster_id,
+    )
+
+
+async def run(db, deployments, now, points=5):
+    index = CapacityIndex.from_rows(await crud.get_cluster_capacities(db, 1))
+    workload = await crud.get_organization_workload(db, 1)
+    return simulate(index, workload, deployments, now, points)
+
+
+@pytest.mark.asyncio
+async def test_simulate_queues_behind_running_and_pending_work(db, cluster):
+    now = datetime.now()
+    await add_deployment(db, cluster, DeploymentStatus.RUNNING, 4, 100, started_at=now)
+    await add_deployment(
+        db,
+        cluster,
+        DeploymentStatus.PENDING,
+        8,
+        50,
+        created_at=now - timedelta(seconds=10),
+    )
+
+    projection = await run(
+        db,
+        [
+            proposed(4, 10),  # Waits for the PENDING deployment to end
+            proposed(2, 10, priority=1),  # Ahead of the PENDING one, fits now
+            proposed(16, 10),  # Larger than any cluster
+        ],
+        now,
+    )
+
+    assert projection.cluster_ids.tolist() == [cluster.id, cluster.id, -1]
+    assert projection.starts[:2].tolist() == [150, 0]
+    assert projection.ends[:2].tolist() == [160, 10]
+    assert math.isnan(projection.starts[2])
+
+
+@pytest.mark.asyncio
+async def test_simulate_samples_resources_in_use(db, cluster):
+    now = datetime.now()
+    await add_deployment(db, cluster, DeploymentStatus.RUNNING, 4, 100, started_at=now)
+
+    projection = await run(db, [proposed(8, 100)], now, points=5)
+
+    assert projection.starts.tolist() == [100]
+    assert projection.times.tolist() == [0, 50, 100, 150, 200]
+    assert projection.used[:, 0].tolist() == [4, 4, 8, 8, 0]
+    assert projection.limits.tolist() == [8, 16, 0]
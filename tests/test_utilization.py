@@ -0,0 +1,143 @@
+import numpy as np
+from app.core.config import settings
+from app.core.utilization import UtilizationStore, utilization_history
+
+T0 = 1_700_002_800  # A multiple of 3600
+
+
+def capacity(cluster_id, cpu_available, cpu_limit=8):
+    return (cluster_id, cpu_limit, 16, 0, cpu_available, 16, 0)
+
+
+def test_series_averages_raw_samples_into_windows():
+    store = UtilizationStore(interval=1, slots=(600, 60, 24))
+    for i in range(120):
+        store.record(T0 + i, [capacity(1, 8 - i % 2 * 4)])  # 0 or 4 CPUs used
+
+    step, times, means = store.series(1, T0, T0 + 120, step=60)
+
+    assert step == 60
+    assert times.tolist() == [T0, T0 + 60]
+    assert means[:, 0].tolist() == [2, 2]  # cpu_used
+    assert means[:, 3].tolist() == [6, 6]  # cpu_available
+    assert store.series(2, T0, T0 + 120, step=60)[1].size == 0
+
+
+def test_old_history_is_read_from_downsampled_rings():
+    store = UtilizationStore(interval=1, slots=(60, 120, 24))
+    for i in range(3 * 3600 + 61):
+        rows = [capacity(1, 8 - i // 3600 * 2)]  # 0, 2, then 4 CPUs used
+        if i >= 3600:
+            rows.append(capacity(2, 0))
+        store.record(T0 + i, rows)
+
+    # Older than the raw ring; the minute ring still holds it
+    step, times, means = store.series(1, T0 + 2 * 3600, T0 + 3 * 3600, step=1)
+    assert step == 60
+    assert len(times) == 60
+    assert np.all(means[:, 0] == 4)
+
+    # Older than the minute ring too; an hour is averaged from its minutes
+    # once the first minute after it completes
+    step, times, means = store.series(1, T0, T0 + 3 * 3600, step=1)
+    assert step == 3600
+    assert times.tolist() == [T0, T0 + 3600, T0 + 7200]
+    assert means[:, 0].tolist() == [0, 2, 4]
+    assert store.series(2, T0, T0 + 3 * 3600, step=3600)[1].tolist() == [
+        T0 + 3600,
+        T0 + 7200,
+    ]
+
+
+def test_history_survives_a_restart(tmp_path):
+    path = str(tmp_path / "utilization")
+    store = UtilizationStore(interval=1, slots=(60, 60, 24))
+    assert store.open(path)
+    for i in range(30):
+        store.record(T0 + i, [capacity(7, i % 8)])
+    expected = store.series(7, T0, T0 + 30, step=1)
+    store.close()
+
+    restored = UtilizationStore(interval=1, slots=(60, 60, 24))
+    assert restored.open(path)
+    actual = restored.series(7, T0, T0 + 30, step=1)
+    assert actual[1].tolist() == expected[1].tolist()
+    assert np.array_equal(actual[2], expected[2])
+
+    # A sample for an interval already in the history is ignored
+    restored.record(T0 + 29, [capacity(7, 0)])
+    assert np.array_equal(restored.series(7, T0, T0 + 30, step=1)[2], expected[2])
+    restored.close()
+
+    # Reconfigured resolutions start empty; the others are kept
+    resized = UtilizationStore(interval=1, slots=(60, 30, 24))
+    assert resized.open(path)
+    assert len(resized.series(7, T0, T0 + 30, step=1)[1]) == 30
+    assert resized.resolutions[1].buckets.max() == -1
+
+
+def test_only_one_process_writes_the_shared_history(tmp_path):
+    path = str(tmp_path / "utilization")
+    writer = UtilizationStore(interval=1, slots=(60, 60, 24))
+    assert UtilizationStore.shared(path) is None
+    assert writer.open(path)
+
+    assert not UtilizationStore(interval=1, slots=(60, 60, 24)).open(path)
+
+
+def test_readers_follow_the_writer_as_clusters_join(tmp_path):
+    path = str(tmp_path / "utilization")
+    writer = UtilizationStore(interval=1, slots=(600, 60, 24))
+    assert writer.open(path)
+    writer.record(T0, [capacity(c, c % 8) for c in range(3)])
+    reader = UtilizationStore.shared(path)
+
+    # One more cluster with each sample, growing the files under the reader
+    for i in range(1, 301):
+        writer.record(T0 + i, [capacity(c, c % 8) for c in range(3 + i)])
+        if i % 50 == 0:
+            reader.refresh()
+            assert reader.cluster_ids == writer.cluster_ids
+
+    for cluster_id in (0, 150, 302):
+        expected = writer.series(cluster_id, T0, T0 + 301, step=1)
+        actual = reader.series(cluster_id, T0, T0 + 301, step=1)
+        assert actual[1].tolist() == expected[1].tolist()
+        assert np.array_equal(actual[2], expected[2])
+
+
+def test_many_clusters_joining_over_time():
+    store = UtilizationStore(interval=1, slots=(600, 60, 24))
+    store.record(T0, [capacity(c, c % 8) for c in range(300)])
+    # One more cluster with each sample
+    for i in range(1, 301):
+        store.record(T0 + i, [capacity(c, c % 8) for c in range(300 + i)])
+
+    assert len(store.cluster_ids) == 600
+    for resolution in store.resolutions:
+        assert resolution.clusters == 600
+        assert len(resolution.values) < 2 * 600  # Capacity doubles, no more
+    step, times, means = store.series(599, T0, T0 + 301, step=1)
+    assert times.tolist() == [T0 + 300]
+    assert means[:, 3].tolist() == [599 % 8]
+    assert store.series(5, T0, T0 + 301, step=1)[2][:, 0].tolist() == [3] * 301
+
+
+def test_workers_that_do_not_sample_serve_the_shared_history(tmp_path, monkeypatch):
+    path = str(tmp_path / "utilization")
+    monkeypatch.setattr(settings, "UTILIZATION_HISTORY_PATH", None)
+    assert utilization_history() is None
+
+    monkeypatch.setattr(settings, "UTILIZATION_HISTORY_PATH", path)
+    assert utilization_history() is None  # No sampler yet
+    writer = UtilizationStore(interval=1, slots=(60, 60, 24))
+    assert writer.open(path)
+    writer.record(T0, [capacity(1, 4)])
+    assert utilization_history().series(1, T0, T0 + 1, step=1)[2][0, 0] == 4
+
+    # The sampler restarts with another layout; readers map the new files
+    writer.close()
+    writer = UtilizationStore(interval=2, slots=(60, 60, 24))
+    assert writer.open(path)
+    writer.record(T0 + 2, [capacity(1, 6)])
+    assert utilization_history().series(1, T0, T0 + 4, step=2)[2][:, 0].tolist() == [2]